@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+"""
+Microbenchmark of the per-request overhead of the API
+
+Measures what a /send request costs besides the providers calls, which are
+replaced by a mail sender answering immediately:
+
+    * validation: the mail_model payload validation, by jsonschema as done by
+      flask-restplus, then by the compiled schema
+    * decode, encode: the request and response bodies, by the json module,
+      then by the fastest installed library (orjson or ujson, if any)
+    * request: a whole POST /send through the Flask test client, with the
+      flask-restplus defaults, then with the compiled schema and fast JSON
+
+Usage:
+    python3 benchmarks/bench_api.py [--number N]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import timeit
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT_DIR)
+os.environ.setdefault(
+    "CONFIG_FILE", os.path.join(ROOT_DIR, "config.yml.default")
+)
+
+import flask  # noqa: E402
+import flask_restplus  # noqa: E402
+from flask_restplus.representations import output_json  # noqa: E402
+
+from mail_sender_daemon import create_app  # noqa: E402
+from mail_sender_daemon.api import api, fast_json  # noqa: E402
+from mail_sender_daemon.api.attachments import SpoolingRequest  # noqa: E402
+from mail_sender_daemon.api.models import mail_model  # noqa: E402
+from mail_sender_daemon.api.schema import CompiledModel  # noqa: E402
+
+
+MAIL = {
+    "from": "Sender",
+    "to": ["dest{}@email.com".format(i) for i in range(5)],
+    "cc": ["cc@email.com"],
+    "reply_to": ["reply@email.com"],
+    "subject": "Subject",
+    "text": "Hello " * 100,
+    "html": "<p>Hello</p>" * 100,
+    "headers": {"X-Campaign": "benchmark", "X-Priority": "1"},
+}
+RESPONSE = {
+    "providers": [
+        {"provider": "amazon_ses", "status_code": 503,
+         "msg": "Service Unavailable", "attempt": 1},
+        {"provider": "mailgun", "status_code": 200, "msg": "OK",
+         "attempt": 1},
+    ],
+    "provider_used": "mailgun",
+}
+
+
+class _InstantMailSender():
+    def send_mail(self, mail_params):
+        return dict(RESPONSE), 200
+
+
+@contextlib.contextmanager
+def restplus_defaults():
+    """
+    Validate and encode as flask-restplus does by default
+    """
+    validate = CompiledModel.validate
+    json_module = SpoolingRequest.json_module
+    representation = api.representations["application/json"]
+    CompiledModel.validate = flask_restplus.Model.validate
+    SpoolingRequest.json_module = flask.json
+    api.representations["application/json"] = output_json
+    try:
+        yield
+    finally:
+        CompiledModel.validate = validate
+        SpoolingRequest.json_module = json_module
+        api.representations["application/json"] = representation
+
+
+def measure(fn, number):
+    return {
+        "us_per_call": min(timeit.repeat(fn, number=number, repeat=5))
+        / number * 1e6
+    }
+
+
+def run(number):
+    app = create_app(ASYNC_SEND=False, ASYNC_PROVIDERS=False)
+    app.extensions["mail_sender"] = _InstantMailSender()
+    client = app.test_client()
+    body = json.dumps(MAIL).encode()
+
+    def post_send():
+        resp = client.post(
+            "/send", data=body, content_type="application/json"
+        )
+        assert resp.status_code == 200, resp.status_code
+
+    report = {"json_library": fast_json.name}
+    report["validation"] = {
+        "jsonschema": measure(
+            lambda: flask_restplus.Model.validate(mail_model, MAIL), number
+        ),
+        "compiled": measure(lambda: mail_model.validate(MAIL), number),
+    }
+    report["decode"] = {
+        "json": measure(lambda: json.loads(body), number),
+        fast_json.name: measure(lambda: fast_json.loads(body), number),
+    }
+    report["encode"] = {
+        "json": measure(lambda: json.dumps(RESPONSE), number),
+        fast_json.name: measure(lambda: fast_json.dumps(RESPONSE), number),
+    }
+
+    with restplus_defaults():
+        restplus = measure(post_send, number // 10)
+    report["request"] = {
+        "restplus_defaults": restplus,
+        "compiled_fast_json": measure(post_send, number // 10),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=10000)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.number), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+
+"""
+End-to-end load benchmark of the daemon, against local fake providers
+
+Starts the fake AmazonSES and Mailgun servers of fake_providers.py, then the
+daemon in a separate process configured to use them (unless --url is given),
+and sends requests from --concurrency clients for --duration seconds per
+scenario:
+
+    * send: POST /send
+    * batch: POST /send/batch, with --batch-size mails per request
+    * validation: GET /validation/<address>
+
+Throughput and latency percentiles of each scenario are printed as JSON.
+With --baseline, results are compared with a previous report, and the
+command fails if a scenario got slower than --max-regression.
+
+Usage:
+    python3 benchmarks/bench_load.py [--scenario NAME ...] [--duration S]
+        [--concurrency N] [--output FILE] [--baseline FILE]
+"""
+
+import argparse
+import collections
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import requests
+import yaml
+
+from fake_providers import add_server_arguments, start_fake_providers
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SCENARIOS = ("send", "batch", "validation")
+
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def write_daemon_config(path, ses_url, mailgun_url, overrides=None):
+    with open(os.path.join(ROOT_DIR, "config.yml.default")) as f:
+        config = yaml.safe_load(f)
+    config.update({
+        "AMAZON_API_DOMAIN": ses_url,
+        "MAILGUN_API_BASE_URL": mailgun_url,
+        # measure the providers calls, not the validation cache
+        "AMAZON_VALIDATION_CACHE": None,
+    })
+    config.update(overrides or {})
+    with open(path, "w") as f:
+        yaml.safe_dump(config, f)
+
+
+def start_daemon(config_path, port):
+    """
+    Start the daemon in the Flask threaded server, and wait for it
+    """
+    env = dict(
+        os.environ, CONFIG_FILE=config_path, FLASK_APP="mail_sender_daemon",
+        PYTHONPATH=ROOT_DIR
+    )
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "flask", "run", "--with-threads",
+            "--host", "127.0.0.1", "--port", str(port),
+        ],
+        env=env, cwd=ROOT_DIR, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+    url = "http://127.0.0.1:{}".format(port)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("the daemon exited at startup")
+        try:
+            requests.get(url + "/admin/routing", timeout=1)
+            return process, url
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+
+    process.terminate()
+    raise RuntimeError("the daemon did not start")
+
+
+def build_request(scenario, url, batch_size, i):
+    """
+    :returns: (method, url, json body)
+    """
+    address = "user{}@email.com".format(i)
+    if scenario == "send":
+        return "POST", url + "/send", {
+            "to": [address, ], "subject": "Benchmark", "text": "Hello",
+        }
+    elif scenario == "batch":
+        return "POST", url + "/send/batch", {"messages": [
+            {"to": ["user{}-{}@email.com".format(i, j), ], "text": "Hello"}
+            for j in range(batch_size)
+        ]}
+    elif scenario == "validation":
+        return "GET", url + "/validation/" + address, None
+    raise ValueError("unknown scenario {}".format(scenario))
+
+
+def percentile(sorted_values, p):
+    """
+    Nearest-rank percentile
+    """
+    if not sorted_values:
+        return None
+    rank = max(int(round(p / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def run_scenario(scenario, url, duration, concurrency, batch_size=10,
+                 warmup=1):
+    """
+    Send requests from concurrency clients during duration seconds
+
+    Each client sends its next request as soon as it gets an answer.
+    """
+    latencies = []
+    status_codes = collections.Counter()
+    lock = threading.Lock()
+    counter = iter(range(sys.maxsize))
+
+    def client(stop_at, record):
+        session = requests.Session()
+        while time.monotonic() < stop_at:
+            method, request_url, body = build_request(
+                scenario, url, batch_size, next(counter)
+            )
+            start = time.monotonic()
+            try:
+                status = session.request(
+                    method, request_url, json=body, timeout=60
+                ).status_code
+            except requests.exceptions.RequestException:
+                status = "error"
+            latency = time.monotonic() - start
+            if record:
+                with lock:
+                    latencies.append(latency)
+                    status_codes[str(status)] += 1
+
+    for stop_after, record in ((warmup, False), (duration, True)):
+        stop_at = time.monotonic() + stop_after
+        start = time.monotonic()
+        threads = [
+            threading.Thread(target=client, args=(stop_at, record))
+            for _ in range(concurrency)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - start
+
+    latencies.sort()
+    errors = sum(
+        count for status, count in status_codes.items()
+        if status == "error" or int(status) >= 500
+    )
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "status_codes": dict(status_codes),
+        "requests_per_second": len(latencies) / elapsed,
+        "mails_per_second": (
+            len(latencies) * (batch_size if scenario == "batch" else 1) /
+            elapsed
+        ),
+        "latency": {
+            "mean": sum(latencies) / len(latencies) if latencies else None,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else None,
+        },
+    }
+
+
+def compare(report, baseline, max_regression):
+    """
+    :returns: list of regressions, as strings
+    """
+    regressions = []
+    for scenario, result in report["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(scenario)
+        if base is None:
+            continue
+        checks = (
+            ("requests_per_second", base["requests_per_second"],
+             result["requests_per_second"], False),
+            ("p99", base["latency"]["p99"], result["latency"]["p99"], True),
+        )
+        for name, before, after, lower_is_better in checks:
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if (change if lower_is_better else -change) > max_regression:
+                regressions.append("{} {}: {:.4g} -> {:.4g} ({:+.1%})".format(
+                    scenario, name, before, after, change
+                ))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--scenario", action="append", choices=SCENARIOS,
+        help="scenario to run, can be repeated. Default: all of them"
+    )
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=1)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument(
+        "--url", help=(
+            "benchmark an already running daemon instead of starting one. "
+            "Its providers are not changed."
+        )
+    )
+    parser.add_argument(
+        "--daemon-config", action="append", default=[], metavar="KEY=YAML",
+        help="override a setting of the started daemon, such as "
+             "ASYNC_PROVIDERS=true"
+    )
+    parser.add_argument("--output", help="also write the report in a file")
+    parser.add_argument("--baseline", help="report to compare with")
+    parser.add_argument(
+        "--max-regression", type=float, default=0.1,
+        help="tolerated throughput or p99 regression, as a ratio"
+    )
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    providers_settings = {
+        "latency": args.latency, "jitter": args.jitter,
+        "error_rate": args.error_rate, "max_rate": args.max_rate,
+    }
+    daemon = None
+    url = args.url
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if url is None:
+            ses, mailgun = start_fake_providers(**providers_settings)
+            config_path = os.path.join(tmpdir, "config.yml")
+            write_daemon_config(config_path, ses.url, mailgun.url, {
+                k: yaml.safe_load(v) for k, v in (
+                    o.split("=", 1) for o in args.daemon_config
+                )
+            })
+            daemon, url = start_daemon(config_path, get_free_port())
+
+        try:
+            report = {
+                "settings": {
+                    "duration": args.duration,
+                    "concurrency": args.concurrency,
+                    "batch_size": args.batch_size,
+                    "providers": providers_settings,
+                    "daemon_config": args.daemon_config,
+                },
+                "scenarios": {
+                    scenario: run_scenario(
+                        scenario, url, args.duration, args.concurrency,
+                        args.batch_size, args.warmup
+                    ) for scenario in (args.scenario or SCENARIOS)
+                },
+            }
+        finally:
+            if daemon is not None:
+                daemon.terminate()
+                daemon.wait()
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        for regression in regressions:
+            print("Regression: " + regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
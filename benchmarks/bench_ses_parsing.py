@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the AmazonSES GetIdentityVerificationAttributes response parsing
+
+Compares the incremental parser used by the provider with the previous
+BeautifulSoup "html.parser" implementation (if beautifulsoup4 is installed),
+on a response for 100 identities.
+
+Usage:
+    python3 benchmarks/bench_ses_parsing.py [--number N] [--identities N]
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT_DIR)
+os.environ.setdefault(
+    "CONFIG_FILE", os.path.join(ROOT_DIR, "config.yml.default")
+)
+
+from mail_sender_daemon.providers.ses_response import (  # noqa: E402
+    parse_verification_statuses
+)
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+
+
+def build_response(identities):
+    entries = "".join(
+        "<entry><key>user{}@email.com</key><value>"
+        "<VerificationStatus>Success</VerificationStatus>"
+        "</value></entry>".format(i) for i in range(identities)
+    )
+    return (
+        '<GetIdentityVerificationAttributesResponse '
+        'xmlns="http://ses.amazonaws.com/doc/2010-12-01/">'
+        '<GetIdentityVerificationAttributesResult><VerificationAttributes>'
+        '{}</VerificationAttributes></GetIdentityVerificationAttributesResult>'
+        '<ResponseMetadata><RequestId>1234</RequestId></ResponseMetadata>'
+        '</GetIdentityVerificationAttributesResponse>'.format(entries)
+    ).encode()
+
+
+def parse_with_bs4(content):
+    soup = BeautifulSoup(content, "html.parser")
+    return {
+        entry.key.text: entry.verificationstatus.text
+        for entry in soup.find_all("entry")
+    }
+
+
+def measure(fn, content, number):
+    tracemalloc.start()
+    fn(content)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    duration = min(timeit.repeat(lambda: fn(content), number=number, repeat=5))
+    return {"us_per_response": duration / number * 1e6, "peak_bytes": peak}
+
+
+def run(number, identities):
+    content = build_response(identities)
+    cases = {"incremental": parse_verification_statuses}
+    if BeautifulSoup is not None:
+        cases["bs4"] = parse_with_bs4
+
+    return {
+        name: measure(fn, content, number) for name, fn in cases.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=200)
+    parser.add_argument("--identities", type=int, default=100)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.number, args.identities), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+"""
+Microbenchmark of the AmazonSES request signing cost
+
+Compares the legacy AWS3 signature, SigV4 with its signing key derived on
+every request, and SigV4 with the cached signing key used by the provider.
+
+Usage:
+    python3 benchmarks/bench_signing.py [--number N]
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT_DIR)
+os.environ.setdefault(
+    "CONFIG_FILE", os.path.join(ROOT_DIR, "config.yml.default")
+)
+
+from mail_sender_daemon.providers import AmazonSES  # noqa: E402
+from mail_sender_daemon.providers.sigv4 import SigV4Signer  # noqa: E402
+
+
+ENDPOINT = "https://email.us-west-2.amazonaws.com"
+BODY = (
+    b"Action=SendEmail&Source=sender%40email.com&"
+    b"Destination.ToAddresses.member.1=dest%40email.com&"
+    b"Message.Subject.Data=Subject&Message.Body.Text.Data=Hello"
+)
+
+
+class _UncachedSigV4Signer(SigV4Signer):
+    def get_signing_key(self, date_stamp):
+        return self.derive_signing_key(date_stamp)
+
+
+def run(number):
+    aws3 = AmazonSES(ENDPOINT, False, "access_key", "secret_key")
+    sigv4 = SigV4Signer("access_key", "secret_key", ENDPOINT)
+    sigv4_uncached = _UncachedSigV4Signer("access_key", "secret_key", ENDPOINT)
+
+    cases = {
+        "aws3": aws3._build_request_headers,
+        "sigv4_uncached_key": lambda: sigv4_uncached.sign(BODY),
+        "sigv4": lambda: sigv4.sign(BODY),
+    }
+    return {
+        name: {
+            "us_per_request": min(timeit.repeat(fn, number=number, repeat=5))
+            / number * 1e6
+        } for name, fn in cases.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.number), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+"""
+Startup time benchmark of the daemon
+
+Each run starts a new interpreter which measures:
+
+    * import: importing mail_sender_daemon
+    * create_app: loading the configuration and the routes
+    * first_request: the first request, building the providers
+      (GET /admin/routing, through the Flask test client)
+    * total: the whole process, including the interpreter startup
+
+Median, minimum and maximum of every step over --runs runs are printed as
+JSON, in milliseconds. With --importtime, the slowest modules imported by
+create_app are listed too.
+
+Usage:
+    python3 benchmarks/bench_startup.py [--runs N] [--importtime N]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CONFIG_FILE = os.path.join(ROOT_DIR, "config.yml.default")
+STEPS = ("import", "create_app", "first_request", "total")
+
+CHILD_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import mail_sender_daemon
+imported = time.perf_counter()
+app = mail_sender_daemon.create_app({config_file!r})
+created = time.perf_counter()
+resp = app.test_client().get("/admin/routing")
+assert resp.status_code == 200, resp.status_code
+served = time.perf_counter()
+print(json.dumps({{
+    "import": imported - start,
+    "create_app": created - imported,
+    "first_request": served - created,
+}}))
+"""
+
+
+def run_once(config_file):
+    """
+    :returns: {step: seconds}
+    """
+    start = time.perf_counter()
+    output = subprocess.check_output(
+        [sys.executable, "-c", CHILD_SCRIPT.format(config_file=config_file)],
+        cwd=ROOT_DIR, env=dict(os.environ, PYTHONPATH=ROOT_DIR)
+    )
+    timings = json.loads(output.decode().splitlines()[-1])
+    timings["total"] = time.perf_counter() - start
+    return timings
+
+
+def get_slowest_imports(config_file, count):
+    """
+    :returns: [(module, cumulative milliseconds), ], slowest first
+    """
+    script = (
+        "import mail_sender_daemon; "
+        "mail_sender_daemon.create_app({!r})".format(config_file)
+    )
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        cwd=ROOT_DIR, env=dict(os.environ, PYTHONPATH=ROOT_DIR),
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True
+    )
+
+    imports = []
+    for line in process.stderr.decode().splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        # only top level imports, their cumulative time includes the others
+        if not module.startswith("  "):
+            imports.append((module.strip(), int(cumulative) / 1000))
+    imports.sort(key=lambda i: i[1], reverse=True)
+    return imports[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--config", default=CONFIG_FILE)
+    parser.add_argument(
+        "--importtime", type=int, default=0, metavar="N",
+        help="list the N slowest top level imports"
+    )
+    args = parser.parse_args()
+
+    runs = [run_once(args.config) for _ in range(args.runs)]
+    report = {"runs": args.runs, "steps_ms": {}}
+    for step in STEPS:
+        values = [r[step] * 1000 for r in runs]
+        report["steps_ms"][step] = {
+            "median": statistics.median(values),
+            "min": min(values),
+            "max": max(values),
+        }
+    if args.importtime:
+        report["slowest_imports_ms"] = get_slowest_imports(
+            args.config, args.importtime
+        )
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+"""
+Local stand-ins of the AmazonSES and Mailgun APIs, for load benchmarks
+
+Both servers answer like the real APIs, after a configurable latency, and can
+fail a ratio of the requests (5xx) or throttle them above a request rate
+(AmazonSES "Throttling" error, Mailgun 429).
+
+Usage:
+    python3 benchmarks/fake_providers.py [--ses-port PORT]
+        [--mailgun-port PORT] [--latency S] [--jitter S] [--error-rate R]
+        [--max-rate N]
+"""
+
+import argparse
+import http.server
+import json
+import random
+import socketserver
+import threading
+import time
+import urllib.parse
+import uuid
+
+
+SES_NAMESPACE = "http://ses.amazonaws.com/doc/2010-12-01/"
+
+
+class TokenBucket():
+    """
+    Allow rate requests per second, with bursts of up to rate requests
+    """
+    def __init__(self, rate):
+        self.rate = rate
+        self._tokens = rate
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.rate, self._tokens + (now - self._last) * self.rate
+            )
+            self._last = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                           http.server.HTTPServer):
+    daemon_threads = True
+    # do not refuse connections under load
+    request_queue_size = 1024
+
+
+class _BaseFakeHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle(urllib.parse.urlsplit(self.path).query)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("application/x-www-form-urlencoded"):
+            self._handle(body.decode())
+        else:
+            # multipart, parameters are not needed
+            self._handle("")
+
+    def _handle(self, query):
+        settings = self.server.settings
+        latency = settings["latency"] + random.uniform(
+            -settings["jitter"], settings["jitter"]
+        )
+        if latency > 0:
+            time.sleep(latency)
+
+        params = dict(urllib.parse.parse_qsl(query))
+        bucket = self.server.token_bucket
+        if bucket is not None and not bucket.acquire():
+            status, content_type, body = self.throttled_response(params)
+        elif random.random() < settings["error_rate"]:
+            status, content_type, body = self.error_response(params)
+        else:
+            status, content_type, body = self.ok_response(params)
+
+        body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def ok_response(self, params):
+        raise NotImplementedError
+
+    def throttled_response(self, params):
+        raise NotImplementedError
+
+    def error_response(self, params):
+        raise NotImplementedError
+
+
+class FakeSESHandler(_BaseFakeHandler):
+    """
+    Every address is considered as validated
+    """
+    def ok_response(self, params):
+        action = params.get("Action", "")
+        if action == "GetIdentityVerificationAttributes":
+            entries = "".join(
+                "<entry><key>{}</key><value><VerificationStatus>Success"
+                "</VerificationStatus></value></entry>".format(v)
+                for k, v in params.items()
+                if k.startswith("Identities.member.")
+            )
+            result = "<VerificationAttributes>{}</VerificationAttributes>" \
+                .format(entries)
+        elif action in ("SendEmail", "SendRawEmail"):
+            result = "<MessageId>{}</MessageId>".format(uuid.uuid4())
+        else:
+            result = ""
+
+        return 200, "text/xml", (
+            '<{action}Response xmlns="{ns}"><{action}Result>{result}'
+            '</{action}Result><ResponseMetadata><RequestId>{request_id}'
+            '</RequestId></ResponseMetadata></{action}Response>'
+        ).format(
+            action=action, ns=SES_NAMESPACE, result=result,
+            request_id=uuid.uuid4()
+        )
+
+    def _error(self, status, error_type, code, message):
+        return status, "text/xml", (
+            '<ErrorResponse xmlns="{ns}"><Error><Type>{type}</Type>'
+            '<Code>{code}</Code><Message>{message}</Message></Error>'
+            '<RequestId>{request_id}</RequestId></ErrorResponse>'
+        ).format(
+            ns=SES_NAMESPACE, type=error_type, code=code, message=message,
+            request_id=uuid.uuid4()
+        )
+
+    def throttled_response(self, params):
+        return self._error(
+            400, "Sender", "Throttling", "Maximum sending rate exceeded."
+        )
+
+    def error_response(self, params):
+        return self._error(
+            503, "Receiver", "ServiceUnavailable", "Service unavailable."
+        )
+
+
+class FakeMailgunHandler(_BaseFakeHandler):
+    def ok_response(self, params):
+        return 200, "application/json", json.dumps({
+            "id": "<{}@mailgun.local>".format(uuid.uuid4()),
+            "message": "Queued. Thank you.",
+        })
+
+    def throttled_response(self, params):
+        return 429, "application/json", json.dumps({
+            "message": "Too many requests"
+        })
+
+    def error_response(self, params):
+        return 500, "application/json", json.dumps({
+            "message": "Internal server error"
+        })
+
+
+def start_server(handler_class, host="127.0.0.1", port=0, latency=0,
+                 jitter=0, error_rate=0, max_rate=None):
+    """
+    Start a fake provider in a background thread
+
+    :param port: port to listen on, 0 to pick a free one
+    :param latency: average seconds before answering
+    :param jitter: maximum seconds randomly added to or removed from latency
+    :param error_rate: ratio of requests failing with a 5xx error
+    :param max_rate: requests per second above which requests are throttled,
+                     None to never throttle
+    :returns: the started server. Its URL is in server.url.
+    """
+    server = _ThreadingHTTPServer((host, port), handler_class)
+    server.settings = {
+        "latency": latency, "jitter": jitter, "error_rate": error_rate,
+    }
+    server.token_bucket = TokenBucket(max_rate) if max_rate else None
+    server.url = "http://{}:{}/".format(*server.server_address[:2])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_fake_providers(ses_port=0, mailgun_port=0, **kwargs):
+    """
+    :param kwargs: settings of both servers, as for start_server
+    :returns: (AmazonSES server, Mailgun server)
+    """
+    return (
+        start_server(FakeSESHandler, port=ses_port, **kwargs),
+        start_server(FakeMailgunHandler, port=mailgun_port, **kwargs),
+    )
+
+
+def add_server_arguments(parser):
+    parser.add_argument(
+        "--latency", type=float, default=0.05,
+        help="average latency of the providers, in seconds"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.01,
+        help="random variation of the latency, in seconds"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0,
+        help="ratio of requests failing with a 5xx error"
+    )
+    parser.add_argument(
+        "--max-rate", type=float, default=None,
+        help="requests per second above which providers throttle"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--ses-port", type=int, default=8001)
+    parser.add_argument("--mailgun-port", type=int, default=8002)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    ses, mailgun = start_fake_providers(
+        args.ses_port, args.mailgun_port, latency=args.latency,
+        jitter=args.jitter, error_rate=args.error_rate,
+        max_rate=args.max_rate
+    )
+    print(json.dumps({"amazon_ses": ses.url, "mailgun": mailgun.url}))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,57 @@
 
 import os
 import sys
-from flask import Flask
-from flask_restplus import Api
+import threading
+import types
 
 APP_NAME = "mail-sender-daemon"
 APP_VERSION = "0.0.1"
 
-app = Flask(APP_NAME)
-from mail_sender_daemon.config import build_app_config
-app.config.from_mapping(
-    **build_app_config(os.environ.get("CONFIG_FILE", None))
-)
+__all__ = ("APP_NAME", "APP_VERSION", "create_app")
 
-from mail_sender_daemon.api import api
+
+def create_app(config_file=None, **config):
+    """
+    Build the application
+
+    Only the configuration and the routes are loaded: the providers are built
+    on first use.
+
+    :param config_file: path of the configuration file. Default to the
+                        CONFIG_FILE environment variable, then to the
+                        configuration directories.
+    :param config: settings overriding the configuration file
+    """
+    from flask import Flask
+    from mail_sender_daemon.config import build_app_config, find_config_file
+    from mail_sender_daemon.api import init_app
+
+    config_file = config_file or os.environ.get("CONFIG_FILE", None)
+    app = Flask(APP_NAME)
+    app.config.from_mapping(**build_app_config(config_file))
+    app.config.update(config)
+    init_app(app, find_config_file(config_file), config)
+    return app
+
+
+_app = None
+_app_lock = threading.Lock()
+
+
+class _Module(types.ModuleType):
+    # a property of the module class, as a module __getattr__ (PEP 562)
+    # needs Python 3.7
+    @property
+    def app(self):
+        """
+        Build the default application on first access to ``app``, for WSGI
+        servers loading ``mail_sender_daemon:app``
+        """
+        global _app
+        with _app_lock:
+            if _app is None:
+                _app = create_app()
+        return _app
+
+
+sys.modules[__name__].__class__ = _Module
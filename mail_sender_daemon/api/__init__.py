@@ -1,16 +1,58 @@
-
 from flask_restplus import Api
 
-from mail_sender_daemon import app, APP_VERSION
+from mail_sender_daemon import APP_VERSION
+from mail_sender_daemon.config import ConfigReloader
 
-__all__ = ("api")
+__all__ = ("api", "init_app")
 
 
 api = Api(
-    app, version=APP_VERSION, title="Mail Sender",
+    version=APP_VERSION, title="Mail Sender",
     description=(
         "Send mail through Mailgun and AmazonSES with automatic failover"
     ), default="mail", default_label="Mail namespace"
 )
 
-from . import routes
+from . import fast_json, metrics, routes
+from .attachments import SpoolingRequest
+
+api.representations["application/json"] = fast_json.output_json
+from .sender import reload_mail_sender
+
+
+def init_app(app, config_file=None, config_overrides=None):
+    """
+    Register the API routes and hooks on an application
+
+    :param config_file: config file of the application, to reload it as set
+                        by CONFIG_RELOAD
+    :param config_overrides: settings overriding the config file, kept on
+                             reload
+    """
+    app.request_class = SpoolingRequest
+    api.init_app(app)
+    metrics.registry.configure(**(app.config.get("METRICS", None) or {}))
+    app.before_request(routes.start_metrics_flusher)
+    app.before_request(routes.start_async_workers)
+
+    if config_file is not None:
+        _init_config_reloader(app, config_file, config_overrides or {})
+        app.before_request(routes.start_config_watcher)
+
+
+def _init_config_reloader(app, config_file, config_overrides):
+    settings = app.config.get("CONFIG_RELOAD", None) or {}
+
+    def on_reload(config):
+        config.update(config_overrides)
+        reload_mail_sender(
+            app, config, settings.get("drain_timeout", 30)
+        )
+
+    reloader = ConfigReloader(
+        config_file, on_reload, settings.get("watch_interval", 0)
+    )
+    if settings.get("signal", False):
+        reloader.install_signal_handler()
+    app.extensions["config_reloader"] = reloader
+    return reloader
@@ -0,0 +1,32 @@
+import io
+import tempfile
+from flask import current_app, Request
+
+from . import fast_json
+
+__all__ = ("SpoolingRequest", )
+
+
+class SpoolingRequest(Request):
+    """
+    Request spooling the uploaded files, as set by the ATTACHMENTS config
+
+    Files of small requests are kept in memory, the others are written by
+    chunks in temporary files while being received: an upload is never
+    loaded in memory at once. The temporary files are deleted when the
+    request is closed.
+
+    JSON bodies are decoded by fast_json.
+    """
+    json_module = fast_json
+
+    def _get_file_stream(self, total_content_length, content_type,
+                         filename=None, content_length=None):
+        settings = current_app.config.get("ATTACHMENTS", None) or {}
+        memory_size = settings.get("spool_memory_size", 512 * 1024)
+        if total_content_length is not None and (
+                total_content_length <= memory_size):
+            return io.BytesIO()
+        return tempfile.TemporaryFile(
+            "wb+", dir=settings.get("spool_dir", None)
+        )
@@ -0,0 +1,88 @@
+"""
+JSON decoding of the requests and encoding of the responses
+
+orjson, or else ujson, is used when installed (extra "fast-json"), as they
+are several times faster than the json module. Documents they do not handle
+(such as integers over 64 bits) are processed by the json module, so the
+same requests are accepted whatever the library.
+"""
+
+import json
+from flask import current_app, make_response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+__all__ = ("name", "loads", "dumps", "output_json")
+
+
+if orjson is not None:
+    name = "orjson"
+
+    def _loads(s):
+        return orjson.loads(s)
+
+    def _dumps(obj):
+        return orjson.dumps(obj).decode()
+elif ujson is not None:
+    name = "ujson"
+
+    def _loads(s):
+        return ujson.loads(s)
+
+    def _dumps(obj):
+        return ujson.dumps(
+            obj, ensure_ascii=False, escape_forward_slashes=False
+        )
+else:
+    name = "json"
+    _loads = _dumps = None
+
+
+def loads(s, **kwargs):
+    """
+    :param s: JSON document, as str or bytes
+    :param kwargs: json.loads parameters. The json module is used if set.
+    :raises ValueError: if s is not valid JSON
+    """
+    if _loads is not None and not kwargs:
+        try:
+            return _loads(s)
+        except ValueError:
+            # invalid, or unsupported by the library
+            pass
+    return json.loads(s, **kwargs)
+
+
+def dumps(obj, **kwargs):
+    """
+    :param kwargs: json.dumps parameters. The json module is used if set.
+    :returns: JSON document, as str
+    """
+    if _dumps is not None and not kwargs:
+        try:
+            return _dumps(obj)
+        except (TypeError, ValueError, OverflowError):
+            pass
+    return json.dumps(obj, **kwargs)
+
+
+def output_json(data, code, headers=None):
+    """
+    JSON representation of the API responses, as the flask-restplus one
+
+    Honors the RESTPLUS_JSON settings, which are json.dumps parameters.
+    """
+    settings = current_app.config.get("RESTPLUS_JSON", {})
+    if current_app.debug and "indent" not in settings:
+        settings = dict(settings, indent=4)
+
+    resp = make_response(dumps(data, **settings) + "\n", code)
+    resp.headers.extend(headers or {})
+    return resp
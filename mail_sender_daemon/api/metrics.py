@@ -0,0 +1,53 @@
+from mail_sender_daemon.metrics import MetricsRegistry
+
+
+#: configured by init_app, from the METRICS config
+registry = MetricsRegistry()
+
+provider_send_duration = registry.histogram(
+    "mail_sender_provider_send_duration_seconds",
+    "Duration of the sending requests to a provider", ("provider", )
+)
+provider_responses = registry.counter(
+    "mail_sender_provider_responses_total",
+    "Sending requests to a provider, by returned status code",
+    ("provider", "status_code")
+)
+provider_skips = registry.counter(
+    "mail_sender_provider_skips_total",
+    "Providers skipped when sending a mail", ("provider", "reason")
+)
+provider_in_flight = registry.gauge(
+    "mail_sender_provider_in_flight",
+    "Requests to a provider waiting for an answer", ("provider", )
+)
+provider_retries = registry.counter(
+    "mail_sender_provider_retries_total",
+    "Sending requests retried on the same provider", ("provider", )
+)
+retry_budget_exhausted = registry.counter(
+    "mail_sender_retry_budget_exhausted_total",
+    "Retries not done, as the retry budget was exhausted"
+)
+failover_depth = registry.counter(
+    "mail_sender_failover_depth_total",
+    "Sent mails, by position of the provider which sent them in the "
+    "failover chain", ("depth", )
+)
+idempotent_replays = registry.counter(
+    "mail_sender_idempotent_replays_total",
+    "Requests answered with the result of a previous request with the same "
+    "Idempotency-Key"
+)
+suppressed_recipients = registry.counter(
+    "mail_sender_suppressed_recipients_total",
+    "Recipients removed from mails as they are in the suppression list"
+)
+failed_mails = registry.counter(
+    "mail_sender_failed_mails_total", "Mails no provider could send"
+)
+validation_duration = registry.histogram(
+    "mail_sender_validation_duration_seconds",
+    "Duration of the validation requests to a provider",
+    ("provider", "method")
+)
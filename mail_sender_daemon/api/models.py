@@ -1,9 +1,67 @@
 
 from flask_restplus import fields
+from werkzeug.datastructures import FileStorage
 from . import api
+from .schema import CompiledModel
 
 
-mail_model = api.model("MailSender", {
+class HeadersField(fields.Raw):
+    """
+    Custom mail headers, as {name: value}
+
+    Names and values are checked as RFC 5322 headers fields, so they cannot
+    inject other headers, and cannot be one of the headers built from the
+    mail fields.
+    """
+    #: headers set from the mail fields, compared case-insensitively
+    RESERVED = (
+        "from", "to", "cc", "bcc", "reply-to", "subject", "date",
+        "mime-version", "content-type", "content-transfer-encoding",
+    )
+
+    def schema(self):
+        schema = super().schema()
+        name_pattern = "^(?!(?i:{})\\Z)[!-9;-~]+\\Z".format(
+            "|".join(self.RESERVED)
+        )
+        schema.update({
+            "patternProperties": {
+                # \Z, as $ also matches before a trailing newline
+                name_pattern: {
+                    "type": "string", "pattern": "^[^\\r\\n]*\\Z"
+                },
+            },
+            "additionalProperties": False,
+        })
+        return schema
+
+
+class ProviderTemplatesField(fields.Raw):
+    """
+    Templates stored by the providers, as {provider: template name}
+    """
+    def schema(self):
+        schema = super().schema()
+        schema.update({
+            "properties": {
+                provider: {"type": "string"}
+                for provider in ("amazon_ses", "mailgun")
+            },
+            "additionalProperties": False,
+        })
+        return schema
+
+
+def compiled_model(name, model_fields):
+    """
+    Register a model validating the request payloads with its compiled schema
+    """
+    return api.add_model(
+        name, CompiledModel(name, model_fields, models=api.models)
+    )
+
+
+mail_model = compiled_model("MailSender", {
     "from": fields.String(
         description=(
             "Sender name (address is automatically generated depending on the "
@@ -23,15 +81,126 @@ mail_model = api.model("MailSender", {
     "subject": fields.String(description="Mail subject"),
     "text": fields.String(description="Mail content, as text"),
     "html": fields.String(description="Mail content, as html"),
+    "recipient_variables": fields.Raw(
+        description=(
+            "Personalize the mail for each receiver: {address: {name: value}}."
+            " Each address of \"to\" receives its own mail, in which "
+            "%recipient.name% is replaced by its value. Only sent through "
+            "providers handling it (Mailgun)."
+        )
+    ),
+    "headers": HeadersField(
+        description=(
+            "Custom headers, as {name: value}. Sent through AmazonSES as a "
+            "raw MIME message."
+        )
+    ),
+    "template_id": fields.String(
+        description=(
+            "Registered template rendering the subject, text and html not "
+            "given by the mail"
+        )
+    ),
+    "variables": fields.Raw(
+        description="Variables of the template, as {name: value}"
+    ),
+})
+
+batch_mail_model = compiled_model("MailSenderBatch", {
+    "messages": fields.List(
+        fields.Nested(mail_model), required=True, description="Mails to send"
+    ),
+})
+
+send_multipart_parser = api.parser()
+send_multipart_parser.add_argument(
+    "message", location="form", required=True,
+    help="Mail, as JSON described by the MailSender model"
+)
+send_multipart_parser.add_argument(
+    "attachment", type=FileStorage, location="files", action="append",
+    help="Attached file, can be repeated"
+)
+send_multipart_parser.add_argument(
+    "inline", type=FileStorage, location="files", action="append",
+    help="Inline file (such as an image of the html content), can be repeated"
+)
+
+template_fields = {
+    "subject": fields.String(description="Subject, as a Jinja2 template"),
+    "text": fields.String(description="Text content, as a Jinja2 template"),
+    "html": fields.String(
+        description=(
+            "Html content, as a Jinja2 template. Variables are escaped."
+        )
+    ),
+    "provider_templates": ProviderTemplatesField(
+        description=(
+            "Templates stored by the providers, as {provider: name}: these "
+            "providers get the template name and the variables instead of "
+            "the rendered mail"
+        )
+    ),
+}
+template_model = compiled_model("Template", template_fields)
+
+template_info_fields = {
+    "id": fields.String(description="Template id"),
+    "revision": fields.Integer(
+        description="Revision of the template, changed by every update"
+    ),
+    "updated": fields.Float(description="Last update, as a UNIX timestamp"),
+}
+template_info_model = api.model("TemplateInfo", template_info_fields)
+
+template_details_fields = template_info_fields.copy()
+template_details_fields.update(template_fields)
+template_details_model = api.model(
+    "TemplateDetails", template_details_fields
+)
+
+template_list_model = api.model("TemplateList", {
+    "templates": fields.List(fields.Nested(
+        template_info_model, description="Registered templates"
+    )),
+})
+
+suppression_model = compiled_model("Suppression", {
+    "reason": fields.String(
+        description="Why the address is suppressed (bounce, complaint...)"
+    ),
+})
+suppression_details_model = api.model("SuppressionDetails", {
+    "address": fields.String(description="Suppressed address, lowercased"),
+    "reason": fields.String(description="Why the address is suppressed"),
+    "created": fields.Float(description="Suppression, as a UNIX timestamp"),
+})
+suppression_import_model = api.model("SuppressionImport", {
+    "imported": fields.Integer(description="Addresses added or updated"),
+    "invalid": fields.Integer(description="Ignored lines, not addresses"),
+})
+
+bulk_validation_model = compiled_model("BulkValidation", {
+    "addresses": fields.List(
+        fields.String(), required=True,
+        description="Addresses to check. Duplicates are ignored."
+    ),
 })
 
 status_by_provider_fields = {
+    "suppressed": fields.List(
+        fields.String(),
+        description="Recipients removed as they are in the suppression list"
+    ),
     "providers": fields.List(fields.Nested(
         description="Attempted providers",
         model=api.model("StatusByProvider", {
             "provider": fields.String(description="Provider name"),
             "status_code": fields.Integer(description="Request status code"),
             "msg": fields.String(description="Request reason message"),
+            "attempt": fields.Integer(
+                description="Attempt number on this provider, from 1"
+            ),
         }),
     )),
 }
@@ -41,6 +210,16 @@ send_ok_fields.update({
     "provider_used": fields.String(description="Provider name"),
 })
 
+# asynchronous sending: a job is returned instead of the sending details
+job_fields = status_by_provider_fields.copy()
+job_fields.update({
+    "id": fields.String(description="Job id"),
+    "status": fields.String(
+        description="Job status", enum=["queued", "sending", "sent", "failed"]
+    ),
+    "provider_used": fields.String(description="Provider name"),
+})
+
 validation_status_by_provider_fields = {
     "address": fields.String(description="Email address"),
     "providers": fields.List(fields.Nested(
@@ -68,7 +247,122 @@ send_error_model = api.model(
     "MailSenderErrorResponse", status_by_provider_fields,
 )
 
+job_model = api.model("Job", job_fields)
+
+# result of each mail of a batch: sending details in synchronous mode, or a
+# job in asynchronous mode
+batch_result_fields = job_fields.copy()
+batch_result_fields.update({
+    "status_code": fields.Integer(
+        description="Status code of the mail, as if sent alone"
+    ),
+})
+batch_result_model = api.model("MailSenderBatchResponse", {
+    "results": fields.List(fields.Nested(
+        description="Result of each mail, in the request order",
+        model=api.model("MailSenderBatchResult", batch_result_fields),
+    )),
+})
+
 validation_status_ok_model = api.model(
     "ValidationStatusResponse", validation_status_by_provider_fields,
 )
 validation_error_model = status_by_provider_model
+
+pool_stats_model = api.model("PoolStatsResponse", {
+    "pools": fields.List(fields.Nested(
+        description="Connection pool of each provider",
+        model=api.model("PoolStats", {
+            "provider": fields.String(description="Provider name"),
+            "pool_size": fields.Integer(
+                description="Maximum number of kept connections per host"
+            ),
+            "keep_alive": fields.Boolean(
+                description="Are connections reused"
+            ),
+            "requests": fields.Integer(description="Requests sent"),
+            "in_flight": fields.Integer(description="Requests in progress"),
+            "connections_opened": fields.Integer(
+                description="Connections opened since the start"
+            ),
+            "connections_reused": fields.Integer(
+                description="Requests sent on an already opened connection"
+            ),
+            "idle_resets": fields.Integer(
+                description="Times the connections were closed after idling"
+            ),
+            "latency_p50": fields.Float(
+                description="Median latency of the last requests, in seconds"
+            ),
+        }),
+    )),
+})
+
+cache_stats_model = api.model("CacheStatsResponse", {
+    "caches": fields.List(fields.Nested(
+        description="Validation status cache of each provider",
+        model=api.model("CacheStats", {
+            "provider": fields.String(description="Provider name"),
+            "size": fields.Integer(description="Number of cached addresses"),
+            "max_size": fields.Integer(
+                description="Maximum number of cached addresses"
+            ),
+            "hits": fields.Integer(description="Statuses read from cache"),
+            "misses": fields.Integer(
+                description="Statuses requested to the provider"
+            ),
+        }),
+    )),
+})
+
+circuit_breaker_stats_model = api.model("CircuitBreakerStatsResponse", {
+    "circuit_breakers": fields.List(fields.Nested(
+        description="Circuit breaker of each provider",
+        model=api.model("CircuitBreakerStats", {
+            "provider": fields.String(description="Provider name"),
+            "state": fields.String(
+                description="Circuit state",
+                enum=["closed", "open", "half-open"]
+            ),
+            "failures": fields.Integer(description="Consecutive failures"),
+            "retry_in": fields.Float(
+                description=(
+                    "Seconds before trying the provider again, if open"
+                )
+            ),
+        }),
+    )),
+})
+
+routing_stats_model = api.model("RoutingStatsResponse", {
+    "policy": fields.String(description="Routing policy"),
+    "providers": fields.List(fields.Nested(
+        description="Performance of each provider",
+        model=api.model("RoutingStats", {
+            "provider": fields.String(description="Provider name"),
+            "latency": fields.Float(
+                description="Average sending latency, in seconds"
+            ),
+            "success_rate": fields.Float(description="Average success rate"),
+            "samples": fields.Integer(description="Number of sendings"),
+        }),
+    )),
+})
+
+rate_limiter_stats_model = api.model("RateLimiterStatsResponse", {
+    "rate_limiters": fields.List(fields.Nested(
+        description="Rate limiter of each rate limited provider",
+        model=api.model("RateLimiterStats", {
+            "provider": fields.String(description="Provider name"),
+            "rate": fields.Float(description="Mails per second"),
+            "burst": fields.Float(description="Maximum mails sent at once"),
+            "tokens": fields.Float(description="Mails which can be sent now"),
+            "waits": fields.Integer(
+                description="Sendings which waited for the rate limit"
+            ),
+            "rejections": fields.Integer(
+                description="Sendings skipped as they would wait too long"
+            ),
+        }),
+    )),
+})
@@ -1,31 +1,353 @@
-
-from flask import request
+import asyncio
+import collections
+import concurrent.futures
+import csv
+import io
+import itertools
+import os
+import threading
+import time
+import appdirs
+from flask import current_app, request, Response
 from flask_restplus import Resource
 
-from mail_sender_daemon import app, APP_NAME
-from mail_sender_daemon.providers import Mailgun, AmazonSES
+from mail_sender_daemon import APP_NAME
 from mail_sender_daemon.exceptions import (
-    MailNotSentError, UnvalidatedAddrError
+    InvalidTemplateError, TemplateNotFoundError
 )
+from mail_sender_daemon.idempotency import IdempotencyStore
+from mail_sender_daemon.jobs import JobQueue, WorkerPool
+from mail_sender_daemon.templates import TemplateRenderer, TemplateStore
 
-from . import api
+from . import api, fast_json, metrics
 from .models import (
-    mail_model, send_ok_model, send_error_model, validation_status_ok_model,
-    validation_error_model
+    mail_model, send_ok_model, send_error_model, job_model,
+    batch_mail_model, batch_result_model, bulk_validation_model,
+    validation_status_ok_model, validation_error_model, pool_stats_model,
+    cache_stats_model, circuit_breaker_stats_model, routing_stats_model,
+    rate_limiter_stats_model, send_multipart_parser, template_model,
+    template_details_model, template_info_model, template_list_model,
+    suppression_model, suppression_details_model, suppression_import_model
 )
+from .sender import event_loop, get_mail_sender
+
+
+_extensions_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Thread pool used to request the providers concurrently
+
+    Built on first use, and again in a forked process, as its threads do not
+    survive a fork.
+    """
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=current_app.config.get("PROVIDERS_WORKERS", 16)
+            )
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def _get_extension(name, factory):
+    """
+    Extension of the current application, built on first use
+
+    :param name: key of the extension in app.extensions
+    :param factory: function building the extension from the application
+    """
+    app = current_app._get_current_object()
+    with _extensions_lock:
+        if app.extensions.get(name, None) is None:
+            app.extensions[name] = factory(app)
+    return app.extensions[name]
+
+
+def get_worker_pool():
+    """
+    Build the asynchronous sending worker pool of the application on first
+    use
+    """
+    return _get_extension("worker_pool", _build_worker_pool)
+
+
+def _build_worker_pool(app):
+    queue_path = app.config.get("ASYNC_QUEUE_PATH") or os.path.join(
+        appdirs.user_data_dir(APP_NAME), "queue.sqlite"
+    )
+
+    def send_mail(mail_params):
+        # workers run outside of the application context
+        return get_mail_sender(app).send_mail(mail_params)
+
+    return WorkerPool(
+        JobQueue(
+            queue_path,
+            lease_timeout=app.config.get("ASYNC_JOB_LEASE_TIMEOUT", 300),
+            ttl=app.config.get("ASYNC_JOB_TTL", 86400)
+        ),
+        send_mail, workers=app.config.get("ASYNC_WORKERS", 4)
+    )
+
+
+def get_idempotency_store():
+    """
+    Build the idempotency keys store of the application on first use
+    """
+    return _get_extension("idempotency_store", _build_idempotency_store)
+
+
+def _build_idempotency_store(app):
+    settings = app.config.get("IDEMPOTENCY", None) or {}
+    return IdempotencyStore(
+        settings.get("path") or os.path.join(
+            appdirs.user_data_dir(APP_NAME), "idempotency.sqlite"
+        ),
+        ttl=settings.get("ttl", 86400),
+        max_keys=settings.get("max_keys", 100000),
+        lock_timeout=settings.get("lock_timeout", 300),
+    )
+
+
+def get_template_renderer():
+    """
+    Build the templates store and renderer of the application on first use
+    """
+    return _get_extension("template_renderer", _build_template_renderer)
+
+
+def _build_template_renderer(app):
+    settings = app.config.get("TEMPLATES", None) or {}
+    return TemplateRenderer(
+        TemplateStore(settings.get("path") or os.path.join(
+            appdirs.user_data_dir(APP_NAME), "templates.sqlite"
+        )),
+        cache_size=settings.get("cache_size", 256),
+        cache_ttl=settings.get("cache_ttl", 3600),
+    )
+
+
+def apply_template(mail_params):
+    """
+    Render the template of a mail, if it has one
+
+    Subject, text and html given by the mail are kept. Providers with their
+    own copy of the template get its name and the variables instead, through
+    the provider_templates and template_variables parameters.
+
+    :returns: mail parameters, without template_id and variables
+    """
+    if "template_id" not in mail_params and "variables" not in mail_params:
+        return mail_params
+
+    mail_params = dict(mail_params)
+    template_id = mail_params.pop("template_id", None)
+    variables = mail_params.pop("variables", None) or {}
+    if template_id is None:
+        return mail_params
+    try:
+        rendered, provider_templates = get_template_renderer().render(
+            template_id, variables
+        )
+    except TemplateNotFoundError as e:
+        api.abort(404, str(e))
+    except InvalidTemplateError as e:
+        api.abort(400, str(e))
+
+    for field, value in rendered.items():
+        mail_params.setdefault(field, value)
+    if provider_templates:
+        mail_params["provider_templates"] = provider_templates
+        mail_params["template_variables"] = variables
+    return mail_params
+
+
+def get_suppression_list():
+    suppression_list = get_mail_sender().suppression_list
+    if suppression_list is None:
+        api.abort(404, "the suppression list is disabled")
+    return suppression_list
+
+
+def send_once(send_fn, mail_params):
+    """
+    Send a mail once per Idempotency-Key header
+
+    Repeated requests with the same key get the stored result of the first
+    one, waiting for it if still being sent. Failures (5xx) are not stored,
+    so the mail is sent again on the next retry.
+
+    :param send_fn: function taking the mail parameters and returning
+                    (response, status)
+    :returns: (response, status[, headers])
+    """
+    key = request.headers.get("Idempotency-Key", None)
+    if not key:
+        return send_fn(mail_params)
+    if len(key) > 255:
+        api.abort(400, "Idempotency-Key cannot exceed 255 characters")
+
+    store = get_idempotency_store()
+    settings = current_app.config.get("IDEMPOTENCY", None) or {}
+    fingerprint = store.fingerprint(mail_params)
+    while True:
+        entry = store.reserve(key, fingerprint)
+        if entry is None:
+            break
+        if entry["fingerprint"] != fingerprint:
+            api.abort(422, "Idempotency-Key already used by another mail")
+        if entry["status"] is None:
+            entry = store.wait(key, settings.get("wait_timeout", 60))
+            if entry is None:
+                # released by a failure of the first request: send it again
+                continue
+            if entry["status"] is None:
+                api.abort(
+                    409, "a request with this Idempotency-Key is still "
+                    "being sent"
+                )
+        metrics.idempotent_replays.inc()
+        return (
+            entry["response"], entry["status"], {"Idempotent-Replayed": "true"}
+        )
+
+    try:
+        response, status = send_fn(mail_params)
+    except BaseException:
+        store.release(key)
+        raise
+    if status >= 500:
+        store.release(key)
+    else:
+        store.complete(key, response, status)
+    return response, status
 
 
-mail_providers = {
-    "amazon_ses": AmazonSES(
-        api_access_key=app.config["AMAZON_API_ACCESS_KEY"],
-        api_secret_key=app.config["AMAZON_API_SECRET_KEY"],
-        api_domain=app.config["AMAZON_API_DOMAIN"],
-    ),
-    "mailgun": Mailgun(
-        api_key=app.config["MAILGUN_API_KEY"],
-        api_base_url=app.config["MAILGUN_API_BASE_URL"],
-    ),
-}
+def call_providers(method, *args):
+    """
+    Call a method on every provider concurrently
+
+    Each provider has PROVIDERS_TIMEOUT seconds to answer, all counted from
+    the same start.
+
+    :returns: [(provider name, result), ], in the providers order, with None
+              as result for a provider that timed out. Providers not
+              implementing the method are skipped.
+    """
+    mail_sender = get_mail_sender()
+    timeout = current_app.config.get("PROVIDERS_TIMEOUT", 30)
+    if current_app.config.get("ASYNC_PROVIDERS", False):
+        return event_loop.run(
+            async_call_providers(mail_sender, timeout, method, *args)
+        )
+
+    executor = get_executor()
+    futures = [
+        (name, executor.submit(call_provider, name, provider, method, *args))
+        for name, provider in mail_sender.mail_providers.items()
+    ]
+    deadline = time.monotonic() + timeout
+
+    results = []
+    for name, future in futures:
+        try:
+            result = future.result(max(deadline - time.monotonic(), 0))
+        except concurrent.futures.TimeoutError:
+            current_app.logger.error("{}: {} timed out".format(name, method))
+            result = None
+        except NotImplementedError:
+            continue
+        results.append((name, result))
+
+    return results
+
+
+def call_provider(name, provider, method, *args):
+    """
+    Call a validation method of a provider, and measure its duration
+    """
+    start = time.monotonic()
+    result = getattr(provider, method)(*args)
+    metrics.validation_duration.observe(
+        time.monotonic() - start, provider=name, method=method
+    )
+    return result
+
+
+async def async_call_provider(name, provider, method, *args):
+    start = time.monotonic()
+    result = await getattr(provider, method)(*args)
+    metrics.validation_duration.observe(
+        time.monotonic() - start, provider=name, method=method
+    )
+    return result
+
+
+async def async_call_providers(mail_sender, timeout, method, *args):
+    """
+    Coroutine calling a method on every asynchronous provider concurrently
+
+    Same as call_providers, to run in the providers event loop.
+
+    :param mail_sender: MailSender holding the providers
+    :param timeout: seconds the providers have to answer
+    """
+    tasks = [
+        (name, asyncio.ensure_future(
+            async_call_provider(name, provider, method, *args)
+        ))
+        for name, provider in mail_sender.get_async_mail_providers().items()
+    ]
+    await asyncio.wait([task for _, task in tasks], timeout=timeout)
+
+    results = []
+    for name, task in tasks:
+        if not task.done():
+            task.cancel()
+            mail_sender.logger.error("{}: {} timed out".format(name, method))
+            result = None
+        elif isinstance(task.exception(), NotImplementedError):
+            continue
+        else:
+            result = task.result()
+        results.append((name, result))
+
+    return results
+
+
+async def async_send_mails(mail_sender, messages, parallelism):
+    """
+    Coroutine sending many mails, at most parallelism at the same time
+
+    :returns: [(sending_details, status), ], in the messages order
+    """
+    semaphore = asyncio.Semaphore(parallelism)
+
+    async def send(mail_params):
+        async with semaphore:
+            return await mail_sender.async_send_mail(mail_params)
+
+    return await asyncio.gather(*(send(m) for m in messages))
+
+
+def start_metrics_flusher():
+    metrics.registry.ensure_started()
+
+
+def start_config_watcher():
+    current_app.extensions["config_reloader"].ensure_watching()
+
+
+def start_async_workers():
+    # started per process, to drain jobs left by other or crashed processes
+    if current_app.config.get("ASYNC_SEND", False):
+        get_worker_pool().ensure_started()
 
 
 @api.route("/validation/<string:address>")
@@ -35,16 +357,12 @@ class Validation(Resource):
     @api.response(400, "Validation error")
     def get(self, address):
         statuses = {"address": address, "providers": []}
-        for name, provider in mail_providers.items():
-            try:
-                statuses["providers"].append({
-                    "provider": name,
-                    "validation": (
-                        provider.check_addr_validation_status(address)[address]
-                    ),
-                })
-            except NotImplementedError:
-                continue
+        for name, result in call_providers(
+                "check_addr_validation_status", address):
+            statuses["providers"].append({
+                "provider": name,
+                "validation": "Timeout" if result is None else result[address],
+            })
 
         return statuses, 200
 
@@ -54,81 +372,498 @@ class Validation(Resource):
     def post(self, address):
         status = 200
         status_by_provider = {"providers": []}
-        for name, provider in mail_providers.items():
-            try:
-                resp = provider.validate_addr(address)
-                if not resp.ok:
-                    status = 503
-
+        for name, resp in call_providers("validate_addr", address):
+            if resp is None:
+                status = 503
                 status_by_provider["providers"].append({
                     "provider": name,
-                    "status_code": resp.status_code,
-                    "msg":  resp.reason,
+                    "status_code": 504,
+                    "msg": "Gateway Timeout",
                 })
-            except NotImplementedError:
                 continue
 
+            if not resp.ok:
+                status = 503
+            status_by_provider["providers"].append({
+                "provider": name,
+                "status_code": resp.status_code,
+                "msg":  resp.reason,
+            })
+
         return status_by_provider, status
 
 
+@api.route("/validation/bulk")
+class BulkValidation(Resource):
+    @api.doc(
+        'Check validation status of many addresses',
+        description=(
+            "Returns a line of JSON (NDJSON) per address and provider, "
+            "streamed as soon as the provider answers"
+        )
+    )
+    @api.response(200, "Validation statuses, as NDJSON")
+    @api.response(413, "Too many addresses")
+    @api.expect(bulk_validation_model, validate=True)
+    def post(self):
+        # deduplicate, but keep the order
+        addresses = list(collections.OrderedDict.fromkeys(
+            request.json["addresses"]
+        ))
+        max_addresses = current_app.config.get(
+            "BULK_VALIDATION_MAX_ADDRESSES", 10000
+        )
+        if len(addresses) > max_addresses:
+            api.abort(
+                413, "cannot check more than {} addresses".format(
+                    max_addresses
+                )
+            )
+
+        # streamed outside of the application context
+        statuses = self._stream_statuses(
+            addresses, get_mail_sender(), get_executor(),
+            current_app.config.get("PROVIDERS_WORKERS", 16)
+        )
+        return Response(statuses, mimetype="application/x-ndjson")
+
+    def _iter_chunks(self, addresses, mail_sender):
+        for name, provider in mail_sender.mail_providers.items():
+            chunk_size = provider.max_validation_batch
+            if not chunk_size:
+                continue
+            for i in range(0, len(addresses), chunk_size):
+                yield name, provider, addresses[i:i + chunk_size]
+
+    def _stream_statuses(self, addresses, mail_sender, executor, window):
+        """
+        :param window: maximum number of chunks submitted to the executor
+                       at once, so a large request does not hold up the
+                       others sharing it
+        """
+        chunks = self._iter_chunks(addresses, mail_sender)
+        futures = {}
+        try:
+            while True:
+                for name, provider, chunk in itertools.islice(
+                        chunks, window - len(futures)):
+                    future = executor.submit(
+                        call_provider, name, provider,
+                        "check_addr_validation_status", *chunk
+                    )
+                    futures[future] = (name, chunk)
+                if not futures:
+                    return
+
+                done, _ = concurrent.futures.wait(
+                    futures, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    name, chunk = futures.pop(future)
+                    yield self._format_statuses(
+                        mail_sender, future, name, chunk
+                    )
+        finally:
+            # client gone: do not request the providers for nothing
+            for future in futures:
+                future.cancel()
+
+    def _format_statuses(self, mail_sender, future, name, chunk):
+        try:
+            statuses = future.result()
+            lines = (
+                {"address": a, "provider": name, "validation": statuses[a]}
+                for a in chunk
+            )
+        except Exception as e:
+            mail_sender.logger.error(
+                "Error checking validation status on {}".format(name),
+                exc_info=e
+            )
+            lines = (
+                {"address": a, "provider": name, "error": str(e)}
+                for a in chunk
+            )
+        return "".join(fast_json.dumps(l) + "\n" for l in lines)
+
+
 @api.route("/send")
 class SendMail(Resource):
     @api.doc('Send Mail')
     @api.response(200, "Mail sent", send_ok_model)
+    @api.response(202, "Mail queued (asynchronous mode)", job_model)
+    @api.response(400, "Invalid mail, or template rendering error")
+    @api.response(404, "Template not found")
+    @api.response(409, "Same Idempotency-Key still being sent")
+    @api.response(
+        422, "Every receiver is suppressed, or Idempotency-Key already used "
+        "by another mail"
+    )
     @api.response(503, "Validation error", send_error_model)
+    @api.param(
+        "Idempotency-Key", _in="header", description=(
+            "Unique key of the mail: repeated requests with the same key get "
+            "the result of the first one instead of sending it again"
+        )
+    )
     @api.expect(mail_model, validate=True)
     def post(self):
-        mail_params = request.json
-        try:
-            src_name = mail_params.pop("from")
-        except KeyError:
-            src_name = None
+        return send_once(self._send, request.json)
+
+    def _send(self, mail_params):
+        mail_params = apply_template(mail_params)
+        if current_app.config.get("ASYNC_SEND", False):
+            job_id = get_worker_pool().put(mail_params)
+            return {"id": job_id, "status": JobQueue.QUEUED}, 202
+
+        mail_sender = get_mail_sender()
+        if current_app.config.get("ASYNC_PROVIDERS", False):
+            return event_loop.run(mail_sender.async_send_mail(mail_params))
+        return mail_sender.send_mail(mail_params)
 
-        sending_details = {"providers": [], }
+
+@api.route("/send/multipart")
+class SendMailMultipart(Resource):
+    @api.doc(
+        'Send a mail with attachments',
+        description=(
+            "Uploaded files are spooled, then streamed to the provider. "
+            "Only sent through providers handling attachments. "
+            "Always sent synchronously, as files are not queued."
+        )
+    )
+    @api.response(200, "Mail sent", send_ok_model)
+    @api.response(400, "Invalid message, or template rendering error")
+    @api.response(404, "Template not found")
+    @api.response(413, "Request too large")
+    @api.response(503, "Validation error", send_error_model)
+    @api.expect(send_multipart_parser)
+    def post(self):
+        args = send_multipart_parser.parse_args()
         try:
-            # Cannot be built through a comprehensive list, as providers
-            # responses have to be kept even when a mail cannot be sent
-            for response in self._send_with_failover(mail_params, src_name):
-                sending_details["providers"].append({
-                    "provider": response[0],
-                    "status_code": response[1],
-                    "msg":  response[2],
-                })
+            mail_params = fast_json.loads(args["message"])
+        except ValueError:
+            api.abort(400, "message is not valid JSON")
+        mail_model.validate(mail_params, api.refresolver)
+        mail_params = apply_template(mail_params)
 
-            sending_details["provider_used"] = (
-                sending_details["providers"][-1]["provider"]
-            )
-            status = 200
-        except MailNotSentError as e:
-            app.logger.error("Error sending mail: {}".format(sending_details))
-            status = 503
-        return sending_details, status
-
-    def _send_with_failover(self, mail_params, src_name=None):
-        for provider, sender in mail_providers.items():
-            try:
-                src = self._get_sender_for_provider(provider, src_name)
-                response = sender.send(src=src, **mail_params)
-                app.logger.debug(
-                    "{} response: {}".format(provider, response.content)
+        for field in ("attachment", "inline"):
+            if args[field]:
+                mail_params[field] = [
+                    (f.filename, f.stream, f.mimetype or None)
+                    for f in args[field]
+                ]
+
+        mail_sender = get_mail_sender()
+        if current_app.config.get("ASYNC_PROVIDERS", False):
+            return event_loop.run(mail_sender.async_send_mail(mail_params))
+        return mail_sender.send_mail(mail_params)
+
+
+@api.route("/send/batch")
+class SendMailBatch(Resource):
+    @api.doc('Send many mails at once')
+    @api.response(200, "At least one mail sent", batch_result_model)
+    @api.response(202, "Mails queued (asynchronous mode)", batch_result_model)
+    @api.response(400, "Invalid mail, or template rendering error")
+    @api.response(404, "Template not found")
+    @api.response(413, "Too many mails")
+    @api.response(503, "No mail sent", batch_result_model)
+    @api.expect(batch_mail_model, validate=True)
+    def post(self):
+        messages = request.json["messages"]
+        max_messages = current_app.config.get("SEND_BATCH_MAX_MESSAGES", 1000)
+        if len(messages) > max_messages:
+            api.abort(
+                413, "cannot send more than {} mails at once".format(
+                    max_messages
                 )
+            )
+        messages = [apply_template(m) for m in messages]
 
-                yield provider, response.status_code, response.reason
-                if response.ok:
-                    return
-            except UnvalidatedAddrError as e:
-                app.logger.error(e)
-                yield provider, 400, str(e)
-            except Exception as e:
-                app.logger.error("Error sending mail to {}".format(
-                    mail_params["to"]
-                ), exc_info=e)
-                yield provider, 500, "Internal Server Error"
-
-        raise MailNotSentError()
-
-    def _get_sender_for_provider(self, provider, src_name=None):
-        return "{} <{}>".format(
-            APP_NAME.title() if src_name is None else src_name,
-            app.config["SEND_FROM"][provider]
+        if current_app.config.get("ASYNC_SEND", False):
+            worker_pool = get_worker_pool()
+            results = [
+                {"id": worker_pool.put(m), "status": JobQueue.QUEUED,
+                 "status_code": 202}
+                for m in messages
+            ]
+            return {"results": results}, 202
+
+        results = []
+        parallelism = min(
+            current_app.config.get("SEND_BATCH_PARALLELISM", 8), len(messages)
+        ) or 1
+        for sending_details, status in self._send_mails(messages, parallelism):
+            sending_details["status_code"] = status
+            sending_details["status"] = (
+                JobQueue.SENT if status == 200 else JobQueue.FAILED
+            )
+            results.append(sending_details)
+
+        all_failed = results and all(r["status_code"] != 200 for r in results)
+        return {"results": results}, 503 if all_failed else 200
+
+    def _send_mails(self, messages, parallelism):
+        mail_sender = get_mail_sender()
+        if current_app.config.get("ASYNC_PROVIDERS", False):
+            return event_loop.run(
+                async_send_mails(mail_sender, messages, parallelism)
+            )
+
+        with concurrent.futures.ThreadPoolExecutor(parallelism) as executor:
+            return list(executor.map(mail_sender.send_mail, messages))
+
+
+@api.route("/templates")
+class TemplateList(Resource):
+    @api.doc('List the registered templates')
+    @api.response(200, "Templates", template_list_model)
+    def get(self):
+        return {"templates": get_template_renderer().store.list()}, 200
+
+
+@api.route("/templates/<string:template_id>")
+class Template(Resource):
+    @api.doc('Get a template')
+    @api.response(200, "Template", template_details_model)
+    @api.response(404, "Template not found")
+    def get(self, template_id):
+        template = get_template_renderer().store.get(template_id)
+        if template is None:
+            api.abort(404, "template {} not found".format(template_id))
+        return template, 200
+
+    @api.doc(
+        'Register or replace a template',
+        description=(
+            "Subject, text and html are Jinja2 templates, rendered in a "
+            "sandbox. Mails then only give the template id and variables."
+        )
+    )
+    @api.response(200, "Template replaced", template_info_model)
+    @api.response(201, "Template registered", template_info_model)
+    @api.response(400, "Invalid template")
+    @api.expect(template_model, validate=True)
+    def put(self, template_id):
+        if len(template_id) > 255:
+            api.abort(400, "template id cannot exceed 255 characters")
+        template = {
+            field: request.json.get(field, None)
+            for field in ("subject", "text", "html", "provider_templates")
+        }
+        if not any(template.values()):
+            api.abort(
+                400, "a template needs a subject, text, html or "
+                "provider_templates"
+            )
+        renderer = get_template_renderer()
+        try:
+            renderer.compile(dict(template, id=template_id))
+        except InvalidTemplateError as e:
+            api.abort(400, str(e))
+
+        revision, created = renderer.store.put(template_id, **template)
+        return (
+            {"id": template_id, "revision": revision},
+            201 if created else 200
+        )
+
+    @api.doc('Delete a template')
+    @api.response(204, "Template deleted")
+    @api.response(404, "Template not found")
+    def delete(self, template_id):
+        if not get_template_renderer().store.delete(template_id):
+            api.abort(404, "template {} not found".format(template_id))
+        return None, 204
+
+
+@api.route("/suppressions/<string:address>")
+class Suppression(Resource):
+    @api.doc('Check if an address is suppressed')
+    @api.response(200, "Suppressed address", suppression_details_model)
+    @api.response(404, "Address not suppressed")
+    def get(self, address):
+        suppression = get_suppression_list().get(address)
+        if suppression is None:
+            api.abort(404, "{} is not suppressed".format(address))
+        return suppression, 200
+
+    @api.doc('Suppress an address')
+    @api.response(204, "Address suppressed")
+    @api.expect(suppression_model, validate=True)
+    def put(self, address):
+        get_suppression_list().add(
+            [address], (request.json or {}).get("reason", None)
+        )
+        return None, 204
+
+    @api.doc('Remove an address from the suppression list')
+    @api.response(204, "Address removed")
+    @api.response(404, "Address not suppressed")
+    def delete(self, address):
+        if not get_suppression_list().remove(address):
+            api.abort(404, "{} is not suppressed".format(address))
+        return None, 204
+
+
+@api.route("/suppressions/import")
+class SuppressionImport(Resource):
+    @api.doc(
+        'Suppress many addresses',
+        description=(
+            "The body is a CSV file of \"address,reason\" lines (reason is "
+            "optional), as returned by the export, read while being "
+            "received. Already suppressed addresses get the new reason."
+        )
+    )
+    @api.response(200, "Addresses imported", suppression_import_model)
+    def post(self):
+        invalid = 0
+
+        def iter_addresses():
+            nonlocal invalid
+            lines = (l.decode("utf-8", "replace") for l in request.stream)
+            for i, row in enumerate(csv.reader(lines)):
+                if not row or (i == 0 and row[0] == "address"):
+                    continue
+                address = row[0].strip()
+                if "@" not in address or len(address) > 254:
+                    invalid += 1
+                    continue
+                yield address, (row[1] if len(row) > 1 else None) or None
+
+        imported = get_suppression_list().add(iter_addresses())
+        return {"imported": imported, "invalid": invalid}, 200
+
+
+@api.route("/suppressions/export")
+class SuppressionExport(Resource):
+    @api.doc(
+        'Export the suppression list',
+        description=(
+            "Streamed as a CSV file of \"address,reason,created\" lines"
+        )
+    )
+    @api.response(200, "Suppressed addresses, as CSV")
+    def get(self):
+        # streamed outside of the application context
+        return Response(
+            self._stream_csv(get_suppression_list()), mimetype="text/csv"
+        )
+
+    def _stream_csv(self, suppression_list, chunk_size=1000):
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\n")
+        writer.writerow(("address", "reason", "created"))
+        for i, suppression in enumerate(suppression_list, 1):
+            writer.writerow((
+                suppression["address"], suppression["reason"] or "",
+                suppression["created"]
+            ))
+            if i % chunk_size == 0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+
+
+@api.route("/jobs/<string:job_id>")
+class Job(Resource):
+    @api.doc('Get the sending status of a queued mail')
+    @api.response(200, "Job status", job_model)
+    @api.response(404, "Job not found")
+    def get(self, job_id):
+        job = get_worker_pool().job_queue.get(job_id)
+        if job is None:
+            api.abort(404, "job {} not found".format(job_id))
+        return job, 200
+
+
+@api.route("/admin/pools")
+class PoolStats(Resource):
+    @api.doc('Get connection pools statistics')
+    @api.response(200, "Pools statistics", pool_stats_model)
+    def get(self):
+        pools = []
+        for name, provider in get_mail_sender().mail_providers.items():
+            stats = provider.pool_stats()
+            stats["provider"] = name
+            pools.append(stats)
+
+        return {"pools": pools}, 200
+
+
+@api.route("/admin/caches")
+class CacheStats(Resource):
+    @api.doc('Get validation status caches statistics')
+    @api.response(200, "Caches statistics", cache_stats_model)
+    def get(self):
+        caches = []
+        for name, provider in get_mail_sender().mail_providers.items():
+            stats = provider.cache_stats()
+            if stats is not None:
+                stats["provider"] = name
+                caches.append(stats)
+
+        return {"caches": caches}, 200
+
+
+@api.route("/admin/circuit-breakers")
+class CircuitBreakerStats(Resource):
+    @api.doc('Get the circuit breaker state of each provider')
+    @api.response(200, "Circuit breakers state", circuit_breaker_stats_model)
+    def get(self):
+        breakers = []
+        for name, breaker in get_mail_sender().circuit_breakers.items():
+            stats = breaker.stats()
+            stats["provider"] = name
+            breakers.append(stats)
+
+        return {"circuit_breakers": breakers}, 200
+
+
+@api.route("/admin/routing")
+class RoutingStats(Resource):
+    @api.doc('Get the routing policy and the providers performance')
+    @api.response(200, "Routing statistics", routing_stats_model)
+    def get(self):
+        mail_sender = get_mail_sender()
+        routing_policy = mail_sender.routing_policy
+        providers = []
+        for name in mail_sender.mail_providers:
+            stats = routing_policy.get_stats(name).to_dict()
+            stats["provider"] = name
+            providers.append(stats)
+
+        return {"policy": routing_policy.name, "providers": providers}, 200
+
+
+@api.route("/admin/rate-limiters")
+class RateLimiterStats(Resource):
+    @api.doc('Get the rate limiter state of each provider')
+    @api.response(200, "Rate limiters state", rate_limiter_stats_model)
+    def get(self):
+        limiters = []
+        for name, limiter in get_mail_sender().rate_limiters.items():
+            stats = limiter.stats()
+            stats["provider"] = name
+            limiters.append(stats)
+
+        return {"rate_limiters": limiters}, 200
+
+
+@api.route("/metrics")
+class Metrics(Resource):
+    @api.doc(
+        'Get the providers and failover metrics',
+        description=(
+            "Metrics of every process, in the Prometheus text format"
+        )
+    )
+    @api.response(200, "Metrics")
+    def get(self):
+        return Response(
+            metrics.registry.expose(),
+            content_type="text/plain; version=0.0.4; charset=utf-8"
         )
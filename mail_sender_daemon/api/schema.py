@@ -0,0 +1,238 @@
+import re
+from flask_restplus import Model
+
+__all__ = ("UnsupportedSchema", "SchemaCompiler", "CompiledModel")
+
+
+_TYPES = {
+    "array": lambda v: isinstance(v, list),
+    "boolean": lambda v: isinstance(v, bool),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "null": lambda v: v is None,
+    "number": lambda v: (
+        isinstance(v, (int, float)) and not isinstance(v, bool)
+    ),
+    "object": lambda v: isinstance(v, dict),
+    "string": lambda v: isinstance(v, str),
+}
+_OBJECT_KEYWORDS = {
+    "properties", "required", "patternProperties", "additionalProperties",
+}
+_KEYWORDS = _OBJECT_KEYWORDS | {
+    "$ref", "type", "enum", "allOf", "items", "minItems", "maxItems",
+    "pattern", "minLength", "maxLength",
+}
+# keywords not validating the instance
+_ANNOTATIONS = {
+    "description", "title", "example", "default", "readOnly", "discriminator",
+    "definitions",
+}
+
+
+class UnsupportedSchema(Exception):
+    pass
+
+
+class SchemaCompiler():
+    """
+    Compile a JSON schema (draft 4) into a function checking instances
+
+    jsonschema walks the schema on every validation, when the API only needs
+    to know if a payload is valid: the checks are built once instead, as
+    closures. Only the keywords used by the models are compiled.
+    """
+    def __init__(self, resolve_ref):
+        """
+        :param resolve_ref: function taking a $ref, and returning its schema
+        """
+        self.resolve_ref = resolve_ref
+        self._refs = {}
+
+    def compile(self, schema):
+        """
+        :returns: function taking an instance, returning if it is valid
+        :raises UnsupportedSchema: if a keyword cannot be compiled
+        """
+        unknown = [
+            k for k in schema
+            if k not in _KEYWORDS and k not in _ANNOTATIONS and
+            not k.startswith("x-")
+        ]
+        if unknown:
+            raise UnsupportedSchema(
+                "cannot compile {}".format(", ".join(unknown))
+            )
+        # other keywords are ignored next to a reference
+        if "$ref" in schema:
+            return self._compile_ref(schema["$ref"])
+
+        checks = []
+        if "type" in schema:
+            checks.append(self._compile_type(schema["type"]))
+        if "enum" in schema:
+            checks.append(self._compile_enum(schema["enum"]))
+        if _OBJECT_KEYWORDS.intersection(schema):
+            checks.append(self._compile_object(schema))
+        if {"items", "minItems", "maxItems"}.intersection(schema):
+            checks.append(self._compile_array(schema))
+        if {"pattern", "minLength", "maxLength"}.intersection(schema):
+            checks.append(self._compile_string(schema))
+        checks.extend(self.compile(s) for s in schema.get("allOf", ()))
+
+        if not checks:
+            return lambda instance: True
+        elif len(checks) == 1:
+            return checks[0]
+
+        def check(instance):
+            for c in checks:
+                if not c(instance):
+                    return False
+            return True
+        return check
+
+    def _compile_ref(self, ref):
+        if ref not in self._refs:
+            # set first, for recursive references
+            self._refs[ref] = None
+            self._refs[ref] = self.compile(self.resolve_ref(ref))
+        refs = self._refs
+        return lambda instance: refs[ref](instance)
+
+    def _compile_type(self, types):
+        if isinstance(types, str):
+            types = [types]
+        unknown = [t for t in types if t not in _TYPES]
+        if unknown:
+            raise UnsupportedSchema(
+                "cannot compile type {}".format(", ".join(unknown))
+            )
+        if len(types) == 1:
+            return _TYPES[types[0]]
+        checks = [_TYPES[t] for t in types]
+        return lambda instance: any(c(instance) for c in checks)
+
+    def _compile_enum(self, enum):
+        def check(instance):
+            return any(
+                instance == e and
+                isinstance(instance, bool) == isinstance(e, bool)
+                for e in enum
+            )
+        return check
+
+    def _compile_object(self, schema):
+        properties = {
+            name: self.compile(s)
+            for name, s in schema.get("properties", {}).items()
+        }
+        required = tuple(schema.get("required", ()))
+        patterns = [
+            (re.compile(p), self.compile(s))
+            for p, s in schema.get("patternProperties", {}).items()
+        ]
+        additional = schema.get("additionalProperties", True)
+        if isinstance(additional, dict):
+            additional = self.compile(additional)
+
+        def check(instance):
+            if not isinstance(instance, dict):
+                return True
+            for name in required:
+                if name not in instance:
+                    return False
+            for name, value in instance.items():
+                check_property = properties.get(name, None)
+                matched = check_property is not None
+                if matched and not check_property(value):
+                    return False
+                for regex, check_pattern in patterns:
+                    if regex.search(name):
+                        if not check_pattern(value):
+                            return False
+                        matched = True
+                if not matched and additional is not True and (
+                        additional is False or not additional(value)):
+                    return False
+            return True
+        return check
+
+    def _compile_array(self, schema):
+        items = schema.get("items", None)
+        if isinstance(items, list):
+            raise UnsupportedSchema("cannot compile items as a list")
+        check_item = None if items is None else self.compile(items)
+        min_items = schema.get("minItems", 0)
+        max_items = schema.get("maxItems", None)
+
+        def check(instance):
+            if not isinstance(instance, list):
+                return True
+            if len(instance) < min_items or (
+                    max_items is not None and len(instance) > max_items):
+                return False
+            if check_item is not None:
+                for item in instance:
+                    if not check_item(item):
+                        return False
+            return True
+        return check
+
+    def _compile_string(self, schema):
+        regex = (
+            re.compile(schema["pattern"]) if "pattern" in schema else None
+        )
+        min_length = schema.get("minLength", 0)
+        max_length = schema.get("maxLength", None)
+
+        def check(instance):
+            if not isinstance(instance, str):
+                return True
+            if len(instance) < min_length or (
+                    max_length is not None and len(instance) > max_length):
+                return False
+            return regex is None or regex.search(instance) is not None
+        return check
+
+
+class CompiledModel(Model):
+    """
+    Model validating payloads with its schema compiled on first use
+
+    Valid payloads are only checked by the compiled schema. Invalid ones, and
+    models using keywords or formats which cannot be compiled, are validated
+    by flask-restplus, for the same error messages.
+    """
+    def __init__(self, name, *args, models=None, **kwargs):
+        """
+        :param models: registered models, by name, to resolve the references
+                       to nested models
+        """
+        super().__init__(name, *args, **kwargs)
+        self.models = {} if models is None else models
+        self._is_valid = None
+
+    def _resolve_ref(self, ref):
+        prefix = "#/definitions/"
+        if not ref.startswith(prefix) or ref[len(prefix):] not in self.models:
+            raise UnsupportedSchema("cannot resolve {}".format(ref))
+        return self.models[ref[len(prefix):]].__schema__
+
+    def compile(self):
+        """
+        :returns: function taking a payload, returning if it is valid. None
+                  if the schema cannot be compiled.
+        """
+        if self._is_valid is None:
+            try:
+                self._is_valid = SchemaCompiler(self._resolve_ref).compile(
+                    self.__schema__
+                )
+            except UnsupportedSchema:
+                self._is_valid = False
+        return self._is_valid or None
+
+    def validate(self, data, resolver=None, format_checker=None):
+        is_valid = None if format_checker is not None else self.compile()
+        if is_valid is None or not is_valid(data):
+            super().validate(data, resolver, format_checker)
@@ -0,0 +1,851 @@
+import asyncio
+import itertools
+import os
+import threading
+import time
+import appdirs
+from flask import current_app
+
+from mail_sender_daemon import APP_NAME
+from mail_sender_daemon.cache import SharedTTLCache, TTLCache
+from mail_sender_daemon.circuit_breaker import (
+    CircuitBreaker, SharedCircuitBreaker
+)
+from mail_sender_daemon.event_loop import EventLoopThread
+from mail_sender_daemon.rate_limiter import (
+    QuotaTokenBucket, SharedQuotaTokenBucket, SharedTokenBucket, TokenBucket
+)
+from mail_sender_daemon.retry import RetryBudget, RetryPolicy
+from mail_sender_daemon.routing import build_routing_policy
+from mail_sender_daemon.state import build_state_backend
+from mail_sender_daemon.suppression import SuppressionList
+from mail_sender_daemon.exceptions import (
+    InvalidConfigError, MailNotSentError, PartialBatchError,
+    UnvalidatedAddrError
+)
+from . import metrics
+
+__all__ = (
+    "MailSender", "get_mail_sender", "reload_mail_sender", "event_loop"
+)
+
+
+#: event loop of the asynchronous providers
+event_loop = EventLoopThread("providers-event-loop")
+_mail_sender_lock = threading.Lock()
+
+
+def get_mail_sender(app=None):
+    """
+    Mail sender of an application, built on its first use
+
+    :param app: application. Default to the current one.
+    :returns: MailSender
+    """
+    if app is None:
+        app = current_app._get_current_object()
+
+    mail_sender = app.extensions.get("mail_sender", None)
+    if mail_sender is None:
+        with _mail_sender_lock:
+            mail_sender = app.extensions.get("mail_sender", None)
+            if mail_sender is None:
+                mail_sender = MailSender(app.config, app.logger)
+                app.extensions["mail_sender"] = mail_sender
+    return mail_sender
+
+
+def reload_mail_sender(app, config, drain_timeout=30):
+    """
+    Apply a new config: build a mail sender from it, then swap it with the
+    current one
+
+    Requests being processed finish with the previous mail sender, whose
+    connections are closed once they are done, in the background.
+
+    :param config: new config, replacing the application one: settings
+                   missing from it are removed
+    :param drain_timeout: maximum seconds to wait for the requests of the
+                          previous mail sender before closing it
+    :raises InvalidConfigError: the current mail sender is then kept
+    """
+    # from the Flask defaults, as create_app()
+    app_config = app.make_config()
+    app_config.update(config)
+    mail_sender = MailSender(app_config, app.logger)
+
+    with _mail_sender_lock:
+        app.config = app_config
+        previous = app.extensions.get("mail_sender", None)
+        app.extensions["mail_sender"] = mail_sender
+
+    if previous is not None:
+        threading.Thread(
+            target=previous.close, args=(drain_timeout, ),
+            name="mail-sender-closer", daemon=True
+        ).start()
+    return mail_sender
+
+
+class MailSender():
+    """
+    Send mails through the providers, with automatic failover
+
+    Holds the providers and the state of the sending: suppression list,
+    circuit breakers, routing policy, retry policies and rate limiters. The
+    validation cache, circuit breakers and rate limiters can be shared with
+    other processes, through a state backend.
+    """
+    #: settings needed to build the providers
+    REQUIRED_SETTINGS = (
+        "AMAZON_API_ACCESS_KEY", "AMAZON_API_SECRET_KEY", "AMAZON_API_DOMAIN",
+        "MAILGUN_API_KEY", "MAILGUN_API_BASE_URL",
+    )
+
+    def __init__(self, config, logger):
+        """
+        :param config: application configuration
+        :param logger: logger of the sending errors
+        :raises InvalidConfigError: a setting is missing
+        """
+        self.check_config(config)
+        self.config = config
+        self.logger = logger
+
+        self.state_backend = self._build_state_backend()
+        self.suppression_list = self._build_suppression_list()
+        self.mail_providers = self._build_mail_providers()
+        self.circuit_breakers = {
+            name: self._build_circuit_breaker(name)
+            for name in self.mail_providers
+        }
+        self.routing_policy = build_routing_policy(
+            **(config.get("ROUTING_POLICY", None) or {})
+        )
+        self.retry_policies = {
+            name: self._build_retry_policy(name)
+            for name in self.mail_providers
+        }
+        self.retry_budget = RetryBudget(
+            **(config.get("RETRY_BUDGET", None) or {})
+        )
+
+        rate_limits_config = (
+            (config.get("RATE_LIMITS", None) or {}).get("providers", None) or
+            {}
+        )
+        self.rate_limiters = {
+            name: self._build_rate_limiter(name, **settings)
+            for name, settings in rate_limits_config.items()
+        }
+        #: providers counting each recipient as a mail
+        self.rate_limited_per_recipient = {
+            name for name, settings in rate_limits_config.items()
+            if settings.get("per_recipient", False)
+        }
+
+        self._async_mail_providers = {}
+        self._async_mail_providers_lock = threading.Lock()
+
+    @classmethod
+    def check_config(cls, config):
+        """
+        :raises InvalidConfigError: a setting is missing
+        """
+        for setting in cls.REQUIRED_SETTINGS:
+            if not config.get(setting, None):
+                raise InvalidConfigError(setting)
+
+        send_from = config.get("SEND_FROM", None) or {}
+        for provider in ("amazon_ses", "mailgun"):
+            if not send_from.get(provider, None):
+                raise InvalidConfigError("SEND_FROM." + provider)
+
+    def close(self, timeout=30):
+        """
+        Close the connections of the providers, once their requests in
+        flight are done
+
+        :param timeout: maximum seconds to wait for the requests
+        """
+        pools = {p.http_pool for p in self.mail_providers.values()}
+        with self._async_mail_providers_lock:
+            # {pool: loop}
+            async_pools = {
+                provider.http_pool: loop
+                for loop, providers in self._async_mail_providers.items()
+                for provider in providers.values()
+            }
+            self._async_mail_providers.clear()
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and any(
+                pool.stats()["in_flight"]
+                for pool in itertools.chain(pools, async_pools)):
+            time.sleep(0.1)
+
+        for pool in pools:
+            pool.close()
+        for pool, loop in async_pools.items():
+            if not loop.is_running():
+                continue
+            try:
+                asyncio.run_coroutine_threadsafe(pool.close(), loop).result(
+                    timeout
+                )
+            except Exception as e:
+                self.logger.error("Cannot close a pool", exc_info=e)
+        if self.state_backend is not None:
+            self.state_backend.close()
+
+    def _build_state_backend(self):
+        """
+        Build the backend of the state shared with other processes, from the
+        SHARED_STATE config
+
+        :returns: None if the state is kept in this mail sender
+        """
+        settings = dict(self.config.get("SHARED_STATE", None) or {})
+        if not settings:
+            return None
+
+        settings.pop("sync_interval", None)
+        if settings.get("backend", None) == "sqlite" and not (
+                settings.get("path", None)):
+            settings["path"] = os.path.join(
+                appdirs.user_data_dir(APP_NAME), "state.sqlite"
+            )
+        return build_state_backend(**settings)
+
+    def _build_suppression_list(self):
+        """
+        :returns: SuppressionList, from the SUPPRESSIONS config, or None if
+                  disabled
+        """
+        settings = dict(self.config.get("SUPPRESSIONS", None) or {})
+        if not settings:
+            return None
+
+        settings["path"] = settings.get("path", None) or os.path.join(
+            appdirs.user_data_dir(APP_NAME), "suppressions.sqlite"
+        )
+        return SuppressionList(**settings)
+
+    def _build_mail_providers(self):
+        # imported here, as requests is long to import
+        from mail_sender_daemon.providers import AmazonSES, Mailgun
+
+        return {
+            "amazon_ses": AmazonSES(
+                api_access_key=self.config["AMAZON_API_ACCESS_KEY"],
+                api_secret_key=self.config["AMAZON_API_SECRET_KEY"],
+                api_domain=self.config["AMAZON_API_DOMAIN"],
+                signature_version=self.config.get(
+                    "AMAZON_SIGNATURE_VERSION", 3
+                ),
+                region=self.config.get("AMAZON_API_REGION", None),
+                send_raw=self.config.get("AMAZON_SEND_RAW", False),
+                http_pool=self._build_http_pool("amazon_ses"),
+                **self._build_amazon_validation_cache_params()
+            ),
+            "mailgun": Mailgun(
+                api_key=self.config["MAILGUN_API_KEY"],
+                api_base_url=self.config["MAILGUN_API_BASE_URL"],
+                http_pool=self._build_http_pool("mailgun"),
+            ),
+        }
+
+    def _build_http_pool(self, provider):
+        """
+        Build the connection pool of a provider, from the HTTP_POOL config
+
+        Each provider can override the default settings in a sub-section
+        named after it.
+        """
+        from mail_sender_daemon.providers import HTTPPool
+
+        pool_config = self.config.get("HTTP_POOL", None) or {}
+        settings = {
+            k: v for k, v in pool_config.items() if not isinstance(v, dict)
+        }
+        settings.update(pool_config.get(provider, None) or {})
+        return HTTPPool(**settings)
+
+    def _build_amazon_validation_cache_params(self):
+        cache_config = self.config.get("AMAZON_VALIDATION_CACHE", None)
+        if not cache_config:
+            return {}
+
+        if self.state_backend is None:
+            validation_cache = TTLCache(cache_config.get("max_size", 10000))
+        else:
+            validation_cache = SharedTTLCache(
+                self.state_backend, "validation:amazon_ses:"
+            )
+        return {
+            "validation_cache": validation_cache,
+            "validation_success_ttl": cache_config.get("success_ttl", 3600),
+            "validation_failure_ttl": cache_config.get("failure_ttl", 60),
+        }
+
+    def _build_circuit_breaker(self, provider):
+        settings = self.config.get("CIRCUIT_BREAKER", None) or {}
+        if self.state_backend is None:
+            return CircuitBreaker(**settings)
+        return SharedCircuitBreaker(
+            self.state_backend, "circuit:" + provider,
+            sync_interval=self.config["SHARED_STATE"].get("sync_interval", 1),
+            **settings
+        )
+
+    def _build_retry_policy(self, provider):
+        """
+        Build the retry policy of a provider, from the RETRY_POLICY config
+
+        Each provider can override the default settings in a sub-section
+        named after it.
+        """
+        policy_config = self.config.get("RETRY_POLICY", None) or {}
+        settings = {
+            k: v for k, v in policy_config.items() if not isinstance(v, dict)
+        }
+        settings.update(policy_config.get(provider, None) or {})
+        return RetryPolicy(**settings)
+
+    def _build_rate_limiter(self, provider, rate=None, burst=None,
+                            from_quota=False, quota_refresh=3600,
+                            per_recipient=False):
+        """
+        :param rate: mails per second. Initial rate if from_quota is set.
+        :param burst: maximum number of mails sent at once
+        :param from_quota: follow the rate allowed by the provider
+        :param quota_refresh: seconds between two checks of the allowed rate
+        :param per_recipient: count each recipient as a mail
+        """
+        shared = {}
+        if self.state_backend is not None:
+            shared = {"backend": self.state_backend, "key": "rate:" + provider}
+
+        if from_quota:
+            bucket_class = (
+                SharedQuotaTokenBucket if shared else QuotaTokenBucket
+            )
+            return bucket_class(
+                self.mail_providers[provider].get_max_send_rate, rate or 1,
+                burst, refresh_interval=quota_refresh, **shared
+            )
+        return (SharedTokenBucket if shared else TokenBucket)(
+            rate, burst, **shared
+        )
+
+    def get_async_mail_providers(self):
+        """
+        Asynchronous providers, sharing one connection pool
+
+        Built on first use in each event loop, as their connections are bound
+        to the loop. The validation cache is shared with the synchronous
+        providers.
+
+        :returns: {name: provider}, in the same order as mail_providers
+        """
+        loop = asyncio.get_event_loop()
+        with self._async_mail_providers_lock:
+            if loop not in self._async_mail_providers:
+                self._async_mail_providers.clear()
+                self._async_mail_providers[loop] = (
+                    self._build_async_mail_providers()
+                )
+            return self._async_mail_providers[loop]
+
+    def _build_async_mail_providers(self):
+        # imported here, as aiohttp is an optional dependency
+        from mail_sender_daemon.providers.aio import (
+            AsyncAmazonSES, AsyncHTTPPool, AsyncMailgun
+        )
+
+        http_pool = AsyncHTTPPool(
+            **(self.config.get("ASYNC_HTTP_POOL", None) or {})
+        )
+        amazon_ses = self.mail_providers["amazon_ses"]
+        return {
+            "amazon_ses": AsyncAmazonSES(
+                api_access_key=self.config["AMAZON_API_ACCESS_KEY"],
+                api_secret_key=self.config["AMAZON_API_SECRET_KEY"],
+                api_domain=self.config["AMAZON_API_DOMAIN"],
+                signature_version=self.config.get(
+                    "AMAZON_SIGNATURE_VERSION", 3
+                ),
+                region=self.config.get("AMAZON_API_REGION", None),
+                send_raw=self.config.get("AMAZON_SEND_RAW", False),
+                http_pool=http_pool,
+                validation_cache=amazon_ses.validation_cache,
+                validation_success_ttl=amazon_ses.validation_success_ttl,
+                validation_failure_ttl=amazon_ses.validation_failure_ttl,
+            ),
+            "mailgun": AsyncMailgun(
+                api_key=self.config["MAILGUN_API_KEY"],
+                api_base_url=self.config["MAILGUN_API_BASE_URL"],
+                http_pool=http_pool,
+            ),
+        }
+
+    def send_mail(self, mail_params):
+        """
+        Send a mail through the providers, with automatic failover
+
+        Used by the synchronous API and by the asynchronous workers.
+        Suppressed recipients are removed first: if every "to" recipient is
+        suppressed, the mail is not sent (422).
+
+        :param mail_params: mail parameters, as described by the mail model
+        :type mail_params: dict
+        :returns: (sending_details, status)
+        """
+        mail_params = dict(mail_params)
+        src_name = mail_params.pop("from", None)
+        sending_details = {"providers": [], }
+        if not self._remove_suppressed(mail_params, sending_details):
+            return sending_details, 422
+        self.retry_budget.record_request()
+
+        try:
+            # Cannot be built through a comprehensive list, as providers
+            # responses have to be kept even when a mail cannot be sent
+            for response in self._send_with_failover(mail_params, src_name):
+                self._add_provider_response(sending_details, response)
+
+            sending_details["provider_used"] = (
+                sending_details["providers"][-1]["provider"]
+            )
+            status = 200
+        except MailNotSentError:
+            self.logger.error(
+                "Error sending mail: {}".format(sending_details)
+            )
+            status = 503
+        self._record_sending_metrics(sending_details, status)
+        return sending_details, status
+
+    async def async_send_mail(self, mail_params):
+        """
+        Coroutine sending a mail through the asynchronous providers
+
+        Same as send_mail, to run in the providers event loop.
+        """
+        mail_params = dict(mail_params)
+        src_name = mail_params.pop("from", None)
+        sending_details = {"providers": [], }
+        # reads the suppression list database: not in the event loop
+        if not await asyncio.get_event_loop().run_in_executor(
+                None, self._remove_suppressed, mail_params, sending_details):
+            return sending_details, 422
+        self.retry_budget.record_request()
+
+        try:
+            async for response in self._async_send_with_failover(
+                    mail_params, src_name):
+                self._add_provider_response(sending_details, response)
+
+            sending_details["provider_used"] = (
+                sending_details["providers"][-1]["provider"]
+            )
+            status = 200
+        except MailNotSentError:
+            self.logger.error(
+                "Error sending mail: {}".format(sending_details)
+            )
+            status = 503
+        self._record_sending_metrics(sending_details, status)
+        return sending_details, status
+
+    def _remove_suppressed(self, mail_params, sending_details):
+        """
+        Remove the suppressed addresses from the recipients of a mail, and
+        list them in the sending details
+
+        :returns: False if every "to" recipient is suppressed, so the mail
+                  cannot be sent
+        """
+        if self.suppression_list is None:
+            return True
+
+        recipients = {}
+        for k in ("to", "cc", "bcc"):
+            addresses = mail_params.get(k, None) or ()
+            recipients[k] = (
+                [addresses] if isinstance(addresses, str) else addresses
+            )
+        suppressed = self.suppression_list.check(
+            *itertools.chain.from_iterable(recipients.values())
+        )
+        if not suppressed:
+            return True
+
+        metrics.suppressed_recipients.inc(len(suppressed))
+        sending_details["suppressed"] = sorted(suppressed)
+        for k, addresses in recipients.items():
+            if addresses:
+                mail_params[k] = [a for a in addresses if a not in suppressed]
+        return not recipients["to"] or bool(mail_params["to"])
+
+    def _add_provider_response(self, sending_details, response):
+        sending_details["providers"].append({
+            "provider": response[0],
+            "status_code": response[1],
+            "msg":  response[2],
+            "attempt": response[3],
+        })
+
+    def _record_sending_metrics(self, sending_details, status):
+        if status == 200:
+            # retries of a provider do not count
+            metrics.failover_depth.inc(depth=len({
+                p["provider"] for p in sending_details["providers"]
+            }))
+        else:
+            metrics.failed_mails.inc()
+
+    def _iter_failover(self, mail_providers, mail_params, src_name=None):
+        """
+        Failover between the providers, whatever the way they are called
+
+        Generator of the steps to run, shared by the synchronous and
+        asynchronous sending so they cannot differ:
+            * ("call", fn, *args): bookkeeping which can request the shared
+              state backend, its result being sent back
+            * ("sleep", seconds)
+            * ("send", provider, sender, kwargs): send the mail, then send
+              back (response, None), or (None, exception) if it failed
+            * ("response", provider_response): to yield to the caller
+
+        :raises MailNotSentError: if no provider sent the mail
+        """
+        for provider in self.routing_policy.order(mail_providers):
+            sender = mail_providers[provider]
+            for attempt in itertools.count(1):
+                skip_response, wait = yield (
+                    "call", self._check_skip_provider, provider, sender,
+                    mail_params
+                )
+                if skip_response is not None:
+                    yield "response", skip_response + (attempt, )
+                    break
+                if wait:
+                    yield "sleep", wait
+
+                start = time.monotonic()
+                try:
+                    kwargs = dict(
+                        self._get_send_params(provider, mail_params),
+                        src=self._get_sender_for_provider(provider, src_name)
+                    )
+                except Exception as e:
+                    response, error = None, e
+                else:
+                    response, error = yield "send", provider, sender, kwargs
+                provider_response, ok, retryable = yield (
+                    "call", self._handle_send_result, provider, sender,
+                    mail_params, response, error, start
+                )
+
+                yield "response", provider_response + (attempt, )
+                if ok:
+                    return
+
+                delay = self._get_retry_delay(provider, attempt, retryable)
+                if delay is None:
+                    break
+                yield "sleep", delay
+
+        raise MailNotSentError()
+
+    def _send_with_failover(self, mail_params, src_name=None):
+        steps = self._iter_failover(
+            self.mail_providers, mail_params, src_name
+        )
+        result = None
+        while True:
+            try:
+                step = steps.send(result)
+            except StopIteration:
+                return
+            result = None
+            if step[0] == "call":
+                result = step[1](*step[2:])
+            elif step[0] == "sleep":
+                time.sleep(step[1])
+            elif step[0] == "send":
+                result = self._call_provider(*step[1:])
+            else:
+                yield step[1]
+
+    async def _async_send_with_failover(self, mail_params, src_name=None):
+        # bookkeeping can request a shared state backend: not in the event
+        # loop, to not hold the other mails
+        loop = asyncio.get_event_loop()
+        steps = self._iter_failover(
+            self.get_async_mail_providers(), mail_params, src_name
+        )
+        result = None
+        while True:
+            try:
+                step = steps.send(result)
+            except StopIteration:
+                return
+            result = None
+            if step[0] == "call":
+                result = await loop.run_in_executor(None, *step[1:])
+            elif step[0] == "sleep":
+                await asyncio.sleep(step[1])
+            elif step[0] == "send":
+                result = await self._async_call_provider(*step[1:])
+            else:
+                yield step[1]
+
+    def _call_provider(self, provider, sender, kwargs):
+        """
+        :returns: (response, None), or (None, exception) if it failed
+        """
+        try:
+            with metrics.provider_in_flight.track_in_progress(
+                    provider=provider):
+                return sender.send(**kwargs), None
+        except Exception as e:
+            return None, e
+
+    async def _async_call_provider(self, provider, sender, kwargs):
+        try:
+            with metrics.provider_in_flight.track_in_progress(
+                    provider=provider):
+                return await sender.send(**kwargs), None
+        except Exception as e:
+            return None, e
+
+    def _get_send_params(self, provider, mail_params):
+        """
+        :returns: mail parameters for a provider, with the name of its copy
+                  of the mail template (template and template_variables
+                  parameters) if it has one
+        """
+        provider_templates = mail_params.get("provider_templates", None)
+        if provider_templates is None:
+            return mail_params
+
+        params = dict(mail_params)
+        del params["provider_templates"]
+        template_variables = params.pop("template_variables", None)
+        if provider in provider_templates:
+            params["template"] = provider_templates[provider]
+            params["template_variables"] = template_variables
+        return params
+
+    def _get_retry_delay(self, provider, attempt, retryable):
+        """
+        :returns: seconds to wait before retrying a failed attempt, None if
+                  it cannot be retried
+        """
+        policy = self.retry_policies[provider]
+        if not retryable or attempt >= policy.max_attempts:
+            return None
+        if not self.retry_budget.withdraw():
+            self.logger.warning(
+                "Retry budget exhausted, not retrying {}".format(provider)
+            )
+            metrics.retry_budget_exhausted.inc()
+            return None
+
+        metrics.provider_retries.inc(provider=provider)
+        return policy.get_delay(attempt)
+
+    def _check_skip_provider(self, provider, sender, mail_params):
+        """
+        Check if a provider can be tried for this mail, and take its rate
+        limit tokens
+
+        :returns: (response of a provider that cannot be tried or None,
+                  seconds to wait for the rate limit before sending)
+        """
+        if mail_params.get("recipient_variables") is not None and (
+                not sender.supports_recipient_variables):
+            metrics.provider_skips.inc(
+                provider=provider, reason="unsupported"
+            )
+            return (provider, 501, "recipient variables not supported"), 0
+        if (mail_params.get("attachment") or mail_params.get("inline")) and (
+                not sender.supports_attachments):
+            metrics.provider_skips.inc(
+                provider=provider, reason="unsupported"
+            )
+            return (provider, 501, "attachments not supported"), 0
+        provider_templates = mail_params.get("provider_templates", None)
+        if provider_templates is not None and (
+                provider not in provider_templates) and not (
+                mail_params.get("text") or mail_params.get("html")):
+            # the template has no content to render for other providers
+            metrics.provider_skips.inc(
+                provider=provider, reason="unsupported"
+            )
+            return (provider, 501, "no copy of the template"), 0
+
+        limiter = self.rate_limiters.get(provider)
+        tokens = self._count_rate_limit_tokens(provider, mail_params)
+        wait = 0
+        if limiter is not None:
+            wait = limiter.reserve(
+                tokens, (self.config.get("RATE_LIMITS", None) or {}).get(
+                    "max_wait", 1
+                )
+            )
+            if wait is None:
+                metrics.provider_skips.inc(
+                    provider=provider, reason="rate_limited"
+                )
+                return (provider, 429, "skipped: rate limited"), 0
+
+        if not self.circuit_breakers[provider].allow_request():
+            if limiter is not None:
+                limiter.refund(tokens)
+            metrics.provider_skips.inc(
+                provider=provider, reason="circuit_open"
+            )
+            return (provider, 503, "skipped: circuit open"), 0
+
+        return None, wait
+
+    def _count_rate_limit_tokens(self, provider, mail_params):
+        if provider not in self.rate_limited_per_recipient:
+            return 1
+
+        recipients = 0
+        for k in ("to", "cc", "bcc"):
+            addresses = mail_params.get(k, None) or ()
+            recipients += (
+                1 if isinstance(addresses, str) else len(addresses)
+            )
+        return max(recipients, 1)
+
+    def _handle_send_result(self, provider, sender, mail_params, response,
+                            error, start):
+        """
+        :returns: ((provider, status code, reason), True if the mail was
+                  sent, True if retryable)
+        """
+        if isinstance(error, PartialBatchError):
+            return self._handle_partial_batch(
+                provider, sender, mail_params, error, start
+            )
+        elif error is not None:
+            return self._handle_send_error(
+                provider, mail_params, error, start
+            )
+        return self._handle_send_response(provider, sender, response, start)
+
+    def _handle_send_error(self, provider, mail_params, e, start):
+        """
+        :returns: ((provider, status code, reason), False, True if retryable)
+        """
+        latency = time.monotonic() - start
+        metrics.provider_send_duration.observe(latency, provider=provider)
+        if isinstance(e, UnvalidatedAddrError):
+            # the provider answered, the error comes from the mail
+            self.circuit_breakers[provider].record_success()
+            metrics.provider_responses.inc(
+                provider=provider, status_code=400
+            )
+            self.logger.error(e)
+            return (provider, 400, str(e)), False, False
+        if self._is_mail_error(e):
+            # the request could not be built: the provider is not at fault
+            metrics.provider_responses.inc(
+                provider=provider, status_code=400
+            )
+            self.logger.error("Invalid mail for {}: {}".format(provider, e))
+            return (provider, 400, str(e)), False, False
+
+        self.circuit_breakers[provider].record_failure()
+        self.routing_policy.record(provider, latency, False)
+        metrics.provider_responses.inc(provider=provider, status_code="error")
+        self.logger.error("Error sending mail to {}".format(
+            mail_params["to"]
+        ), exc_info=e)
+        return (
+            (provider, 500, "Internal Server Error"), False,
+            self.retry_policies[provider].retry_on_errors
+        )
+
+    @staticmethod
+    def _is_mail_error(e):
+        """
+        :returns: True if the exception was raised while building the
+                  provider request from the mail, and not by the HTTP client
+        """
+        if not isinstance(e, (ValueError, TypeError)) or (
+                isinstance(e, OSError)):
+            return False
+        # some HTTP clients errors, such as an invalid URL, are ValueErrors
+        return type(e).__module__.split(".")[0] not in (
+            "requests", "urllib3", "aiohttp"
+        )
+
+    def _handle_partial_batch(self, provider, sender, mail_params, e, start):
+        """
+        Remove the recipients already sent from the mail, so only the others
+        are retried, or sent by the next provider
+
+        :returns: ((provider, status code, reason), False, True if retryable)
+        """
+        to = mail_params["to"]
+        if isinstance(to, str):
+            to = [to]
+        sent = set(e.sent)
+        mail_params["to"] = [addr for addr in to if addr not in sent]
+        # sent with the first chunk
+        mail_params.pop("cc", None)
+        mail_params.pop("bcc", None)
+        self.logger.warning("{}, by {}".format(e, provider))
+
+        if e.response is not None:
+            return self._handle_send_response(
+                provider, sender, e.response, start
+            )
+        return self._handle_send_error(
+            provider, mail_params, e.__cause__, start
+        )
+
+    def _handle_send_response(self, provider, sender, response, start):
+        """
+        :returns: ((provider, status code, reason), True if the mail was
+                  sent, True if retryable)
+        """
+        self.logger.debug(
+            "{} response: {}".format(provider, response.content)
+        )
+        status_code, reason, ok = (
+            response.status_code, response.reason, response.ok
+        )
+        error_code = None
+        if not ok:
+            error_code = sender.get_error_code(response)
+            if error_code:
+                reason = "{} ({})".format(reason, error_code)
+        if status_code >= 500:
+            self.circuit_breakers[provider].record_failure()
+        else:
+            self.circuit_breakers[provider].record_success()
+        latency = time.monotonic() - start
+        self.routing_policy.record(provider, latency, status_code < 500)
+        metrics.provider_send_duration.observe(latency, provider=provider)
+        metrics.provider_responses.inc(
+            provider=provider, status_code=status_code
+        )
+
+        retryable = not ok and self.retry_policies[provider].is_retryable(
+            status_code, error_code
+        )
+        return (provider, status_code, reason), ok, retryable
+
+    def _get_sender_for_provider(self, provider, src_name=None):
+        return "{} <{}>".format(
+            APP_NAME.title() if src_name is None else src_name,
+            self.config["SEND_FROM"][provider]
+        )
@@ -0,0 +1,136 @@
+import collections
+import logging
+import threading
+import time
+
+from mail_sender_daemon.state import StateBackendError
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache():
+    """
+    Thread-safe LRU cache, with an expiration time per entry
+    """
+    def __init__(self, max_size=1024):
+        """
+        :param max_size: maximum number of entries. The least recently used
+                         one is dropped when full.
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            try:
+                value, expires = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expires <= now:
+                del self._entries[key]
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl):
+        """
+        :param ttl: seconds during which the entry is valid
+        """
+        if ttl <= 0 or self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for k in keys:
+                self._entries.pop(k, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class SharedTTLCache():
+    """
+    Cache stored in a state backend, shared with the other processes using
+    it
+
+    Same interface as TTLCache. The number of entries is bounded by the
+    backend, and the statistics are counted per process. If the backend
+    cannot be reached, entries are considered missing.
+    """
+    def __init__(self, backend, namespace):
+        """
+        :param backend: state backend, as built by build_state_backend
+        :param namespace: prefix of the keys of this cache
+        """
+        self.backend = backend
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        try:
+            value = self.backend.get(self.namespace + key)
+        except StateBackendError as e:
+            logger.warning("Cannot read the shared cache: {}".format(e))
+            value = None
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl):
+        """
+        :param ttl: seconds during which the entry is valid
+        """
+        if ttl <= 0:
+            return
+        try:
+            self.backend.set(self.namespace + key, value, ttl)
+        except StateBackendError as e:
+            logger.warning("Cannot write the shared cache: {}".format(e))
+
+    def invalidate(self, *keys):
+        try:
+            self.backend.delete(*(self.namespace + k for k in keys))
+        except StateBackendError as e:
+            logger.warning("Cannot write the shared cache: {}".format(e))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": None,
+                "max_size": None,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,200 @@
+import logging
+import threading
+import time
+
+from mail_sender_daemon.state import StateBackendError
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker():
+    """
+    Stop requesting a provider which keeps failing
+
+    After ``failure_threshold`` consecutive failures, the circuit opens and
+    the provider is skipped. Once ``recovery_timeout`` seconds have passed,
+    the circuit is half-open: a limited number of trial requests are let
+    through. A success closes the circuit, a failure opens it again.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30,
+                 half_open_max_calls=1):
+        """
+        :param failure_threshold: consecutive failures opening the circuit
+        :param recovery_timeout: seconds before trying an open provider again
+        :param half_open_max_calls: trial requests allowed at the same time
+                                    when half-open
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._half_open_calls = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._get_state()
+
+    def _get_state(self):
+        """
+        Has to be called with the lock held
+        """
+        if self._state == self.OPEN and (
+                time.monotonic() - self._opened_at >= self.recovery_timeout):
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+        return self._state
+
+    def allow_request(self):
+        """
+        :returns: True if the provider can be requested
+        """
+        with self._lock:
+            state = self._get_state()
+            if state == self.CLOSED:
+                return True
+            elif state == self.HALF_OPEN:
+                if self._half_open_calls < self.half_open_max_calls:
+                    self._half_open_calls += 1
+                    return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            state = self._get_state()
+            if state == self.HALF_OPEN or (
+                    self._failures >= self.failure_threshold):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def reset(self):
+        self.record_success()
+
+    def stats(self):
+        with self._lock:
+            state = self._get_state()
+            retry_in = None
+            if state == self.OPEN:
+                retry_in = max(
+                    self._opened_at + self.recovery_timeout - time.monotonic(),
+                    0
+                )
+            return {
+                "state": state,
+                "failures": self._failures,
+                "retry_in": retry_in,
+            }
+
+
+class SharedCircuitBreaker(CircuitBreaker):
+    """
+    Circuit breaker sharing its opening through a state backend
+
+    A process opening the circuit stores until when it is open, so the other
+    processes skip the provider too, instead of learning the outage with
+    their own failures. A success closes the circuit for all of them. The
+    shared state is read at most every sync_interval seconds, and failures
+    are still counted per process.
+    """
+    def __init__(self, backend, key, sync_interval=1, **kwargs):
+        """
+        :param backend: state backend, as built by build_state_backend
+        :param key: key of the provider state
+        :param sync_interval: seconds between two reads of the shared state
+        :param kwargs: CircuitBreaker parameters
+        """
+        super().__init__(**kwargs)
+        self.backend = backend
+        self.key = key
+        self.sync_interval = sync_interval
+        self._next_sync = 0
+        #: the circuit is open in the shared state
+        self._shared_open = False
+
+    def allow_request(self):
+        self._sync()
+        return super().allow_request()
+
+    def _sync(self):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_sync:
+                return
+            self._next_sync = now + self.sync_interval
+
+        try:
+            open_until = self.backend.get(self.key)
+        except StateBackendError as e:
+            logger.warning("Cannot read the shared circuit: {}".format(e))
+            return
+
+        # wall clock, shared between the hosts
+        remaining = (
+            0 if open_until is None else float(open_until) - time.time()
+        )
+        with self._lock:
+            state = self._get_state()
+            if remaining > 0:
+                self._shared_open = True
+                if state == self.CLOSED:
+                    self._state = self.OPEN
+                    self._opened_at = (
+                        time.monotonic() - self.recovery_timeout + remaining
+                    )
+            elif self._shared_open:
+                # closed by another process
+                self._shared_open = False
+                self._state = self.CLOSED
+                self._failures = 0
+                self._opened_at = None
+
+    def record_success(self):
+        with self._lock:
+            was_open = self._shared_open or self._state != self.CLOSED
+            self._shared_open = False
+        super().record_success()
+        if was_open:
+            self._publish(None)
+
+    def record_failure(self):
+        with self._lock:
+            opened_at = self._opened_at
+        super().record_failure()
+        with self._lock:
+            opened = self._state == self.OPEN and self._opened_at != opened_at
+        if opened and self._publish(time.time() + self.recovery_timeout):
+            with self._lock:
+                self._shared_open = True
+
+    def _publish(self, open_until):
+        """
+        :param open_until: timestamp until which the circuit is open, None
+                           if closed
+        :returns: True if published
+        """
+        try:
+            if open_until is None:
+                self.backend.delete(self.key)
+            else:
+                self.backend.set(
+                    self.key, repr(open_until), self.recovery_timeout
+                )
+        except StateBackendError as e:
+            logger.warning("Cannot write the shared circuit: {}".format(e))
+            return False
+        return True
@@ -1,10 +1,13 @@
 
 import logging
 import os
+import signal
+import threading
+import time
 import yaml
 import appdirs
 
-from mail_sender_daemon import app, APP_NAME
+from mail_sender_daemon import APP_NAME
 
 logger = logging.getLogger(APP_NAME)
 
@@ -14,24 +17,33 @@ os.environ["XDG_CONFIG_DIRS"] = "/etc"
 CONFIG_DIRS = (
     appdirs.user_config_dir(APP_NAME),
     appdirs.site_config_dir(APP_NAME),
-    os.path.abspath(os.path.join(app.root_path, "../")),
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
 )
 CONFIG_FILENAME = "config.yml"
 
 
+def find_config_file(custom_path=None):
+    """
+    :returns: path of the config file to load, the last one tried if none
+              exists
+    """
+    if custom_path:
+        return custom_path
+
+    for d in CONFIG_DIRS:
+        config_path = os.path.join(d, CONFIG_FILENAME)
+        if os.path.isfile(config_path):
+            break
+    return config_path
+
+
 def build_app_config(custom_path=None):
     """
     Get config file and load it with yaml
 
     :returns: loaded config in yaml, as a dict object
     """
-    if custom_path:
-        config_path = custom_path
-    else:
-        for d in CONFIG_DIRS:
-            config_path = os.path.join(d, CONFIG_FILENAME)
-            if os.path.isfile(config_path):
-                break
+    config_path = find_config_file(custom_path)
     try:
         with open(config_path, "r") as config_file:
             return yaml.safe_load(config_file)
@@ -48,3 +60,104 @@ def build_app_config(custom_path=None):
                 "\t{}".format("\n\t".join(CONFIG_DIRS))
             )
         raise
+
+
+class ConfigReloader():
+    """
+    Reload the config file on SIGHUP, or when it is modified
+
+    The file is loaded and handed to on_reload in a background thread, so
+    the requests are not held during the reload. If loading the file or
+    on_reload fails, the error is logged and the current config is kept.
+    """
+    def __init__(self, path, on_reload, watch_interval=0):
+        """
+        :param path: config file to reload
+        :param on_reload: function applying the loaded config, raising an
+                          exception if it is invalid
+        :param watch_interval: seconds between two checks of the file
+                               modification, 0 to not watch it
+        """
+        self.path = path
+        self.on_reload = on_reload
+        self.watch_interval = watch_interval
+        self.reloads = 0
+        self.failures = 0
+
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._watcher_pid = None
+        self._file_state = self._get_file_state()
+
+    def install_signal_handler(self, signum=signal.SIGHUP):
+        """
+        Reload when the process receives signum
+
+        Has to be called from the main thread.
+
+        :returns: True if the handler is installed
+        """
+        if threading.current_thread() is not threading.main_thread():
+            logger.warning(
+                "Not in the main thread, config reload on signal disabled"
+            )
+            return False
+
+        signal.signal(signum, lambda *args: self.reload_in_background())
+        return True
+
+    def ensure_watching(self):
+        """
+        Start watching the file in this process, if watch_interval is set
+        """
+        with self._lock:
+            if not self.watch_interval or self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+
+        threading.Thread(
+            target=self._watch, name="config-watcher", daemon=True
+        ).start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.watch_interval)
+            state = self._get_file_state()
+            if state != self._file_state:
+                self._file_state = state
+                self.reload()
+
+    def _get_file_state(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def reload_in_background(self):
+        threading.Thread(
+            target=self.reload, name="config-reloader", daemon=True
+        ).start()
+
+    def reload(self):
+        """
+        :returns: True if the new config is applied
+        """
+        with self._reload_lock:
+            try:
+                with open(self.path, "r") as config_file:
+                    config = yaml.safe_load(config_file)
+                if not isinstance(config, dict):
+                    raise ValueError("the config has to be a mapping")
+                self.on_reload(config)
+            except Exception as e:
+                self.failures += 1
+                logger.error(
+                    "Cannot reload the config {}, the current one is "
+                    "kept".format(self.path), exc_info=e
+                )
+                return False
+
+            self.reloads += 1
+            logger.info("Config {} reloaded".format(self.path))
+            return True
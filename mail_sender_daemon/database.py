@@ -0,0 +1,47 @@
+"""
+SQLite databases shared by the processes of a node: jobs queue, idempotency
+keys, templates, suppression list and shared state
+"""
+
+import os
+import sqlite3
+
+__all__ = ("connect", "create_database")
+
+
+#: seconds to wait for a database locked by another connection
+TIMEOUT = 30
+
+
+def connect(path, check_same_thread=True):
+    """
+    :param check_same_thread: False to allow closing the connection from
+                              another thread
+    :returns: connection in autocommit mode, so transactions are begun
+              explicitly, returning rows as sqlite3.Row
+    """
+    conn = sqlite3.connect(
+        path, timeout=TIMEOUT, isolation_level=None,
+        check_same_thread=check_same_thread
+    )
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def create_database(path, *statements):
+    """
+    Create a database and its directory if needed, in WAL mode so reads are
+    not blocked by writes, then run the schema statements
+
+    :param statements: SQL statements creating the tables, if they do not
+                       exist
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    conn = connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        for statement in statements:
+            conn.execute(statement)
+    finally:
+        conn.close()
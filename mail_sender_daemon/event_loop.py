@@ -0,0 +1,57 @@
+import asyncio
+import os
+import threading
+
+__all__ = ("EventLoopThread", )
+
+
+class EventLoopThread():
+    """
+    Asyncio event loop running in a background thread
+
+    Lets synchronous code (the Flask views) run coroutines, while every
+    coroutine of the process shares the same loop and connections. The loop
+    is started on first use, and again in a forked process, as threads do not
+    survive a fork.
+    """
+    def __init__(self, name="event-loop"):
+        self.name = name
+        self._loop = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get_loop(self):
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._pid = os.getpid()
+                threading.Thread(
+                    target=self._run_loop, args=(self._loop, ),
+                    name=self.name, daemon=True
+                ).start()
+            return self._loop
+
+    def _run_loop(self, loop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    def run(self, coro, timeout=None):
+        """
+        Run a coroutine in the loop, and wait for its result
+
+        :param timeout: seconds to wait. The coroutine is cancelled if it
+                        does not finish in time.
+        :raises concurrent.futures.TimeoutError: on timeout
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self.get_loop())
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def stop(self):
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid():
+                self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
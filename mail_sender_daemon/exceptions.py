@@ -7,9 +7,50 @@ class MailNotSentError(Exception):
         super().__init__("mail cannot be sent")
 
 
+class PartialBatchError(Exception):
+    """
+    Batch sending stopped after some recipients were sent
+    """
+    def __init__(self, sent, response=None):
+        """
+        :param sent: recipients already sent
+        :param response: response of the failing request, None if it raised
+                         an exception, which is then the cause of this one
+        """
+        super().__init__(
+            "batch sending stopped after {} recipients".format(len(sent))
+        )
+        self.sent = sent
+        self.response = response
+
+
 class UnvalidatedAddrError(Exception):
     """
     Address not validated
     """
     def __init__(self, address):
         super().__init__("address {} is not validated".format(address))
+
+
+class InvalidConfigError(Exception):
+    """
+    Setting missing or invalid
+    """
+    def __init__(self, setting, reason="missing"):
+        super().__init__("setting {}: {}".format(setting, reason))
+
+
+class TemplateNotFoundError(Exception):
+    """
+    Template not registered
+    """
+    def __init__(self, template_id):
+        super().__init__("template {} not found".format(template_id))
+
+
+class InvalidTemplateError(Exception):
+    """
+    Template which cannot be compiled or rendered
+    """
+    def __init__(self, template_id, reason):
+        super().__init__("template {}: {}".format(template_id, reason))
@@ -0,0 +1,208 @@
+import hashlib
+import json
+import threading
+import time
+
+from mail_sender_daemon.database import connect, create_database
+
+
+class IdempotencyStore():
+    """
+    Results of the requests sent with an idempotency key, stored in a SQLite
+    database
+
+    The first request using a key reserves it until its result is stored, so
+    a concurrent duplicate waits for this result instead of sending the mail
+    again, whichever process of the node received it: reservations live in
+    the database file, not in the store object.
+    """
+    #: stored keys between two checks of max_keys
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, path, ttl=86400, max_keys=100000, lock_timeout=300):
+        """
+        :param path: path of the SQLite database
+        :param ttl: seconds during which the result of a key is kept
+        :param max_keys: maximum number of keys. The oldest ones are dropped
+                         when exceeded.
+        :param lock_timeout: seconds after which a key still reserved is
+                             considered abandoned (process crash), and can be
+                             reserved again
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.lock_timeout = lock_timeout
+
+        # wakes up the requests of this process waiting for a result
+        self._condition = threading.Condition()
+        self._reserved = 0
+        self._create_schema()
+
+    def _create_schema(self):
+        create_database(
+            self.path,
+            "CREATE TABLE IF NOT EXISTS idempotency_keys ("
+            "key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, "
+            "status INTEGER, response TEXT, "
+            "created REAL NOT NULL, updated REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS idempotency_keys_created "
+            "ON idempotency_keys (created)"
+        )
+
+    @staticmethod
+    def fingerprint(params):
+        """
+        :returns: hash of the request parameters, to detect a key reused for
+                  another request
+        """
+        return hashlib.sha256(json.dumps(
+            params, sort_keys=True, separators=(",", ":")
+        ).encode()).hexdigest()
+
+    def reserve(self, key, fingerprint):
+        """
+        Reserve a key for a request, if not already used
+
+        :returns: None if the key has been reserved, otherwise its entry, as
+                  returned by get
+        """
+        now = time.time()
+        conn = connect(self.path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT fingerprint, status, response, created, updated "
+                "FROM idempotency_keys WHERE key = ?", (key, )
+            ).fetchone()
+            if row is not None and self._is_expired(row, now):
+                conn.execute(
+                    "DELETE FROM idempotency_keys WHERE key = ?", (key, )
+                )
+                row = None
+            if row is None:
+                conn.execute(
+                    "INSERT INTO idempotency_keys "
+                    "(key, fingerprint, created, updated) VALUES (?, ?, ?, ?)",
+                    (key, fingerprint, now, now)
+                )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+        if row is not None:
+            return self._build_entry(row)
+        self._reserved += 1
+        if self._reserved % self.PRUNE_INTERVAL == 0:
+            self.prune()
+        return None
+
+    def complete(self, key, response, status):
+        """
+        Store the result of the request which reserved a key
+
+        :param response: JSON serializable response
+        :param status: HTTP status code
+        """
+        conn = connect(self.path)
+        try:
+            conn.execute(
+                "UPDATE idempotency_keys SET status = ?, response = ?, "
+                "updated = ? WHERE key = ?",
+                (status, json.dumps(response), time.time(), key)
+            )
+        finally:
+            conn.close()
+        self._notify()
+
+    def release(self, key):
+        """
+        Drop a reserved key without result, so the request can be sent again
+        """
+        conn = connect(self.path)
+        try:
+            conn.execute(
+                "DELETE FROM idempotency_keys WHERE key = ? AND "
+                "status IS NULL", (key, )
+            )
+        finally:
+            conn.close()
+        self._notify()
+
+    def get(self, key):
+        """
+        :returns: {"fingerprint", "status", "response"}, status and response
+                  being None while the key is reserved, or None if the key is
+                  unknown or expired
+        """
+        conn = connect(self.path)
+        try:
+            row = conn.execute(
+                "SELECT fingerprint, status, response, created, updated "
+                "FROM idempotency_keys WHERE key = ?", (key, )
+            ).fetchone()
+        finally:
+            conn.close()
+
+        if row is None or self._is_expired(row, time.time()):
+            return None
+        return self._build_entry(row)
+
+    def wait(self, key, timeout, poll_interval=0.1):
+        """
+        Wait for the result of a reserved key
+
+        Results stored by this process wake up the waiting requests
+        immediately, the ones stored by other processes are polled.
+
+        :returns: entry of the key, as returned by get. Still without result
+                  if timed out.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            entry = self.get(key)
+            remaining = deadline - time.monotonic()
+            if entry is None or entry["status"] is not None or remaining <= 0:
+                return entry
+            with self._condition:
+                self._condition.wait(min(poll_interval, remaining))
+
+    def prune(self):
+        """
+        Drop the expired keys, then the oldest ones above max_keys
+        """
+        now = time.time()
+        conn = connect(self.path)
+        try:
+            conn.execute(
+                "DELETE FROM idempotency_keys WHERE "
+                "(status IS NOT NULL AND created < ?) OR "
+                "(status IS NULL AND updated < ?)",
+                (now - self.ttl, now - self.lock_timeout)
+            )
+            conn.execute(
+                "DELETE FROM idempotency_keys WHERE key IN ("
+                "SELECT key FROM idempotency_keys ORDER BY created DESC "
+                "LIMIT -1 OFFSET ?)", (self.max_keys, )
+            )
+        finally:
+            conn.close()
+
+    def _is_expired(self, row, now):
+        if row["status"] is None:
+            return row["updated"] < now - self.lock_timeout
+        return row["created"] < now - self.ttl
+
+    def _build_entry(self, row):
+        return {
+            "fingerprint": row["fingerprint"],
+            "status": row["status"],
+            "response": (
+                None if row["response"] is None else
+                json.loads(row["response"])
+            ),
+        }
+
+    def _notify(self):
+        with self._condition:
+            self._condition.notify_all()
@@ -0,0 +1,264 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from mail_sender_daemon import APP_NAME
+from mail_sender_daemon.database import connect, create_database
+
+logger = logging.getLogger(APP_NAME)
+
+
+class JobQueue():
+    """
+    Durable mail queue, stored in a SQLite database
+
+    Every operation opens its own connection, so a queue can be shared
+    between threads and between processes working on the same file. Finished
+    jobs are kept ttl seconds, for their status to be checked, then dropped
+    by the workers completing the next ones.
+    """
+    #: job waiting for a worker
+    QUEUED = "queued"
+    #: job claimed by a worker
+    SENDING = "sending"
+    #: mail sent by one of the providers
+    SENT = "sent"
+    #: every provider failed to send the mail
+    FAILED = "failed"
+    #: completed jobs between two drops of the expired ones
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, path, lease_timeout=300, ttl=86400):
+        """
+        :param path: path of the SQLite database
+        :param lease_timeout: seconds after which a job still being sent is
+                              considered abandoned (worker crash) and is
+                              queued again
+        :param ttl: seconds during which a sent or failed job is kept
+        """
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self.ttl = ttl
+
+        self._completed = 0
+        self._create_schema()
+
+    def _create_schema(self):
+        create_database(
+            self.path,
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, "
+            "payload TEXT NOT NULL, details TEXT, "
+            "created REAL NOT NULL, updated REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS jobs_status_created "
+            "ON jobs (status, created)"
+        )
+
+    def put(self, mail_params):
+        """
+        Store a mail to send
+
+        :returns: job id
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = connect(self.path)
+        try:
+            conn.execute(
+                "INSERT INTO jobs (id, status, payload, created, updated) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (job_id, self.QUEUED, json.dumps(mail_params), now, now)
+            )
+        finally:
+            conn.close()
+        return job_id
+
+    def claim(self):
+        """
+        Take the oldest queued job and mark it as being sent
+
+        :returns: (job_id, mail_params), or None if the queue is empty
+        """
+        now = time.time()
+        conn = connect(self.path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id, payload FROM jobs WHERE status = ? OR "
+                "(status = ? AND updated < ?) ORDER BY created LIMIT 1",
+                (self.QUEUED, self.SENDING, now - self.lease_timeout)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, updated = ? WHERE id = ?",
+                    (self.SENDING, now, row["id"])
+                )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+        if row is None:
+            return None
+        return row["id"], json.loads(row["payload"])
+
+    def complete(self, job_id, sending_details, sent):
+        """
+        Store the sending result of a job
+
+        :param sending_details: providers details, as returned by the sender
+        :param sent: True if the mail has been sent
+        """
+        conn = connect(self.path)
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = ?, details = ?, updated = ? "
+                "WHERE id = ?", (
+                    self.SENT if sent else self.FAILED,
+                    json.dumps(sending_details), time.time(), job_id
+                )
+            )
+        finally:
+            conn.close()
+
+        self._completed += 1
+        if self._completed % self.PRUNE_INTERVAL == 0:
+            try:
+                self.prune()
+            except sqlite3.Error as e:
+                # tried again after the next jobs
+                logger.warning("Cannot drop the finished jobs", exc_info=e)
+
+    def prune(self):
+        """
+        Drop the sent and failed jobs older than ttl, with their mail
+        """
+        conn = connect(self.path)
+        try:
+            conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated < ?",
+                (self.SENT, self.FAILED, time.time() - self.ttl)
+            )
+        finally:
+            conn.close()
+
+    def get(self, job_id):
+        """
+        :returns: job status and sending details, or None if unknown
+        """
+        conn = connect(self.path)
+        try:
+            row = conn.execute(
+                "SELECT id, status, details FROM jobs WHERE id = ?", (job_id, )
+            ).fetchone()
+        finally:
+            conn.close()
+
+        if row is None:
+            return None
+        job = {"id": row["id"], "status": row["status"], "providers": []}
+        if row["details"]:
+            job.update(json.loads(row["details"]))
+        return job
+
+
+class WorkerPool():
+    """
+    Pool of threads draining a job queue
+    """
+    def __init__(self, job_queue, send_fn, workers=4, poll_interval=1):
+        """
+        :param job_queue: JobQueue to drain
+        :param send_fn: function taking the mail parameters and returning
+                        (sending_details, status)
+        :param workers: number of threads
+        :param poll_interval: seconds to wait between two checks of an empty
+                              queue. Jobs queued by this process wake up the
+                              workers immediately.
+        """
+        self.job_queue = job_queue
+        self.send_fn = send_fn
+        self.workers = workers
+        self.poll_interval = poll_interval
+
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+
+    def put(self, mail_params):
+        job_id = self.job_queue.put(mail_params)
+        self.ensure_started()
+        self._wakeup.set()
+        return job_id
+
+    def ensure_started(self):
+        """
+        Start the workers, if not already running in this process
+
+        Threads do not survive a fork, so workers are started again in a
+        forked process.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(
+                    target=self._run, name="mail-worker-{}".format(i),
+                    daemon=True
+                ) for i in range(self.workers)
+            ]
+            for t in self._threads:
+                t.start()
+            self._pid = os.getpid()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wakeup.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._pid = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = self.job_queue.claim()
+            except sqlite3.Error as e:
+                logger.error("Cannot claim a job", exc_info=e)
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            self._process(*job)
+
+    def _process(self, job_id, mail_params):
+        try:
+            sending_details, status = self.send_fn(mail_params)
+        except Exception as e:
+            logger.error("Error processing job {}".format(job_id), exc_info=e)
+            sending_details, status = {"providers": []}, 500
+
+        # the mail is not sent again if the database is locked for a while
+        while True:
+            try:
+                self.job_queue.complete(
+                    job_id, sending_details, status == 200
+                )
+                return
+            except sqlite3.Error as e:
+                logger.error(
+                    "Cannot store the result of job {}".format(job_id),
+                    exc_info=e
+                )
+            if self._stop.wait(self.poll_interval):
+                return
@@ -0,0 +1,387 @@
+"""
+Metrics, exposed in the Prometheus text format
+
+Recording a value only updates the memory of the process. When a directory is
+configured, a background thread of each process regularly writes its values in
+a file of this directory, so every process of a forking server can be
+aggregated when the metrics are exposed.
+"""
+
+import atexit
+import contextlib
+import glob
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+
+__all__ = ("Counter", "Gauge", "Histogram", "MetricsRegistry")
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{{{}}}".format(",".join(
+        '{}="{}"'.format(n, v.replace("\\", "\\\\").replace(
+            '"', '\\"').replace("\n", "\\n"))
+        for n, v in zip(names, values)
+    ))
+
+
+class _BaseMetric():
+    #: Prometheus metric type
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        :param name: metric name
+        :param documentation: help text of the metric
+        :param labelnames: names of the labels, given to each recording
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        """
+        :returns: [[labels values, value], ]
+        """
+        with self._lock:
+            return [
+                [list(k), self._copy_value(v)] for k, v in self._values.items()
+            ]
+
+    def _copy_value(self, value):
+        return value
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    @classmethod
+    def merge(cls, snapshots):
+        """
+        Merge the snapshots of several processes
+
+        :returns: {labels values: value}
+        """
+        merged = {}
+        for snapshot in snapshots:
+            for key, value in snapshot:
+                key = tuple(key)
+                if key in merged:
+                    merged[key] = cls._merge_values(merged[key], value)
+                else:
+                    merged[key] = value
+        return merged
+
+    @staticmethod
+    def _merge_values(a, b):
+        return a + b
+
+    def expose(self, merged):
+        """
+        :param merged: values, as returned by merge
+        :returns: lines of the metric, in the Prometheus text format
+        """
+        lines = [
+            "# HELP {} {}".format(self.name, self.documentation),
+            "# TYPE {} {}".format(self.name, self.type),
+        ]
+        for key, value in sorted(merged.items()):
+            lines.extend(self._expose_value(key, value))
+        return lines
+
+    def _expose_value(self, key, value):
+        yield "{}{} {}".format(
+            self.name, _format_labels(self.labelnames, key),
+            _format_value(value)
+        )
+
+
+class Counter(_BaseMetric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_BaseMetric):
+    """
+    Gauge summed between processes, such as a number of calls in progress
+
+    Values of stopped processes are ignored.
+    """
+    type = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    @contextlib.contextmanager
+    def track_in_progress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_BaseMetric):
+    type = "histogram"
+    DEFAULT_BUCKETS = (
+        0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, math.inf
+    )
+
+    def __init__(self, name, documentation, labelnames=(), buckets=None):
+        """
+        :param buckets: upper bounds of the buckets, in ascending order
+        """
+        super().__init__(name, documentation, labelnames)
+        buckets = tuple(buckets or self.DEFAULT_BUCKETS)
+        if buckets[-1] != math.inf:
+            buckets += (math.inf, )
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = {
+                    "buckets": [0] * len(self.buckets), "sum": 0, "count": 0
+                }
+            values = self._values[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    # buckets are not cumulative until exposed
+                    values["buckets"][i] += 1
+                    break
+            values["sum"] += value
+            values["count"] += 1
+
+    def _copy_value(self, value):
+        return {
+            "buckets": list(value["buckets"]), "sum": value["sum"],
+            "count": value["count"],
+        }
+
+    @staticmethod
+    def _merge_values(a, b):
+        return {
+            "buckets": [x + y for x, y in zip(a["buckets"], b["buckets"])],
+            "sum": a["sum"] + b["sum"],
+            "count": a["count"] + b["count"],
+        }
+
+    def _expose_value(self, key, value):
+        labelnames = self.labelnames + ("le", )
+        cumulated = 0
+        for bound, count in zip(self.buckets, value["buckets"]):
+            cumulated += count
+            yield "{}_bucket{} {}".format(
+                self.name,
+                _format_labels(labelnames, key + (_format_value(bound), )),
+                cumulated
+            )
+        labels = _format_labels(self.labelnames, key)
+        yield "{}_sum{} {}".format(
+            self.name, labels, _format_value(value["sum"])
+        )
+        yield "{}_count{} {}".format(self.name, labels, value["count"])
+
+
+class MetricsRegistry():
+    """
+    Metrics of the application, aggregated between processes
+
+    Each process writes its metrics in "<directory>/metrics-<pid>.json" every
+    flush_interval seconds, from a background thread. Exposed metrics are the
+    ones of the current process, summed with the last files written by the
+    other processes, so they can be late by flush_interval seconds.
+    """
+    FILENAME_PATTERN = "metrics-{}.json"
+
+    def __init__(self, directory=None, flush_interval=5):
+        """
+        :param directory: directory shared by the processes. None to only
+                          expose the metrics of the current process.
+        :param flush_interval: seconds between two writes of the metrics
+        """
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.metrics = {}
+
+        self._pid = os.getpid()
+        self._flusher = None
+        self._flusher_pid = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def configure(self, directory=None, flush_interval=5):
+        """
+        Change the settings, before the flusher is started
+
+        Same parameters as the constructor.
+        """
+        with self._lock:
+            self.directory = directory
+            self.flush_interval = flush_interval
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def ensure_started(self):
+        """
+        Start the background flusher of this process
+
+        In a forked process, the metrics inherited from the parent are
+        dropped first, as they are already counted by the parent.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                for metric in self.metrics.values():
+                    metric.reset()
+
+            if self.directory is None or self._flusher_pid == os.getpid():
+                return
+
+            os.makedirs(self.directory, exist_ok=True)
+            self._stop_event.clear()
+            self._flusher = threading.Thread(
+                target=self._run_flusher, name="metrics-flusher", daemon=True
+            )
+            self._flusher.start()
+            self._flusher_pid = os.getpid()
+            atexit.register(self.flush)
+
+    def stop(self):
+        self._stop_event.set()
+        with self._lock:
+            self._flusher = self._flusher_pid = None
+
+    def _run_flusher(self):
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except OSError:
+                # next try at the next interval
+                pass
+
+    def snapshot(self):
+        return {
+            "pid": os.getpid(),
+            "time": time.time(),
+            "metrics": {
+                name: metric.snapshot()
+                for name, metric in self.metrics.items()
+            },
+        }
+
+    def flush(self):
+        """
+        Write the metrics of this process, atomically
+        """
+        if self.directory is None:
+            return
+
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self.directory, prefix=".metrics-", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, os.path.join(
+                self.directory, self.FILENAME_PATTERN.format(os.getpid())
+            ))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _read_other_snapshots(self):
+        if self.directory is None:
+            return []
+
+        snapshots = []
+        own_path = os.path.join(
+            self.directory, self.FILENAME_PATTERN.format(os.getpid())
+        )
+        for path in glob.glob(
+                os.path.join(self.directory, self.FILENAME_PATTERN.format("*"))
+        ):
+            if path == own_path:
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                # removed or being replaced
+                continue
+        return snapshots
+
+    @staticmethod
+    def _is_running(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def collect(self):
+        """
+        :returns: {metric name: merged values of every process}
+        """
+        snapshots = [self.snapshot(), ] + self._read_other_snapshots()
+        collected = {}
+        for name, metric in self.metrics.items():
+            collected[name] = metric.merge(
+                s["metrics"].get(name, []) for s in snapshots
+                if metric.type != "gauge" or self._is_running(s["pid"])
+            )
+        return collected
+
+    def expose(self):
+        """
+        :returns: every metric, in the Prometheus text format
+        """
+        lines = []
+        for name, merged in self.collect().items():
+            lines.extend(self.metrics[name].expose(merged))
+        return "\n".join(lines) + "\n"
@@ -1,8 +1,46 @@
 
-__all__ = ("AmazonSES", "Mailgun")
+__all__ = ("AmazonSES", "Mailgun", "HTTPPool")
+
+from .pool import HTTPPool
 
 
 class _BaseProvider():
+    #: maximum number of addresses per validation status request, 0 if the
+    #: provider does not handle validation
+    max_validation_batch = 0
+    #: can send personalized mails through recipient variables
+    supports_recipient_variables = False
+    #: can send attachments and inline files
+    supports_attachments = False
+
+    def __init__(self, http_pool=None):
+        """
+        :param http_pool: HTTPPool to use for the provider requests. A
+                          default one is created if none is given.
+        """
+        self.http_pool = http_pool if http_pool is not None else HTTPPool()
+
+    def pool_stats(self):
+        return self.http_pool.stats()
+
+    def get_error_code(self, response):
+        """
+        :returns: provider error code of a failed response, None if unknown
+        """
+        return None
+
+    def cache_stats(self):
+        """
+        :returns: validation status cache statistics, None if not cached
+        """
+        return None
+
+    def get_max_send_rate(self):
+        """
+        :returns: mails per second allowed by the provider for the account
+        """
+        raise NotImplementedError
+
     def validate_addr(self, address):
         raise NotImplementedError
 
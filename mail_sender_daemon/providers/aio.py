@@ -0,0 +1,286 @@
+"""
+Asyncio counterparts of the providers
+
+Requests are built by the same code as the synchronous providers, and sent
+through aiohttp (optional dependency, installed with the "async" extra).
+"""
+
+import asyncio
+import collections
+import time
+import requests
+
+from mail_sender_daemon.exceptions import PartialBatchError
+from .amazon_ses import AmazonSES
+from .mailgun import Mailgun
+from .multipart import iter_files
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+__all__ = ("AsyncHTTPPool", "AsyncAmazonSES", "AsyncMailgun")
+
+
+class AsyncResponse():
+    """
+    Provider response, with the same attributes as a requests response
+    """
+    def __init__(self, status_code, reason, content, headers=None):
+        self.status_code = status_code
+        self.reason = reason
+        self.content = content
+        self.headers = headers or {}
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.exceptions.HTTPError(
+                "{} {}".format(self.status_code, self.reason), response=self
+            )
+
+
+class AsyncHTTPPool():
+    """
+    aiohttp session, keeping connections alive between requests
+
+    Can be shared by several providers. The session is created on first use,
+    in the event loop running the requests, and has to be used only from
+    this loop.
+    """
+    LATENCY_SAMPLES = 1000
+
+    def __init__(self, pool_size=100, keep_alive=True, max_idle=60,
+                 timeout=30):
+        """
+        :param pool_size: maximum number of connections per host
+        :param keep_alive: reuse connections between requests
+        :param max_idle: seconds after which an unused connection is closed
+        :param timeout: default timeout of each request, in seconds
+        """
+        if aiohttp is None:
+            raise ImportError(
+                "aiohttp is needed by the asynchronous providers"
+            )
+
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.max_idle = max_idle
+        self.timeout = timeout
+
+        self._session = None
+        self._in_flight = 0
+        self._requests = 0
+        self._latencies = collections.deque(maxlen=self.LATENCY_SAMPLES)
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=0, limit_per_host=self.pool_size,
+                force_close=not self.keep_alive,
+                keepalive_timeout=None if not self.keep_alive else (
+                    self.max_idle
+                ),
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def request(self, method, url, **kwargs):
+        session = self._get_session()
+        self._in_flight += 1
+        self._requests += 1
+        start = time.monotonic()
+        try:
+            async with session.request(method, url, **kwargs) as r:
+                return AsyncResponse(
+                    r.status, r.reason, await r.read(), r.headers
+                )
+        finally:
+            self._in_flight -= 1
+            self._latencies.append(time.monotonic() - start)
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+        return {
+            "pool_size": self.pool_size,
+            "keep_alive": self.keep_alive,
+            "requests": self._requests,
+            "in_flight": self._in_flight,
+            "latency_p50": (
+                latencies[len(latencies) // 2] if latencies else None
+            ),
+        }
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+class _BaseAsyncProvider():
+    async def validate_addr(self, address):
+        raise NotImplementedError
+
+    async def is_validated_addr(self, address):
+        raise NotImplementedError
+
+    async def check_addr_validation_status(self, *addresses):
+        raise NotImplementedError
+
+    async def send(self, src, to, **kwargs):
+        raise NotImplementedError
+
+
+class AsyncAmazonSES(_BaseAsyncProvider, AmazonSES):
+    def __init__(self, *args, http_pool=None, **kwargs):
+        """
+        Same parameters as AmazonSES, with an AsyncHTTPPool as http_pool
+        """
+        super().__init__(
+            *args,
+            http_pool=http_pool if http_pool is not None else AsyncHTTPPool(),
+            **kwargs
+        )
+
+    async def api_request(self, params):
+        method, request_kwargs = self.build_request(params)
+        return await self.http_pool.request(
+            method, self.api_domain, **request_kwargs
+        )
+
+    async def validate_addr(self, address):
+        return await self.api_request(
+            self.validation_strategy.build_validate_params(address)
+        )
+
+    async def is_validated_addr(self, address):
+        statuses = await self.check_addr_validation_status(address)
+        return self.validation_strategy.is_valid_addr_status(
+            statuses[address]
+        )
+
+    async def check_addr_validation_status(self, *addresses):
+        strategy = self.validation_strategy
+        statuses, missing = strategy.get_cached_statuses(*addresses)
+        if missing:
+            r = await self.api_request(
+                strategy.build_validation_status_params(*missing)
+            )
+            r.raise_for_status()
+            requested = strategy.parse_validation_statuses(
+                r.content, *missing
+            )
+            strategy.cache_statuses(requested)
+            statuses.update(requested)
+
+        return statuses
+
+    async def send(self, src, to, **kwargs):
+        to = tuple(to)
+        strategy = self.send_strategy
+        raw = strategy.is_raw_send(**kwargs)
+        if raw:
+            params = strategy.build_raw_send_params(src, to, **kwargs)
+        else:
+            params = strategy.build_send_params(src, to, **kwargs)
+        if not self.premium:
+            strategy.check_valid_statuses(
+                await self.check_addr_validation_status(*to)
+            )
+
+        if raw:
+            return await self.api_raw_request(
+                params, strategy.build_raw_message(src, to, **kwargs)
+            )
+        return await self.api_request(params)
+
+    async def api_raw_request(self, params, message):
+        # the message is generated once to sign it: not in the event loop
+        loop = asyncio.get_event_loop()
+        method, request_kwargs = await loop.run_in_executor(
+            None, self.build_raw_request, params, message
+        )
+        return await self.http_pool.request(
+            method, self.api_domain, **request_kwargs
+        )
+
+
+class AsyncMailgun(_BaseAsyncProvider, Mailgun):
+    def __init__(self, *args, http_pool=None, **kwargs):
+        """
+        Same parameters as Mailgun, with an AsyncHTTPPool as http_pool
+        """
+        super().__init__(
+            *args,
+            http_pool=http_pool if http_pool is not None else AsyncHTTPPool(),
+            **kwargs
+        )
+
+    async def send(self, src, to, recipient_variables=None, **kwargs):
+        if recipient_variables is not None:
+            return await self.send_batch(
+                src, to, recipient_variables, **kwargs
+            )
+
+        params = {}
+        self._build_headers_params(params, src, to, **kwargs)
+        self._build_content_params(params, **kwargs)
+        return await self._post_message(params, **kwargs)
+
+    async def send_batch(self, src, to, recipient_variables, **kwargs):
+        response = None
+        sent = []
+        for chunk, params in self.iter_batch_params(
+                src, to, recipient_variables, **kwargs):
+            try:
+                response = await self._post_message(params, **kwargs)
+            except Exception as e:
+                if sent:
+                    raise PartialBatchError(sent) from e
+                raise
+            if not response.ok:
+                if sent:
+                    raise PartialBatchError(sent, response)
+                break
+            sent.extend(chunk)
+
+        return response
+
+    async def _post_message(self, params, **kwargs):
+        files = {}
+        self._list_attachments_files(files, **kwargs)
+        return await self.http_pool.post(
+            self.get_send_url(), auth=aiohttp.BasicAuth("api", self.api_key),
+            data=self._build_form_data(params, files)
+        )
+
+    def _build_form_data(self, params, files):
+        """
+        :param files: {field: file}, as described by iter_files. aiohttp
+                      streams them in the request body.
+        """
+        if not files:
+            return params
+
+        form = aiohttp.FormData()
+        for k, v in params.items():
+            form.add_field(k, v)
+        for field, filename, fileobj, content_type in iter_files(files):
+            # read from the start, on a retry too
+            fileobj.seek(0)
+            form.add_field(
+                field, fileobj, filename=filename, content_type=content_type
+            )
+        return form
@@ -3,11 +3,17 @@ import base64
 import datetime
 import hashlib
 import hmac
-from bs4 import BeautifulSoup
-import requests
+import json
+import urllib.parse
 
 from mail_sender_daemon.exceptions import UnvalidatedAddrError
 from . import _BaseProvider
+from .ses_response import (
+    parse_error, parse_send_quota, parse_verification_statuses
+)
+from .mime import RawMessage, iter_base64
+from .multipart import StreamedBody
+from .sigv4 import SigV4Signer
 
 
 class _BaseAmazonSES():
@@ -41,16 +47,88 @@ class _BaseAmazonSES():
         return base64.b64encode(h.digest()).decode()
 
 
+class RawEmailBody(StreamedBody):
+    """
+    Form-encoded body of a SendRawEmail request, streamed from a RawMessage
+
+    The message is generated a first time to compute the length and hash of
+    the body, needed to sign the request, then again while being sent.
+    """
+    def __init__(self, params, message):
+        """
+        :param params: action parameters, except the message
+        :param message: RawMessage to send
+        """
+        super().__init__()
+        self.message = message
+        self._prefix = (
+            urllib.parse.urlencode(params) + "&RawMessage.Data="
+        ).encode()
+
+        payload_hash = hashlib.sha256()
+        for chunk in self.iter_chunks():
+            payload_hash.update(chunk)
+            self.len += len(chunk)
+        self.payload_hash = payload_hash.hexdigest()
+
+    def iter_chunks(self):
+        yield self._prefix
+        for chunk in iter_base64(self.message.iter_chunks(), mime=False):
+            # only characters of the base64 alphabet to escape in a form
+            yield chunk.replace(b"+", b"%2B").replace(b"/", b"%2F").replace(
+                b"=", b"%3D"
+            )
+
+
 class AmazonSES(_BaseAmazonSES, _BaseProvider):
-    def __init__(self, api_domain, premium=False, *args, **kwargs):
+    # limit of GetIdentityVerificationAttributes
+    max_validation_batch = 100
+    supports_attachments = True
+
+    def __init__(self, api_domain, premium=False, *args, http_pool=None,
+                 validation_cache=None, validation_success_ttl=3600,
+                 validation_failure_ttl=60, signature_version=3,
+                 region=None, send_raw=False, **kwargs):
         """
         param api_domain: Amazon API domain
         param premium: is the account a premium account. If premium, authorized
                        addresses will not be checked before sending it.
+        param http_pool: HTTPPool shared by the validation and send requests
+        param validation_cache: TTLCache of the addresses validation statuses.
+                                None to always request them.
+        param validation_success_ttl: seconds during which a validated address
+                                      is kept in cache
+        param validation_failure_ttl: seconds during which any other status is
+                                      kept in cache
+        param signature_version: 3 to send GET requests signed with the legacy
+                                 AWS3 algorithm, 4 to send POST requests
+                                 signed with SigV4
+        param region: AWS region, for SigV4. Guessed from api_domain if None.
+        param send_raw: send every mail as a raw MIME message (SendRawEmail),
+                        POSTed by chunks. Otherwise, only the mails with
+                        attachments or custom headers are.
         """
         self.api_domain = api_domain
         self.premium = premium
+        self.validation_cache = validation_cache
+        self.validation_success_ttl = validation_success_ttl
+        self.validation_failure_ttl = validation_failure_ttl
+        self.signature_version = signature_version
+        self.send_raw = send_raw
         super().__init__(*args, **kwargs)
+        _BaseProvider.__init__(self, http_pool=http_pool)
+
+        if signature_version == 4:
+            self.signer = SigV4Signer(
+                self._api_access_key, self._api_secret_key, api_domain,
+                region=region
+            )
+        elif signature_version == 3:
+            self.signer = None
+        else:
+            raise ValueError(
+                "unknown signature version {}".format(signature_version)
+            )
 
         self.validation_strategy = _AmazonSESValidation(self, *args, **kwargs)
         self.send_strategy = _AmazonSESSend(self, *args, **kwargs)
@@ -69,6 +147,86 @@ class AmazonSES(_BaseAmazonSES, _BaseProvider):
     def send(self, src, to, **kwargs):
         return self.send_strategy.send(src, to, **kwargs)
 
+    def cache_stats(self):
+        if self.validation_cache is None:
+            return None
+        return self.validation_cache.stats()
+
+    def get_send_quota(self):
+        """
+        :returns: sending limits of the account, as parsed by
+                  parse_send_quota
+        """
+        r = self.api_request({"Action": "GetSendQuota", })
+        r.raise_for_status()
+        return parse_send_quota(r.content)
+
+    def get_max_send_rate(self):
+        return self.get_send_quota()["max_send_rate"]
+
+    def get_error_code(self, response):
+        error = parse_error(response.content)
+        return None if error is None else error[0]
+
+    def api_request(self, params, **kwargs):
+        """
+        Request an action of the AmazonSES API
+
+        With SigV4, parameters are sent as a signed POST body. Otherwise, they
+        are sent as a GET query string, with an AWS3 signature.
+
+        :param params: action and its parameters
+        :type params: dict
+        :param kwargs: other parameters given to requests
+        """
+        method, request_kwargs = self.build_request(params)
+        request_kwargs.update(kwargs)
+        return self.http_pool.request(
+            method, self.api_domain, **request_kwargs
+        )
+
+    def build_request(self, params):
+        """
+        Sign an action of the AmazonSES API
+
+        :returns: (HTTP method, request parameters)
+        """
+        if self.signer is None:
+            return "GET", {
+                "headers": self._build_request_headers(), "params": params,
+            }
+
+        body = urllib.parse.urlencode(params).encode()
+        return "POST", {"headers": self.signer.sign(body), "data": body}
+
+    def api_raw_request(self, params, message, **kwargs):
+        """
+        Request a SendRawEmail action, streaming the message
+
+        :param params: action parameters, except the message
+        :param message: RawMessage to send
+        :param kwargs: other parameters given to requests
+        """
+        method, request_kwargs = self.build_raw_request(params, message)
+        request_kwargs.update(kwargs)
+        return self.http_pool.request(
+            method, self.api_domain, **request_kwargs
+        )
+
+    def build_raw_request(self, params, message):
+        """
+        Sign a SendRawEmail action, always sent as a POST body
+
+        :returns: (HTTP method, request parameters)
+        """
+        body = RawEmailBody(params, message)
+        if self.signer is None:
+            headers = self._build_request_headers()
+        else:
+            headers = self.signer.sign_payload_hash(body.payload_hash)
+        headers["Content-Length"] = str(body.len)
+        return "POST", {"headers": headers, "data": body}
+
 
 class _AmazonSESValidation(_BaseAmazonSES):
     def __init__(self, parent_strategy, *args, **kwargs):
@@ -83,40 +241,89 @@ class _AmazonSESValidation(_BaseAmazonSES):
         return status.lower() == "success"
 
     def check_addr_validation_status(self, *addresses):
-        r = self._validation_status_request(*addresses)
-        r.raise_for_status()
+        statuses, missing = self.get_cached_statuses(*addresses)
+        if missing:
+            requested = self._request_addr_validation_status(*missing)
+            self.cache_statuses(requested)
+            statuses.update(requested)
+
+        return statuses
 
-        soup = BeautifulSoup(r.content, "html.parser")
+    def get_cached_statuses(self, *addresses):
+        """
+        :returns: ({address: cached status}, [addresses not in cache])
+        """
+        cache = self._parent_strategy.validation_cache
+        if cache is None:
+            return {}, list(addresses)
+
+        statuses = {}
+        missing = []
+        for addr in addresses:
+            status = cache.get(addr)
+            if status is None:
+                missing.append(addr)
+            else:
+                statuses[addr] = status
+        return statuses, missing
+
+    def cache_statuses(self, statuses):
+        cache = self._parent_strategy.validation_cache
+        if cache is None:
+            return
+        for addr, status in statuses.items():
+            cache.set(addr, status, self._get_cache_ttl(status))
+
+    def _get_cache_ttl(self, status):
+        if self.is_valid_addr_status(status):
+            return self._parent_strategy.validation_success_ttl
+        return self._parent_strategy.validation_failure_ttl
+
+    def _request_addr_validation_status(self, *addresses):
+        with self._validation_status_request(*addresses) as r:
+            r.raise_for_status()
+            return self.parse_validation_statuses(
+                r.iter_content(chunk_size=8192), *addresses
+            )
+
+    def parse_validation_statuses(self, content, *addresses):
         # Unvalidated by default
         statuses = {addr: "Unvalidated" for addr in addresses}
-        for entry in soup.find_all("entry"):
-            statuses[entry.key.text] = entry.verificationstatus.text
-
+        statuses.update(parse_verification_statuses(content))
         return statuses
 
     def _validation_status_request(self, *addresses):
-        headers = self._build_request_headers()
+        params = self.build_validation_status_params(*addresses)
+        return self._parent_strategy.api_request(params, stream=True)
+
+    def build_validation_status_params(self, *addresses):
         params = {"Action": "GetIdentityVerificationAttributes", }
         params.update({
             "Identities.member.{}".format(i): address
             for i, address in enumerate(addresses, 1)
         })
+        return params
 
-        return requests.get(
-            self._parent_strategy.api_domain, headers=headers, params=params
+    def validate_addr(self, address):
+        return self._parent_strategy.api_request(
+            self.build_validate_params(address)
         )
 
-    def validate_addr(self, address):
-        headers = self._build_request_headers()
-        params = {
+    def build_validate_params(self, address):
+        """
+        Build the parameters asking for an address validation
+
+        The cached status of the address is dropped, as it will change.
+        """
+        cache = self._parent_strategy.validation_cache
+        if cache is not None:
+            cache.invalidate(address)
+
+        return {
             "Action": "VerifyEmailIdentity",
             "EmailAddress": address
         }
 
-        return requests.get(
-            self._parent_strategy.api_domain, headers=headers, params=params
-        )
-
 
 class _AmazonSESSend(_BaseAmazonSES):
     def __init__(self, parent_strategy, *args, **kwargs):
@@ -125,23 +332,93 @@ class _AmazonSESSend(_BaseAmazonSES):
 
     def send(self, src, to, **kwargs):
         to = tuple(to)
+        raw = self.is_raw_send(**kwargs)
+        if raw:
+            params = self.build_raw_send_params(src, to, **kwargs)
+        else:
+            params = self.build_send_params(src, to, **kwargs)
         if not self._parent_strategy.premium:
             self._check_every_addr_valids(*to)
 
-        headers = self._build_request_headers()
+        if raw:
+            return self._parent_strategy.api_raw_request(
+                params, self.build_raw_message(src, to, **kwargs)
+            )
+        return self._parent_strategy.api_request(params)
+
+    def is_raw_send(self, attachment=None, inline=None, headers=None,
+                    **kwargs):
+        """
+        :returns: if the mail has to be sent as a raw MIME message, as
+                  SendEmail handles neither files nor custom headers
+        """
+        return bool(
+            self._parent_strategy.send_raw or attachment or inline or headers
+        )
+
+    def build_send_params(self, src, to, template=None,
+                          template_variables=None, **kwargs):
+        """
+        :param template: name of a template stored by AmazonSES, rendered by
+                         it (SendTemplatedEmail) instead of sending text and
+                         html
+        :param template_variables: variables of the template
+        """
+        self._check_recipient_variables(**kwargs)
+
+        if template is not None:
+            params = {
+                "Action": "SendTemplatedEmail", "Template": template,
+                "TemplateData": json.dumps(template_variables or {}),
+            }
+            self._build_mail_headers_params(params, src, to, **kwargs)
+            # the subject is part of the template
+            del params["Message.Subject.Data"]
+            return params
+
         params = {"Action": "SendEmail", }
         self._build_mail_headers_params(params, src, to, **kwargs)
         self._build_mail_content_params(params, **kwargs)
+        return params
 
-        return requests.get(
-            self._parent_strategy.api_domain, headers=headers, params=params
-        )
+    def build_raw_send_params(self, src, to, **kwargs):
+        """
+        :returns: SendRawEmail parameters, except the message. Recipients
+                  are given as destinations, as Bcc ones are not written in
+                  the message.
+        """
+        self._check_recipient_variables(**kwargs)
+
+        params = {"Action": "SendRawEmail", "Source": src}
+        destinations = []
+        for k in ("to", "cc", "bcc"):
+            addresses = to if k == "to" else kwargs.get(k) or []
+            if isinstance(addresses, str):
+                addresses = (addresses, )
+            destinations.extend(addresses)
+        for i, addr in enumerate(destinations, 1):
+            params["Destinations.member.{}".format(i)] = addr
+        return params
+
+    def build_raw_message(self, src, to, **kwargs):
+        return RawMessage(src, to, **kwargs)
+
+    def _check_recipient_variables(self, recipient_variables=None,
+                                   **kwargs):
+        if recipient_variables is not None:
+            raise NotImplementedError(
+                "recipient variables are not handled by AmazonSES"
+            )
 
     def _check_every_addr_valids(self, *addresses):
-        validation_statuses = (
+        return self.check_valid_statuses(
             self._parent_strategy.check_addr_validation_status(*addresses)
         )
 
+    def check_valid_statuses(self, validation_statuses):
+        """
+        :raises UnvalidatedAddrError: if an address is not validated
+        """
         is_valid_addr_status_fn = (
             self._parent_strategy.validation_strategy.is_valid_addr_status
         )
@@ -1,17 +1,25 @@
 
+import json
 import requests
+from mail_sender_daemon.exceptions import PartialBatchError
 from . import _BaseProvider
+from .multipart import MultipartEncoder, iter_files
 
 
 class Mailgun(_BaseProvider):
+    supports_recipient_variables = True
+    supports_attachments = True
+    #: maximum number of recipients per batch sending request
+    max_batch_recipients = 1000
+
     def __init__(self, api_key, api_base_url, *args, **kwargs):
         self.api_key = api_key
         self.api_base_url = api_base_url
         super().__init__(*args, **kwargs)
 
-    def send(self, src, to, **kwargs):
-        send_url = self.get_send_url()
-        auth = requests.auth.HTTPBasicAuth("api", self.api_key)
+    def send(self, src, to, recipient_variables=None, **kwargs):
+        if recipient_variables is not None:
+            return self.send_batch(src, to, recipient_variables, **kwargs)
 
         params = {}
         self._build_headers_params(params, src, to, **kwargs)
@@ -19,7 +27,87 @@ class Mailgun(_BaseProvider):
         files = {}
         self._list_attachments_files(files, **kwargs)
 
-        return requests.post(send_url, auth=auth, data=params, files=files)
+        return self._post_message(params, files)
+
+    def send_batch(self, src, to, recipient_variables, **kwargs):
+        """
+        Send a personalized mail to each recipient
+
+        Uses the Mailgun batch sending: each "to" recipient receives its own
+        mail, in which "%recipient.<name>%" is replaced by its variables.
+        Recipients are split in chunks of max_batch_recipients, sent in one
+        request each. Sending stops at the first failing request.
+
+        :param to: address(es) of the recipient(s)
+        :type to: str or tuple
+        :param recipient_variables: {address: {name: value}}
+        :type recipient_variables: dict
+        :returns: response of the last request
+        :raises PartialBatchError: if a request fails after previous chunks
+                                   were sent, so only the rest is retried
+        """
+        files = {}
+        self._list_attachments_files(files, **kwargs)
+
+        response = None
+        sent = []
+        for chunk, params in self.iter_batch_params(
+                src, to, recipient_variables, **kwargs):
+            try:
+                response = self._post_message(params, files)
+            except Exception as e:
+                if sent:
+                    raise PartialBatchError(sent) from e
+                raise
+            if not response.ok:
+                if sent:
+                    raise PartialBatchError(sent, response)
+                break
+            sent.extend(chunk)
+
+        return response
+
+    def _post_message(self, params, files):
+        """
+        :param files: {field: file}, as described by iter_files. They are
+                      streamed in the request body, not loaded in memory.
+        """
+        data, headers = params, None
+        if files:
+            data = MultipartEncoder(params.items(), iter_files(files))
+            headers = {"Content-Type": data.content_type}
+
+        return self.http_pool.post(
+            self.get_send_url(),
+            auth=requests.auth.HTTPBasicAuth("api", self.api_key),
+            data=data, headers=headers
+        )
+
+    def iter_batch_params(self, src, to, recipient_variables, **kwargs):
+        """
+        Yield the recipients and the parameters of each batch sending
+        request, as (chunk, params)
+
+        cc and bcc are only sent with the first chunk, so they receive the
+        mail once.
+        """
+        if isinstance(to, str):
+            to = (to, )
+        to = tuple(to)
+
+        for i in range(0, len(to), self.max_batch_recipients):
+            chunk = to[i:i + self.max_batch_recipients]
+            if i:
+                kwargs = dict(kwargs, cc=None, bcc=None)
+            params = {}
+            self._build_headers_params(params, src, chunk, **kwargs)
+            self._build_content_params(params, **kwargs)
+            # every recipient needs an entry, or it receives a mail
+            # addressed to the whole chunk
+            params["recipient-variables"] = json.dumps({
+                addr: recipient_variables.get(addr, {}) for addr in chunk
+            })
+            yield chunk, params
 
     def get_send_url(self):
         return "{}/{}".format(self.api_base_url.rstrip("/"), "messages")
@@ -35,6 +123,8 @@ class Mailgun(_BaseProvider):
             params["h:Reply-To"] = ",".join(reply_to)
 
         params["subject"] = kwargs.get("subject", "No Subject")
+        for name, value in (kwargs.get("headers") or {}).items():
+            params["h:{}".format(name)] = value
 
         return params
 
@@ -56,7 +146,21 @@ class Mailgun(_BaseProvider):
 
         return params
 
-    def _build_content_params(self, params, text="", html=None, **kwargs):
+    def _build_content_params(self, params, text="", html=None,
+                              template=None, template_variables=None,
+                              **kwargs):
+        """
+        :param template: name of a template stored by Mailgun, rendered by
+                         it instead of sending text and html
+        :param template_variables: variables of the template
+        """
+        if template is not None:
+            params["template"] = template
+            params["h:X-Mailgun-Variables"] = json.dumps(
+                template_variables or {}
+            )
+            return params
+
         params["text"] = text
         if html:
             params["html"] = html
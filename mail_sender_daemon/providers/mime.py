@@ -0,0 +1,174 @@
+import base64
+import email.message
+import email.policy
+import email.utils
+import mimetypes
+import uuid
+
+from .multipart import iter_files
+
+__all__ = ("RawMessage", "iter_base64")
+
+
+def iter_base64(chunks, mime=True):
+    """
+    Encode chunks in base64, by chunks
+
+    :param chunks: iterable of bytes
+    :param mime: split the output in lines of 76 characters, ended by CRLF,
+                 as needed in a MIME part. Otherwise, the output is a single
+                 line.
+    :returns: iterator of base64 encoded bytes
+    """
+    # bytes encoded by full output lines (or groups of 3 bytes)
+    unit = 57 if mime else 3
+    remainder = b""
+    for chunk in chunks:
+        if remainder:
+            chunk = remainder + chunk
+        size = len(chunk) - len(chunk) % unit
+        remainder = chunk[size:]
+        if size:
+            yield _encode_base64(chunk[:size], mime)
+    if remainder:
+        yield _encode_base64(remainder, mime)
+
+
+def _encode_base64(data, mime):
+    if mime:
+        return base64.encodebytes(data).replace(b"\n", b"\r\n")
+    return base64.b64encode(data)
+
+
+class RawMessage():
+    """
+    MIME message, generated by chunks
+
+    The text and html contents are encoded by slices, and the files are read
+    by chunks from their start each time the message is generated, so it can
+    be generated several times (to sign it, then send it) without being kept
+    in memory.
+
+    Parts are nested as needed: multipart/alternative for the text and html
+    contents, multipart/related for the inline files (referenced in the html
+    by "cid:<filename>"), then multipart/mixed for the attachments.
+    """
+    #: bytes read at once from the files and contents. Multiple of 57, so
+    #: every chunk is encoded in full base64 lines.
+    CHUNK_SIZE = 57 * 1024
+
+    def __init__(self, src, to, cc=None, reply_to=None, subject="No Subject",
+                 text="", html=None, headers=None, attachment=None,
+                 inline=None, **kwargs):
+        """
+        Bcc addresses are not written in the message: they have to be given
+        as recipients of the sending request.
+
+        :param headers: custom headers, as {name: value}
+        :param attachment: attached files, as described by iter_files
+        :param inline: inline files, as described by iter_files
+        """
+        self.text = text or ""
+        self.html = html
+        self.attachment = list(iter_files({"attachment": attachment or []}))
+        self.inline = list(iter_files({"inline": inline or []}))
+
+        self._boundary = uuid.uuid4().hex
+        self._headers = self._build_headers(
+            src, to, cc, reply_to, subject, headers or {}
+        )
+
+    def _build_headers(self, src, to, cc, reply_to, subject, headers):
+        message = email.message.EmailMessage(policy=email.policy.SMTP)
+        message["From"] = src
+        for name, addresses in (("To", to), ("Cc", cc),
+                                ("Reply-To", reply_to)):
+            if isinstance(addresses, str):
+                addresses = (addresses, )
+            if addresses:
+                message[name] = ", ".join(addresses)
+        message["Subject"] = subject
+        message["Date"] = email.utils.formatdate(usegmt=True)
+        message["MIME-Version"] = "1.0"
+        for name, value in headers.items():
+            message[name] = str(value)
+
+        # without the blank line ending the headers
+        return message.as_bytes()[:-2]
+
+    def iter_chunks(self):
+        """
+        :returns: iterator of the message chunks, as bytes
+        """
+        yield self._headers
+        body = self._iter_body()
+        if self.inline:
+            body = self._iter_multipart("related", [body, ] + [
+                self._iter_file(*f, disposition="inline")
+                for f in self.inline
+            ])
+        if self.attachment:
+            body = self._iter_multipart("mixed", [body, ] + [
+                self._iter_file(*f, disposition="attachment")
+                for f in self.attachment
+            ])
+        yield from body
+
+    def _iter_body(self):
+        if not self.html:
+            return self._iter_text(self.text, "plain")
+        return self._iter_multipart("alternative", [
+            self._iter_text(self.text, "plain"),
+            self._iter_text(self.html, "html"),
+        ])
+
+    def _iter_multipart(self, subtype, parts):
+        boundary = "{}-{}".format(self._boundary, subtype)
+        yield 'Content-Type: multipart/{}; boundary="{}"\r\n\r\n'.format(
+            subtype, boundary
+        ).encode()
+        for part in parts:
+            yield "--{}\r\n".format(boundary).encode()
+            yield from part
+            yield b"\r\n"
+        yield "--{}--\r\n".format(boundary).encode()
+
+    def _iter_text(self, text, subtype):
+        yield self._build_part_headers(
+            "text/{}".format(subtype), charset="utf-8"
+        )
+        yield from iter_base64(
+            text[i:i + self.CHUNK_SIZE].encode()
+            for i in range(0, len(text), self.CHUNK_SIZE)
+        )
+
+    def _iter_file(self, field, filename, fileobj, content_type,
+                   disposition):
+        content_type = content_type or (
+            mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        )
+        yield self._build_part_headers(
+            content_type, disposition=disposition, filename=filename,
+            content_id=filename if disposition == "inline" else None
+        )
+
+        fileobj.seek(0)
+        yield from iter_base64(
+            iter(lambda: fileobj.read(self.CHUNK_SIZE), b"")
+        )
+
+    def _build_part_headers(self, content_type, charset=None,
+                            disposition=None, filename=None,
+                            content_id=None):
+        part = email.message.EmailMessage(policy=email.policy.SMTP)
+        part["Content-Type"] = content_type
+        if charset:
+            part.set_param("charset", charset)
+        if disposition:
+            part.add_header(
+                "Content-Disposition", disposition, filename=filename
+            )
+        if content_id:
+            part["Content-ID"] = "<{}>".format(content_id)
+        part["Content-Transfer-Encoding"] = "base64"
+        return part.as_bytes()
@@ -0,0 +1,153 @@
+import io
+import uuid
+
+__all__ = ("StreamedBody", "MultipartEncoder", "iter_files")
+
+
+def iter_files(files):
+    """
+    :param files: {field: file}, a file being a file object or a
+                  (filename, file object[, content type]) tuple, as for
+                  requests. A field can also have a list of files.
+    :returns: iterator of (field, filename, file object, content type)
+    """
+    for field, field_files in files.items():
+        if not isinstance(field_files, list):
+            field_files = [field_files, ]
+        for f in field_files:
+            if isinstance(f, tuple):
+                filename, fileobj = f[:2]
+                content_type = f[2] if len(f) > 2 else None
+            else:
+                filename = getattr(f, "name", field)
+                fileobj, content_type = f, None
+            yield field, filename, fileobj, content_type
+
+
+class StreamedBody(io.RawIOBase):
+    """
+    Request body generated by chunks while being sent
+
+    Subclasses generate the chunks in iter_chunks and set the length of the
+    body in len, so requests and aiohttp (which reads it in a thread) send
+    it with a Content-Length. It can be read once.
+    """
+    def __init__(self):
+        super().__init__()
+        self.len = 0
+        self._chunks = None
+        self._buffer = memoryview(b"")
+        self._position = 0
+
+    def iter_chunks(self):
+        """
+        :returns: iterator of the body chunks, as bytes
+        """
+        raise NotImplementedError
+
+    def __len__(self):
+        return self.len
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def readinto(self, b):
+        if self._chunks is None:
+            self._chunks = self.iter_chunks()
+
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buffer = memoryview(chunk)
+
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        self._position += size
+        return size
+
+
+class MultipartEncoder(StreamedBody):
+    """
+    multipart/form-data body, streamed from the files
+
+    requests builds multipart bodies in memory. This body is read by chunks
+    from the files (which have to be seekable) while being sent. Files are
+    read from their start, so the same files can be sent again, on a retry.
+    """
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, fields, files, boundary=None):
+        """
+        :param fields: iterable of (name, value)
+        :param files: iterable of (field, filename, file object, content
+                      type), as yielded by iter_files
+        :param boundary: parts boundary, random by default
+        """
+        super().__init__()
+        self.boundary = boundary or uuid.uuid4().hex
+        self.content_type = "multipart/form-data; boundary={}".format(
+            self.boundary
+        )
+
+        # [(headers, bytes or file object, size), ]
+        self._parts = []
+        for name, value in fields:
+            if not isinstance(value, bytes):
+                value = str(value).encode()
+            self._parts.append(
+                (self._build_part_headers(name), value, len(value))
+            )
+        for field, filename, fileobj, content_type in files:
+            fileobj.seek(0, 2)
+            self._parts.append((
+                self._build_part_headers(field, filename, content_type),
+                fileobj, fileobj.tell()
+            ))
+
+        self._end = "--{}--\r\n".format(self.boundary).encode()
+        self.len = len(self._end) + sum(
+            len(headers) + size + 2 for headers, _, size in self._parts
+        )
+
+    def _build_part_headers(self, name, filename=None, content_type=None):
+        disposition = "form-data; name={}".format(self._quote(name))
+        if filename is not None:
+            disposition += "; filename={}".format(self._quote(filename))
+        headers = "--{}\r\nContent-Disposition: {}\r\n".format(
+            self.boundary, disposition
+        )
+        if content_type:
+            headers += "Content-Type: {}\r\n".format(content_type)
+        return (headers + "\r\n").encode()
+
+    @staticmethod
+    def _quote(value):
+        """
+        Quote a header parameter, as browsers do (HTML5)
+        """
+        return '"{}"'.format(
+            value.replace("\\", "\\\\").replace('"', "%22")
+            .replace("\r", "%0D").replace("\n", "%0A")
+        )
+
+    def iter_chunks(self):
+        for headers, body, size in self._parts:
+            yield headers
+            if isinstance(body, bytes):
+                yield body
+            else:
+                body.seek(0)
+                remaining = size
+                while remaining > 0:
+                    chunk = body.read(min(self.CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise IOError("file shorter than expected")
+                    remaining -= len(chunk)
+                    yield chunk
+            yield b"\r\n"
+        yield self._end
@@ -0,0 +1,129 @@
+import collections
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HTTPPool():
+    """
+    Persistent HTTP session, keeping connections alive between requests
+
+    The underlying urllib3 pools are thread-safe, so one pool is shared by
+    every thread using a provider.
+    """
+    #: number of request latencies kept to compute the stats
+    LATENCY_SAMPLES = 1000
+
+    def __init__(self, pool_size=10, keep_alive=True, max_idle=60,
+                 timeout=30, block=False):
+        """
+        :param pool_size: maximum number of connections kept per host
+        :param keep_alive: reuse connections between requests
+        :param max_idle: seconds after which unused connections are closed,
+                         instead of being reused after the server may have
+                         dropped them. None to never close them.
+        :param timeout: default timeout of each request, in seconds
+        :param block: if the pool is full, wait for a free connection
+                      instead of opening a new one (which is then discarded)
+        """
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.block = block
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._last_used = time.monotonic()
+        self._requests = 0
+        self._closed_connections = 0
+        self._idle_resets = 0
+        self._latencies = collections.deque(maxlen=self.LATENCY_SAMPLES)
+        self._session = self._build_session()
+
+    def _build_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size, pool_maxsize=self.pool_size,
+            pool_block=self.block
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        if not self.keep_alive:
+            session.headers["Connection"] = "close"
+        return session
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        with self._lock:
+            self._close_idle_connections()
+            self._in_flight += 1
+            self._requests += 1
+            session = self._session
+
+        start = time.monotonic()
+        try:
+            return session.request(method, url, **kwargs)
+        finally:
+            end = time.monotonic()
+            with self._lock:
+                self._in_flight -= 1
+                self._last_used = end
+                self._latencies.append(end - start)
+
+    def _close_idle_connections(self):
+        """
+        Drop every pooled connection if the pool has been idle for too long
+
+        Has to be called with the lock held.
+        """
+        if self.max_idle is None or self._in_flight:
+            return
+        if time.monotonic() - self._last_used < self.max_idle:
+            return
+
+        self._closed_connections += self._count_connections()
+        self._session.close()
+        self._session = self._build_session()
+        self._idle_resets += 1
+
+    def _count_connections(self):
+        count = 0
+        # the same adapter is mounted for http and https
+        for adapter in set(self._session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                count += getattr(pools[key], "num_connections", 0)
+        return count
+
+    def stats(self):
+        """
+        :returns: usage statistics of the pool, as a dict
+        """
+        with self._lock:
+            connections = self._closed_connections + self._count_connections()
+            latencies = sorted(self._latencies)
+            return {
+                "pool_size": self.pool_size,
+                "keep_alive": self.keep_alive,
+                "requests": self._requests,
+                "in_flight": self._in_flight,
+                "connections_opened": connections,
+                "connections_reused": max(self._requests - connections, 0),
+                "idle_resets": self._idle_resets,
+                "latency_p50": (
+                    latencies[len(latencies) // 2] if latencies else None
+                ),
+            }
+
+    def close(self):
+        with self._lock:
+            self._closed_connections += self._count_connections()
+            self._session.close()
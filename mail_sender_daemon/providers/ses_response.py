@@ -0,0 +1,118 @@
+"""
+Parsing of the AmazonSES XML responses
+
+Responses are parsed incrementally: they can be fed by chunks while being
+received, and only the needed elements are kept in memory.
+"""
+
+import xml.etree.ElementTree as ET
+
+__all__ = (
+    "parse_verification_statuses", "parse_message_id", "parse_send_quota",
+    "parse_error"
+)
+
+
+def _local_name(tag):
+    """
+    Element name, without its namespace and case-insensitive
+    """
+    return tag.rsplit("}", 1)[-1].lower()
+
+
+def _iter_elements(content):
+    """
+    Yield every element once completely parsed
+
+    :param content: response body, or an iterable of chunks of it
+    :type content: bytes, str, or iterable
+    """
+    if isinstance(content, (bytes, str)):
+        content = (content, )
+
+    parser = ET.XMLPullParser(events=("end", ))
+    for chunk in content:
+        parser.feed(chunk)
+        for _, elem in parser.read_events():
+            yield _local_name(elem.tag), elem
+    parser.close()
+    for _, elem in parser.read_events():
+        yield _local_name(elem.tag), elem
+
+
+def parse_verification_statuses(content):
+    """
+    Parse a GetIdentityVerificationAttributes response
+
+    :returns: {address: verification status}
+    """
+    statuses = {}
+    key = status = None
+    for name, elem in _iter_elements(content):
+        if name == "key":
+            key = elem.text
+        elif name == "verificationstatus":
+            status = elem.text
+        elif name == "entry":
+            if key is not None and status is not None:
+                statuses[key] = status
+            key = status = None
+            # drop the parsed entry from the tree
+            elem.clear()
+
+    return statuses
+
+
+def parse_message_id(content):
+    """
+    Parse a SendEmail or SendRawEmail response
+
+    :returns: id of the sent message, None if not found
+    """
+    for name, elem in _iter_elements(content):
+        if name == "messageid":
+            return elem.text
+    return None
+
+
+def parse_send_quota(content):
+    """
+    Parse a GetSendQuota response
+
+    :returns: {"max_24_hour_send", "max_send_rate", "sent_last_24_hours"}, as
+              floats
+    """
+    fields = {
+        "max24hoursend": "max_24_hour_send",
+        "maxsendrate": "max_send_rate",
+        "sentlast24hours": "sent_last_24_hours",
+    }
+    quota = {}
+    for name, elem in _iter_elements(content):
+        if name in fields:
+            quota[fields[name]] = float(elem.text)
+    return quota
+
+
+def parse_error(content):
+    """
+    Parse an error response
+
+    :returns: (error code, error message), or None if the content is not a
+              valid error response
+    """
+    code = message = None
+    try:
+        for name, elem in _iter_elements(content):
+            if name == "code":
+                code = elem.text
+            elif name == "message":
+                message = elem.text
+            elif name == "error":
+                break
+    except ET.ParseError:
+        return None
+
+    if code is None:
+        return None
+    return code, message
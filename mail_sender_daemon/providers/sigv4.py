@@ -0,0 +1,126 @@
+import hashlib
+import hmac
+import re
+import threading
+import time
+import urllib.parse
+
+
+class SigV4Signer():
+    """
+    AWS Signature Version 4, for form-encoded POST requests to one endpoint
+
+    Everything not depending on the request is computed once: the derived
+    signing key is cached for the day, and the canonical headers template and
+    credential scope prefix are built with the signer.
+    """
+    ALGORITHM = "AWS4-HMAC-SHA256"
+    CONTENT_TYPE = "application/x-www-form-urlencoded; charset=utf-8"
+    SIGNED_HEADERS = "content-type;host;x-amz-date"
+
+    def __init__(self, access_key, secret_key, endpoint, region=None,
+                 service="ses"):
+        """
+        :param endpoint: URL of the API
+        :param region: AWS region. Guessed from the endpoint if not set
+                       (email.<region>.amazonaws.com).
+        :param service: AWS service name of the credential scope
+        """
+        self.access_key = access_key
+        self.service = service
+
+        url = urllib.parse.urlsplit(endpoint)
+        self.host = url.netloc
+        self.region = region or self.guess_region(self.host)
+        self._secret = ("AWS4" + secret_key).encode()
+        self._canonical_request_prefix = "POST\n{}\n\n".format(
+            urllib.parse.quote(url.path or "/")
+        )
+        self._canonical_headers_template = (
+            "content-type:" + self.CONTENT_TYPE + "\n" +
+            "host:" + self.host + "\n" +
+            "x-amz-date:{}\n"
+        )
+        self._scope_suffix = "/{}/{}/aws4_request".format(
+            self.region, self.service
+        )
+
+        self._lock = threading.Lock()
+        self._signing_key_date = None
+        self._signing_key = None
+
+    @staticmethod
+    def guess_region(host):
+        match = re.match(r"^email\.([a-z0-9-]+)\.amazonaws\.com", host)
+        return match.group(1) if match else "us-east-1"
+
+    def get_signing_key(self, date_stamp):
+        """
+        :param date_stamp: day of the request, as YYYYMMDD
+        :returns: signing key derived from the secret key, cached for the day
+        """
+        with self._lock:
+            if self._signing_key_date == date_stamp:
+                return self._signing_key
+
+        key = self.derive_signing_key(date_stamp)
+        with self._lock:
+            self._signing_key_date, self._signing_key = date_stamp, key
+        return key
+
+    def derive_signing_key(self, date_stamp):
+        key = self._secret
+        for msg in (date_stamp, self.region, self.service, "aws4_request"):
+            key = hmac.new(key, msg.encode(), hashlib.sha256).digest()
+        return key
+
+    def sign(self, body, timestamp=None):
+        """
+        Build the headers authenticating a POST request
+
+        :param body: form-encoded request body
+        :type body: bytes
+        :param timestamp: time of the request, as seconds since the epoch.
+                          Default to now.
+        :returns: headers to add to the request
+        """
+        return self.sign_payload_hash(
+            hashlib.sha256(body).hexdigest(), timestamp
+        )
+
+    def sign_payload_hash(self, payload_hash, timestamp=None):
+        """
+        Same as sign, from the hash of a body too large to be kept in memory
+
+        :param payload_hash: hex SHA256 of the form-encoded request body
+        """
+        amz_date = time.strftime(
+            "%Y%m%dT%H%M%SZ", time.gmtime(timestamp)
+        )
+        date_stamp = amz_date[:8]
+        scope = date_stamp + self._scope_suffix
+
+        canonical_request = "".join((
+            self._canonical_request_prefix,
+            self._canonical_headers_template.format(amz_date),
+            "\n", self.SIGNED_HEADERS, "\n", payload_hash,
+        ))
+        string_to_sign = "\n".join((
+            self.ALGORITHM, amz_date, scope,
+            hashlib.sha256(canonical_request.encode()).hexdigest(),
+        ))
+        signature = hmac.new(
+            self.get_signing_key(date_stamp), string_to_sign.encode(),
+            hashlib.sha256
+        ).hexdigest()
+
+        return {
+            "Content-Type": self.CONTENT_TYPE,
+            "X-Amz-Date": amz_date,
+            "Authorization": (
+                "{} Credential={}/{}, SignedHeaders={}, Signature={}".format(
+                    self.ALGORITHM, self.access_key, scope,
+                    self.SIGNED_HEADERS, signature
+                )
+            ),
+        }
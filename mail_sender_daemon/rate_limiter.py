@@ -0,0 +1,269 @@
+import logging
+import threading
+import time
+
+from mail_sender_daemon.state import StateBackendError
+
+__all__ = (
+    "TokenBucket", "QuotaTokenBucket", "SharedTokenBucket",
+    "SharedQuotaTokenBucket"
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket():
+    """
+    Thread-safe token bucket
+
+    Tokens are added at ``rate`` per second, up to ``burst``. A caller
+    reserves its tokens before waiting for them, so concurrent callers are
+    served in order, without waking up all together.
+    """
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: tokens added per second
+        :param burst: maximum number of tokens. Default to rate, and at least
+                      1.
+        """
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.rejections = 0
+        self.set_rate(rate, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    def set_rate(self, rate, burst=None):
+        with self._lock:
+            self.rate = rate
+            self.burst = burst or max(rate, 1)
+
+    def _refill(self):
+        """
+        Has to be called with the lock held
+        """
+        now = time.monotonic()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def reserve(self, tokens=1, max_wait=0):
+        """
+        Take tokens, possibly before they are available
+
+        :param tokens: tokens to take. Limited to burst.
+        :param max_wait: maximum seconds to wait for the tokens
+        :returns: seconds to wait before using the tokens, None if they
+                  cannot be available in max_wait seconds (nothing is taken)
+        """
+        with self._lock:
+            self._refill()
+            tokens = min(tokens, self.burst)
+            missing = tokens - self._tokens
+            if missing <= 0:
+                wait = 0
+            elif self.rate > 0:
+                wait = missing / self.rate
+            else:
+                wait = None
+
+            if wait is None or wait > max_wait:
+                self.rejections += 1
+                return None
+            if wait:
+                self.waits += 1
+            self._tokens -= tokens
+            return wait
+
+    def refund(self, tokens=1):
+        """
+        Give back reserved tokens which will not be used
+        """
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + tokens)
+
+    def acquire(self, tokens=1, max_wait=0):
+        """
+        Take tokens, waiting for them if needed
+
+        :returns: True if the tokens were taken
+        """
+        wait = self.reserve(tokens, max_wait)
+        if wait is None:
+            return False
+        if wait:
+            time.sleep(wait)
+        return True
+
+    def stats(self):
+        with self._lock:
+            self._refill()
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "tokens": self._tokens,
+                "waits": self.waits,
+                "rejections": self.rejections,
+            }
+
+
+class QuotaTokenBucket(TokenBucket):
+    """
+    Token bucket following the rate allowed by a provider
+
+    The rate is fetched in a background thread when the bucket is used, and
+    refreshed every refresh_interval seconds. The initial rate is used until
+    the first fetch succeeds.
+    """
+    #: seconds before fetching the rate again after an error
+    RETRY_INTERVAL = 60
+
+    def __init__(self, fetch_rate, rate, burst=None, refresh_interval=3600,
+                 **kwargs):
+        """
+        :param fetch_rate: function returning the allowed rate
+        :param rate: initial rate
+        :param refresh_interval: seconds between two fetches of the rate
+        :param kwargs: parameters of the parent bucket
+        """
+        self.fetch_rate = fetch_rate
+        self.refresh_interval = refresh_interval
+        # kept when the rate changes, None to follow it
+        self.configured_burst = burst
+        self._refreshing = False
+        self._next_refresh = 0
+        super().__init__(rate, burst, **kwargs)
+
+    def reserve(self, *args, **kwargs):
+        self._refresh_if_due()
+        return super().reserve(*args, **kwargs)
+
+    def _refresh_if_due(self):
+        with self._lock:
+            if self._refreshing or time.monotonic() < self._next_refresh:
+                return
+            self._refreshing = True
+
+        threading.Thread(target=self.refresh, daemon=True).start()
+
+    def refresh(self):
+        next_refresh = self.refresh_interval
+        try:
+            rate = self.fetch_rate()
+            self.set_rate(rate, self.configured_burst)
+        except Exception as e:
+            logger.error("Cannot fetch the allowed rate", exc_info=e)
+            next_refresh = min(self.RETRY_INTERVAL, self.refresh_interval)
+        finally:
+            with self._lock:
+                self._refreshing = False
+                self._next_refresh = time.monotonic() + next_refresh
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Rate limit shared through a state backend, by every process using it
+
+    Approximated by fixed windows of burst / rate seconds, in each of which
+    burst tokens can be taken: twice the burst can then be sent around the
+    end of a window. The windows follow the wall clock, which has to be
+    synchronized between the hosts. If the backend cannot be reached, the
+    rate is limited per process.
+    """
+    def __init__(self, rate, burst=None, backend=None, key="rate"):
+        """
+        :param backend: state backend, as built by build_state_backend
+        :param key: prefix of the windows counters keys
+        """
+        self.backend = backend
+        self.key = key
+        # last reservation of each thread, to refund the window it took
+        self._reservations = threading.local()
+        super().__init__(rate, burst)
+
+    def _get_window(self, now):
+        """
+        :returns: (window index, window duration), window None if the rate
+                  is 0
+        """
+        with self._lock:
+            rate, burst = self.rate, self.burst
+        if rate <= 0:
+            return None, None
+        duration = burst / rate
+        return int(now // duration), duration
+
+    def _get_window_key(self, index):
+        return "{}:{}".format(self.key, index)
+
+    def reserve(self, tokens=1, max_wait=0):
+        now = time.time()
+        index, duration = self._get_window(now)
+        with self._lock:
+            tokens = min(tokens, self.burst)
+            burst = self.burst
+
+        try:
+            while index is not None:
+                wait = max(index * duration - now, 0)
+                if wait > max_wait:
+                    break
+                key = self._get_window_key(index)
+                # kept until the end of the window
+                ttl = wait + duration + 1
+                if self.backend.incr(key, tokens, ttl) <= burst:
+                    with self._lock:
+                        if wait:
+                            self.waits += 1
+                    self._reservations.window = (key, now + ttl)
+                    return wait
+                self.backend.incr(key, -tokens, ttl)
+                index += 1
+        except StateBackendError as e:
+            logger.warning("Cannot use the shared rate limit: {}".format(e))
+            # taken from the bucket of the process
+            self._reservations.window = None
+            return super().reserve(tokens, max_wait)
+
+        with self._lock:
+            self.rejections += 1
+        return None
+
+    def refund(self, tokens=1):
+        """
+        Give back the tokens of the last reservation of this thread, which
+        will not be used, to the window they were taken from
+        """
+        try:
+            window = self._reservations.window
+        except AttributeError:
+            return
+        del self._reservations.window
+        if window is None:
+            return super().refund(tokens)
+
+        key, expires = window
+        try:
+            self.backend.incr(key, -tokens, max(expires - time.time(), 1))
+        except StateBackendError as e:
+            logger.warning("Cannot use the shared rate limit: {}".format(e))
+
+    def stats(self):
+        stats = super().stats()
+        index, _ = self._get_window(time.time())
+        if index is not None:
+            try:
+                used = int(
+                    self.backend.get(self._get_window_key(index)) or 0
+                )
+                stats["tokens"] = max(stats["burst"] - used, 0)
+            except StateBackendError:
+                pass
+        return stats
+
+
+class SharedQuotaTokenBucket(QuotaTokenBucket, SharedTokenBucket):
+    """
+    Shared rate limit, following the rate allowed by a provider
+    """
@@ -0,0 +1,119 @@
+import collections
+import random
+import threading
+import time
+
+__all__ = ("RetryPolicy", "RetryBudget")
+
+
+class RetryPolicy():
+    """
+    When and after how long a provider request is retried
+
+    Delays grow exponentially with the attempts, with a full jitter: the
+    delay is randomly picked between 0 and the exponential backoff, so
+    clients failing together do not retry together.
+    """
+    def __init__(self, max_attempts=1, base_delay=0.1, max_delay=2,
+                 retry_on=(429, 500, 502, 503, 504), retry_on_error_codes=(),
+                 retry_on_errors=True):
+        """
+        :param max_attempts: maximum number of attempts, 1 to never retry
+        :param base_delay: maximum delay before the first retry, in seconds
+        :param max_delay: maximum delay before any retry, in seconds
+        :param retry_on: retryable HTTP status codes
+        :param retry_on_error_codes: retryable provider error codes, such as
+                                     the AmazonSES "Throttling"
+        :param retry_on_errors: retry when the provider cannot be reached
+                                (connection error, timeout...)
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_on = frozenset(retry_on)
+        self.retry_on_error_codes = frozenset(retry_on_error_codes)
+        self.retry_on_errors = retry_on_errors
+
+    def is_retryable(self, status_code, error_code=None):
+        return (
+            status_code in self.retry_on or
+            error_code in self.retry_on_error_codes
+        )
+
+    def get_delay(self, attempt):
+        """
+        :param attempt: number of the failed attempt, from 1
+        :returns: seconds to wait before the next attempt
+        """
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        )
+
+
+class RetryBudget():
+    """
+    Limit the retries to a share of the requests
+
+    During an outage, every request failing would be retried, multiplying the
+    load on the failing provider. Retries are allowed as long as they do not
+    exceed ``ratio`` of the requests (mails to send) of the last ``window``
+    seconds, plus ``min_per_second`` retries per second.
+    """
+    def __init__(self, ratio=0.2, min_per_second=1, window=10):
+        """
+        :param ratio: retries allowed per request
+        :param min_per_second: retries always allowed per second, for low
+                               traffic
+        :param window: seconds during which requests and retries are counted
+        """
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        self.exhausted = 0
+
+        # [second, requests, retries], oldest first
+        self._buckets = collections.deque()
+        self._lock = threading.Lock()
+
+    def _get_bucket(self):
+        """
+        Has to be called with the lock held
+        """
+        now = int(time.monotonic())
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._buckets.popleft()
+        if not self._buckets or self._buckets[-1][0] != now:
+            self._buckets.append([now, 0, 0])
+        return self._buckets[-1]
+
+    def record_request(self):
+        with self._lock:
+            self._get_bucket()[1] += 1
+
+    def withdraw(self):
+        """
+        Take a retry from the budget
+
+        :returns: True if the retry is allowed
+        """
+        with self._lock:
+            bucket = self._get_bucket()
+            requests = sum(b[1] for b in self._buckets)
+            retries = sum(b[2] for b in self._buckets)
+            allowed = (
+                self.min_per_second * self.window + self.ratio * requests
+            )
+            if retries + 1 > allowed:
+                self.exhausted += 1
+                return False
+            bucket[2] += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            self._get_bucket()
+            return {
+                "requests": sum(b[1] for b in self._buckets),
+                "retries": sum(b[2] for b in self._buckets),
+                "exhausted": self.exhausted,
+            }
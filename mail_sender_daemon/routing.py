@@ -0,0 +1,168 @@
+import random
+import threading
+
+__all__ = (
+    "ProviderStats", "StaticRoutingPolicy", "WeightedRoutingPolicy",
+    "LatencyAwareRoutingPolicy", "ROUTING_POLICIES", "build_routing_policy"
+)
+
+
+class ProviderStats():
+    """
+    Exponentially weighted moving averages of a provider latency and success
+    rate
+    """
+    def __init__(self, alpha=0.2):
+        """
+        :param alpha: weight of a new sample, between 0 and 1
+        """
+        self.alpha = alpha
+        self.latency = None
+        self.success_rate = None
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency, success):
+        """
+        :param latency: request duration, in seconds
+        :param success: True if the provider handled the request
+        """
+        with self._lock:
+            success = 1.0 if success else 0.0
+            if self.samples == 0:
+                self.latency = latency
+                self.success_rate = success
+            else:
+                self.latency += self.alpha * (latency - self.latency)
+                self.success_rate += self.alpha * (
+                    success - self.success_rate
+                )
+            self.samples += 1
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "latency": self.latency,
+                "success_rate": self.success_rate,
+                "samples": self.samples,
+            }
+
+
+class _BaseRoutingPolicy():
+    """
+    Decide in which order the providers are tried for each mail
+    """
+    #: name of the policy in the configuration
+    name = None
+
+    def __init__(self, ewma_alpha=0.2):
+        self.ewma_alpha = ewma_alpha
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def get_stats(self, provider):
+        with self._lock:
+            if provider not in self.stats:
+                self.stats[provider] = ProviderStats(self.ewma_alpha)
+            return self.stats[provider]
+
+    def record(self, provider, latency, success):
+        self.get_stats(provider).record(latency, success)
+
+    def order(self, providers):
+        """
+        :param providers: providers names, in the configuration order
+        :returns: list of providers names, in the order to try them
+        """
+        raise NotImplementedError
+
+
+class StaticRoutingPolicy(_BaseRoutingPolicy):
+    """
+    Always try the providers in the configuration order
+    """
+    name = "static"
+
+    def order(self, providers):
+        return list(providers)
+
+
+class WeightedRoutingPolicy(_BaseRoutingPolicy):
+    """
+    Spread the mails between providers, proportionally to their weight
+
+    The first provider is randomly picked depending on the weights, then the
+    next one between the remaining providers, and so on.
+    """
+    name = "weighted"
+
+    def __init__(self, weights=None, adaptive=False, *args, **kwargs):
+        """
+        :param weights: {provider: weight}. Missing providers have a weight
+                        of 1.
+        :param adaptive: multiply the weights by the providers success rate
+        """
+        self.weights = weights or {}
+        self.adaptive = adaptive
+        super().__init__(*args, **kwargs)
+
+    def get_weight(self, provider):
+        weight = self.weights.get(provider, 1)
+        if self.adaptive:
+            success_rate = self.get_stats(provider).success_rate
+            if success_rate is not None:
+                # keep a small weight, to notice when it recovers
+                weight *= max(success_rate, 0.01)
+        return weight
+
+    def order(self, providers):
+        remaining = [(p, self.get_weight(p)) for p in providers]
+        ordered = []
+        while remaining:
+            pick = random.random() * sum(w for _, w in remaining)
+            for i, (p, w) in enumerate(remaining):
+                if pick < w or i == len(remaining) - 1:
+                    ordered.append(p)
+                    del remaining[i]
+                    break
+                pick -= w
+        return ordered
+
+
+class LatencyAwareRoutingPolicy(_BaseRoutingPolicy):
+    """
+    Try first the provider with the best latency and success rate
+
+    Providers without any sample yet are tried first, to learn their
+    performance.
+    """
+    name = "latency"
+
+    def get_score(self, provider):
+        stats = self.get_stats(provider)
+        if not stats.samples:
+            return 0
+        # a provider failing half of the time is as bad as one twice slower
+        return stats.latency / max(stats.success_rate, 0.01)
+
+    def order(self, providers):
+        return sorted(providers, key=self.get_score)
+
+
+ROUTING_POLICIES = {
+    policy.name: policy for policy in (
+        StaticRoutingPolicy, WeightedRoutingPolicy, LatencyAwareRoutingPolicy
+    )
+}
+
+
+def build_routing_policy(name="static", **kwargs):
+    """
+    :param name: name of the policy, in ROUTING_POLICIES
+    :param kwargs: policy parameters
+    """
+    try:
+        policy_class = ROUTING_POLICIES[name]
+    except KeyError:
+        raise ValueError("unknown routing policy {}".format(name))
+    return policy_class(**kwargs)
@@ -0,0 +1,447 @@
+"""
+State shared between the processes and nodes of the daemon
+
+Backends store string values with an expiration time, and counters updated
+atomically. They are used to share the addresses validation statuses, the
+providers health and the rate limits, so what a process learns saves the
+others requests to the providers.
+"""
+
+import collections
+import os
+import socket
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+from mail_sender_daemon.database import connect
+
+__all__ = (
+    "StateBackendError", "MemoryStateBackend", "SQLiteStateBackend",
+    "RedisStateBackend", "build_state_backend"
+)
+
+
+class StateBackendError(Exception):
+    """
+    The backend cannot be reached, or refused the operation
+
+    Users of the shared state fall back to what they know locally.
+    """
+
+
+class _BaseStateBackend():
+    name = None
+
+    def get(self, key):
+        """
+        :returns: value of the key, or None if unknown or expired
+        """
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        """
+        :param value: value to store, as str
+        :param ttl: seconds during which the value is kept
+        """
+        raise NotImplementedError
+
+    def delete(self, *keys):
+        raise NotImplementedError
+
+    def incr(self, key, amount, ttl):
+        """
+        Atomically add an amount to a counter, created at 0 if unknown
+
+        :param ttl: seconds during which the counter is kept, from now
+        :returns: new value of the counter
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryStateBackend(_BaseStateBackend):
+    """
+    State kept in the process: not shared, but with the same interface
+    """
+    name = "memory"
+
+    def __init__(self, max_size=100000):
+        """
+        :param max_size: maximum number of keys. The least recently used one
+                         is dropped when full.
+        """
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key, now):
+        """
+        Has to be called with the lock held
+        """
+        try:
+            value, expires = self._entries[key]
+        except KeyError:
+            return None
+        if expires <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set(self, key, value, expires):
+        """
+        Has to be called with the lock held
+        """
+        self._entries[key] = (value, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key, time.monotonic())
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._set(key, value, time.monotonic() + ttl)
+
+    def delete(self, *keys):
+        with self._lock:
+            for k in keys:
+                self._entries.pop(k, None)
+
+    def incr(self, key, amount, ttl):
+        now = time.monotonic()
+        with self._lock:
+            value = int(self._get(key, now) or 0) + amount
+            self._set(key, str(value), now + ttl)
+        return value
+
+
+class SQLiteStateBackend(_BaseStateBackend):
+    """
+    State stored in a SQLite database, shared by the processes of a host
+
+    Unlike the jobs queue, reads are done on every sending: each thread keeps
+    its connection open, and the database is read through a memory map.
+    Values are not synced to the disk, as they can be learned again.
+    """
+    name = "sqlite"
+    #: writes between two deletions of the expired keys
+    PRUNE_INTERVAL = 1000
+
+    def __init__(self, path, mmap_size=64 * 1024 * 1024):
+        """
+        :param path: path of the SQLite database
+        :param mmap_size: bytes of the database read through a memory map
+        """
+        self.path = path
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+        # [(pid, thread, connection)], to close the connections of every
+        # thread
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._writes = 0
+
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(dirname, exist_ok=True)
+        self._query(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires REAL NOT NULL)"
+        )
+
+    def _connect(self):
+        # connections cannot be used in a forked process
+        if getattr(self._local, "pid", None) != os.getpid():
+            # only used by this thread, but closed by the one calling close
+            conn = connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("PRAGMA mmap_size={:d}".format(self.mmap_size))
+            self._local.conn, self._local.pid = conn, os.getpid()
+            self._register(conn)
+        return self._local.conn
+
+    def _register(self, conn):
+        """
+        Add a connection of the current thread to the registry, and drop
+        the ones of the threads which ended
+        """
+        pid = os.getpid()
+        with self._connections_lock:
+            # connections of a parent process are left to it
+            connections = [c for c in self._connections if c[0] == pid]
+            ended = [c for c in connections if not c[1].is_alive()]
+            self._connections = [
+                c for c in connections if c[1].is_alive()
+            ] + [(pid, threading.current_thread(), conn)]
+        for _, _, ended_conn in ended:
+            ended_conn.close()
+
+    def _query(self, sql, parameters=()):
+        try:
+            return self._connect().execute(sql, parameters)
+        except sqlite3.Error as e:
+            raise StateBackendError(str(e)) from e
+
+    def _transaction(self, fn):
+        """
+        :param fn: function taking the connection, called in a transaction
+                   locking the database
+        :returns: fn result
+        """
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            raise StateBackendError(str(e)) from e
+        return result
+
+    def _count_write(self):
+        self._writes += 1
+        if self._writes % self.PRUNE_INTERVAL == 0:
+            self._query(
+                "DELETE FROM state WHERE expires <= ?", (time.time(), )
+            )
+
+    def get(self, key):
+        row = self._query(
+            "SELECT value FROM state WHERE key = ? AND expires > ?",
+            (key, time.time())
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def set(self, key, value, ttl):
+        self._query(
+            "INSERT OR REPLACE INTO state (key, value, expires) "
+            "VALUES (?, ?, ?)", (key, value, time.time() + ttl)
+        )
+        self._count_write()
+
+    def delete(self, *keys):
+        if keys:
+            self._query(
+                "DELETE FROM state WHERE key IN ({})".format(
+                    ", ".join("?" * len(keys))
+                ), keys
+            )
+
+    def incr(self, key, amount, ttl):
+        def update(conn):
+            now = time.time()
+            row = conn.execute(
+                "SELECT value FROM state WHERE key = ? AND expires > ?",
+                (key, now)
+            ).fetchone()
+            value = (0 if row is None else int(row[0])) + amount
+            conn.execute(
+                "INSERT OR REPLACE INTO state (key, value, expires) "
+                "VALUES (?, ?, ?)", (key, str(value), now + ttl)
+            )
+            return value
+
+        value = self._transaction(update)
+        self._count_write()
+        return value
+
+    def close(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for pid, _, conn in connections:
+            if pid == os.getpid():
+                conn.close()
+
+
+class _RedisConnection():
+    """
+    Connection to a server speaking the Redis protocol (RESP)
+    """
+    def __init__(self, host, port, timeout, password=None, db=0):
+        self.sock = socket.create_connection((host, port), timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+
+        commands = []
+        if password:
+            commands.append(("AUTH", password))
+        if db:
+            commands.append(("SELECT", db))
+        for reply in self.execute(*commands):
+            if isinstance(reply, StateBackendError):
+                self.close()
+                raise reply
+
+    def execute(self, *commands):
+        """
+        Send commands at once (pipelining), then read their replies
+
+        :param commands: tuples of command arguments
+        :returns: [reply, ], with a StateBackendError for error replies
+        """
+        if not commands:
+            return []
+        self.sock.sendall(b"".join(self._pack(c) for c in commands))
+        return [self._read_reply() for _ in commands]
+
+    @staticmethod
+    def _pack(command):
+        parts = [b"*%d\r\n" % len(command)]
+        for arg in command:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    def _read_reply(self):
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("connection closed by the server")
+        prefix, value = line[:1], line[1:-2]
+        if prefix == b"+":
+            return value.decode()
+        elif prefix == b"-":
+            return StateBackendError(value.decode())
+        elif prefix == b":":
+            return int(value)
+        elif prefix == b"$":
+            if int(value) < 0:
+                return None
+            data = self.reader.read(int(value) + 2)
+            return data[:-2].decode()
+        elif prefix == b"*":
+            if int(value) < 0:
+                return None
+            return [self._read_reply() for _ in range(int(value))]
+        raise ConnectionError("invalid reply {!r}".format(line))
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+class RedisStateBackend(_BaseStateBackend):
+    """
+    State stored in a server speaking the Redis protocol, shared by the nodes
+    of a cluster
+
+    Only basic commands are used (GET, SET, DEL, INCRBY, PEXPIRE), so any
+    compatible server can be used. Connections are kept in a pool.
+    """
+    name = "redis"
+
+    def __init__(self, url="redis://localhost:6379/0", prefix="mail-sender:",
+                 timeout=1, pool_size=16):
+        """
+        :param url: redis://[:password@]host[:port][/db]
+        :param prefix: prefix of the keys, to share a database
+        :param timeout: seconds to wait for the server
+        :param pool_size: maximum number of idle connections kept
+        """
+        url = urllib.parse.urlsplit(url)
+        self.host = url.hostname or "localhost"
+        self.port = url.port or 6379
+        self.db = int(url.path.strip("/") or 0)
+        self.password = url.password
+        self.prefix = prefix
+        self.timeout = timeout
+        self.pool_size = pool_size
+
+        self._pool = collections.deque()
+        self._pool_pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _get_connection(self):
+        with self._lock:
+            # connections cannot be shared with a forked process
+            if self._pool_pid != os.getpid():
+                self._pool.clear()
+                self._pool_pid = os.getpid()
+            if self._pool:
+                return self._pool.pop()
+        return _RedisConnection(
+            self.host, self.port, self.timeout, self.password, self.db
+        )
+
+    def _release_connection(self, conn):
+        with self._lock:
+            if self._pool_pid == os.getpid() and (
+                    len(self._pool) < self.pool_size):
+                self._pool.append(conn)
+                return
+        conn.close()
+
+    def _execute(self, *commands):
+        try:
+            conn = self._get_connection()
+            try:
+                replies = conn.execute(*commands)
+            except BaseException:
+                conn.close()
+                raise
+        except (OSError, ValueError) as e:
+            raise StateBackendError(
+                "{}:{}: {}".format(self.host, self.port, e)
+            ) from e
+
+        self._release_connection(conn)
+        for reply in replies:
+            if isinstance(reply, StateBackendError):
+                raise reply
+        return replies
+
+    def _ms(self, ttl):
+        return max(int(ttl * 1000), 1)
+
+    def get(self, key):
+        return self._execute(("GET", self.prefix + key))[0]
+
+    def set(self, key, value, ttl):
+        self._execute(("SET", self.prefix + key, value, "PX", self._ms(ttl)))
+
+    def delete(self, *keys):
+        if keys:
+            self._execute(("DEL", ) + tuple(self.prefix + k for k in keys))
+
+    def incr(self, key, amount, ttl):
+        key = self.prefix + key
+        return self._execute(
+            ("INCRBY", key, amount), ("PEXPIRE", key, self._ms(ttl))
+        )[0]
+
+    def close(self):
+        with self._lock:
+            connections, self._pool = list(self._pool), collections.deque()
+        for conn in connections:
+            conn.close()
+
+
+STATE_BACKENDS = {
+    backend.name: backend for backend in (
+        MemoryStateBackend, SQLiteStateBackend, RedisStateBackend
+    )
+}
+
+
+def build_state_backend(backend="memory", **kwargs):
+    """
+    :param backend: name of the backend, in STATE_BACKENDS
+    :param kwargs: backend parameters
+    """
+    try:
+        backend_class = STATE_BACKENDS[backend]
+    except KeyError:
+        raise ValueError("unknown state backend {}".format(backend))
+    return backend_class(**kwargs)
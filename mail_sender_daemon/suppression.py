@@ -0,0 +1,273 @@
+"""
+Addresses which must not receive mails anymore (bounces, complaints...)
+
+Every recipient of every mail is checked, so the list is read through a
+Bloom filter kept in memory: most addresses are not suppressed, and are
+answered without reading the database.
+"""
+
+import hashlib
+import math
+import threading
+import time
+
+from mail_sender_daemon.database import connect, create_database
+
+__all__ = ("BloomFilter", "SuppressionList")
+
+
+class BloomFilter():
+    """
+    Set of strings which can answer "maybe in the set" for strings never
+    added (false positives), but never "not in the set" for added ones
+
+    Holds a few bits per string whatever its length: about 1.8 MB for a
+    million strings at a 0.1% false positive rate.
+    """
+    def __init__(self, capacity, error_rate=0.001):
+        """
+        :param capacity: number of strings above which the false positive
+                         rate exceeds error_rate
+        :param error_rate: false positive rate, when holding capacity strings
+        """
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.size = max(int(math.ceil(
+            -self.capacity * math.log(error_rate) / math.log(2) ** 2
+        )), 8)
+        self.hashes = max(
+            int(round(self.size / self.capacity * math.log(2))), 1
+        )
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # double hashing: the k positions are derived from 2 hashes
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        bits = self._bits
+        for position in self._positions(item):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self._bits
+        for position in self._positions(item):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class SuppressionList():
+    """
+    Suppressed addresses, stored in a SQLite database, and indexed in memory
+    by a Bloom filter
+
+    Addresses are compared case-insensitively. The filter is loaded from the
+    database on first check, then follows the addresses added by other
+    processes every sync_interval seconds. Removed addresses stay in the
+    filter until it is rebuilt: they only cost a database lookup.
+    """
+    #: maximum number of addresses per database query
+    CHUNK_SIZE = 500
+
+    def __init__(self, path, capacity=1000000, error_rate=0.001,
+                 sync_interval=1):
+        """
+        :param path: path of the SQLite database
+        :param capacity: expected number of addresses. The filter is rebuilt
+                         twice as large when exceeded.
+        :param error_rate: rate of the not suppressed addresses looked up in
+                           the database
+        :param sync_interval: seconds between two reads of the addresses
+                              added by other processes
+        """
+        self.path = path
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+
+        self._bloom_filter = None
+        self._last_id = 0
+        self._next_sync = 0
+        self._lock = threading.Lock()
+        self._create_schema()
+
+    def _create_schema(self):
+        # ids only increase, so other processes can read the new rows
+        create_database(
+            self.path,
+            "CREATE TABLE IF NOT EXISTS suppressions ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "address TEXT NOT NULL UNIQUE, reason TEXT, "
+            "created REAL NOT NULL)"
+        )
+
+    @staticmethod
+    def normalize(address):
+        return address.strip().lower()
+
+    def _sync(self):
+        """
+        Load the addresses added since the last sync in the filter, and
+        build it on first call
+        """
+        now = time.monotonic()
+        if now < self._next_sync:
+            return
+        with self._lock:
+            if now < self._next_sync:
+                return
+            if self._bloom_filter is None:
+                self._bloom_filter = BloomFilter(
+                    self.capacity, self.error_rate
+                )
+
+            conn = connect(self.path)
+            try:
+                for row in conn.execute(
+                        "SELECT id, address FROM suppressions WHERE id > ? "
+                        "ORDER BY id", (self._last_id, )):
+                    self._bloom_filter.add(row["address"])
+                    self._last_id = row["id"]
+            finally:
+                conn.close()
+
+            if self._bloom_filter.count > self._bloom_filter.capacity:
+                self._rebuild(self._bloom_filter.count * 2)
+            self._next_sync = time.monotonic() + self.sync_interval
+
+    def _rebuild(self, capacity):
+        """
+        Has to be called with the lock held
+        """
+        bloom_filter = BloomFilter(capacity, self.error_rate)
+        conn = connect(self.path)
+        try:
+            for row in conn.execute("SELECT id, address FROM suppressions"):
+                bloom_filter.add(row["address"])
+                self._last_id = max(self._last_id, row["id"])
+        finally:
+            conn.close()
+        self._bloom_filter = bloom_filter
+
+    def check(self, *addresses):
+        """
+        :returns: {address, } of the given addresses which are suppressed
+        """
+        self._sync()
+        candidates = {}
+        for address in addresses:
+            normalized = self.normalize(address)
+            if normalized in self._bloom_filter:
+                candidates.setdefault(normalized, []).append(address)
+        if not candidates:
+            return set()
+
+        suppressed = set()
+        normalized = list(candidates)
+        conn = connect(self.path)
+        try:
+            for i in range(0, len(normalized), self.CHUNK_SIZE):
+                chunk = normalized[i:i + self.CHUNK_SIZE]
+                for row in conn.execute(
+                        "SELECT address FROM suppressions WHERE address IN "
+                        "({})".format(", ".join("?" * len(chunk))), chunk):
+                    suppressed.update(candidates[row["address"]])
+        finally:
+            conn.close()
+        return suppressed
+
+    def add(self, addresses, reason=None):
+        """
+        Suppress addresses, or update their reason
+
+        :param addresses: iterable of addresses, or of (address, reason)
+        :param reason: reason of the addresses given alone
+        :returns: number of addresses added or updated
+        """
+        count = 0
+        chunk = []
+        conn = connect(self.path)
+        try:
+            for address in addresses:
+                if not isinstance(address, str):
+                    address, address_reason = address
+                else:
+                    address_reason = reason
+                chunk.append((self.normalize(address), address_reason))
+                if len(chunk) >= self.CHUNK_SIZE:
+                    count += self._insert(conn, chunk)
+                    chunk = []
+            if chunk:
+                count += self._insert(conn, chunk)
+        finally:
+            conn.close()
+        return count
+
+    def _insert(self, conn, rows):
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO suppressions (address, reason, created) "
+                "VALUES (?, ?, ?) ON CONFLICT (address) DO UPDATE SET "
+                "reason = excluded.reason",
+                ((address, reason, now) for address, reason in rows)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        # checked from now on by this process
+        self._next_sync = 0
+        return len(rows)
+
+    def remove(self, *addresses):
+        """
+        :returns: number of removed addresses
+        """
+        if not addresses:
+            return 0
+        conn = connect(self.path)
+        try:
+            return conn.execute(
+                "DELETE FROM suppressions WHERE address IN ({})".format(
+                    ", ".join("?" * len(addresses))
+                ), [self.normalize(a) for a in addresses]
+            ).rowcount
+        finally:
+            conn.close()
+
+    def get(self, address):
+        """
+        :returns: {"address", "reason", "created"}, or None if not suppressed
+        """
+        conn = connect(self.path)
+        try:
+            row = conn.execute(
+                "SELECT address, reason, created FROM suppressions "
+                "WHERE address = ?", (self.normalize(address), )
+            ).fetchone()
+        finally:
+            conn.close()
+        return None if row is None else dict(row)
+
+    def __iter__(self):
+        """
+        Yield every suppressed address, as {"address", "reason", "created"},
+        without loading them all in memory
+        """
+        conn = connect(self.path)
+        try:
+            for row in conn.execute(
+                    "SELECT address, reason, created FROM suppressions "
+                    "ORDER BY id"):
+                yield dict(row)
+        finally:
+            conn.close()
@@ -0,0 +1,215 @@
+import json
+import time
+import jinja2
+from jinja2.sandbox import SandboxedEnvironment
+
+from mail_sender_daemon.cache import TTLCache
+from mail_sender_daemon.database import connect, create_database
+from mail_sender_daemon.exceptions import (
+    InvalidTemplateError, TemplateNotFoundError
+)
+
+__all__ = ("TemplateStore", "TemplateRenderer")
+
+
+class TemplateStore():
+    """
+    Mail templates, stored in a SQLite database
+
+    Each update of a template gives it a new revision, never reused even if
+    the template is deleted then registered again, so the renderers of every
+    process can tell whether their compiled copy is still current.
+    """
+    def __init__(self, path):
+        """
+        :param path: path of the SQLite database
+        """
+        self.path = path
+        self._create_schema()
+
+    def _create_schema(self):
+        create_database(
+            self.path,
+            "CREATE TABLE IF NOT EXISTS templates ("
+            "revision INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "id TEXT NOT NULL UNIQUE, subject TEXT, text TEXT, html TEXT, "
+            "provider_templates TEXT, updated REAL NOT NULL)"
+        )
+
+    def put(self, template_id, subject=None, text=None, html=None,
+            provider_templates=None):
+        """
+        Register a template, or replace it
+
+        :param subject: subject, text and html are Jinja2 templates
+        :param provider_templates: {provider: name of a template stored by
+                                   the provider}, used instead of rendering
+                                   the mail for this provider
+        :returns: (revision, True if the template is new)
+        """
+        conn = connect(self.path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            created = conn.execute(
+                "SELECT 1 FROM templates WHERE id = ?", (template_id, )
+            ).fetchone() is None
+            revision = conn.execute(
+                "INSERT OR REPLACE INTO templates (id, subject, text, html, "
+                "provider_templates, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    template_id, subject, text, html,
+                    json.dumps(provider_templates or {}), time.time()
+                )
+            ).lastrowid
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return revision, created
+
+    def get(self, template_id):
+        """
+        :returns: {"id", "revision", "subject", "text", "html",
+                  "provider_templates", "updated"}, or None if unknown
+        """
+        conn = connect(self.path)
+        try:
+            row = conn.execute(
+                "SELECT * FROM templates WHERE id = ?", (template_id, )
+            ).fetchone()
+        finally:
+            conn.close()
+
+        if row is None:
+            return None
+        template = dict(row)
+        template["provider_templates"] = json.loads(
+            template["provider_templates"]
+        )
+        return template
+
+    def get_revision(self, template_id):
+        """
+        :returns: current revision of a template, or None if unknown
+        """
+        conn = connect(self.path)
+        try:
+            row = conn.execute(
+                "SELECT revision FROM templates WHERE id = ?", (template_id, )
+            ).fetchone()
+        finally:
+            conn.close()
+        return None if row is None else row[0]
+
+    def delete(self, template_id):
+        """
+        :returns: if the template existed
+        """
+        conn = connect(self.path)
+        try:
+            return conn.execute(
+                "DELETE FROM templates WHERE id = ?", (template_id, )
+            ).rowcount > 0
+        finally:
+            conn.close()
+
+    def list(self):
+        """
+        :returns: [{"id", "revision", "updated"}, ], sorted by id
+        """
+        conn = connect(self.path)
+        try:
+            return [dict(row) for row in conn.execute(
+                "SELECT id, revision, updated FROM templates ORDER BY id"
+            )]
+        finally:
+            conn.close()
+
+
+class TemplateRenderer():
+    """
+    Render the stored templates, compiled once per revision
+
+    Templates come from the API clients, so they are run in the Jinja2
+    sandbox, and a missing variable is an error instead of an empty string.
+    Compiled templates are kept in a LRU cache by revision: a rendering only
+    reads the current revision of its template from the store, so updates
+    done by other processes are seen at once.
+    """
+    FIELDS = ("subject", "text", "html")
+
+    def __init__(self, store, cache_size=256, cache_ttl=3600):
+        """
+        :param store: TemplateStore
+        :param cache_size: maximum number of compiled templates kept
+        :param cache_ttl: seconds during which a compiled template is kept
+        """
+        self.store = store
+        self.cache = TTLCache(cache_size)
+        self.cache_ttl = cache_ttl
+
+        text_environment = SandboxedEnvironment(
+            undefined=jinja2.StrictUndefined, keep_trailing_newline=True
+        )
+        self._environments = {
+            "subject": text_environment,
+            "text": text_environment,
+            "html": SandboxedEnvironment(
+                autoescape=True, undefined=jinja2.StrictUndefined,
+                keep_trailing_newline=True
+            ),
+        }
+
+    def compile(self, template):
+        """
+        :param template: template, as returned by TemplateStore.get
+        :returns: {field: compiled template}, for the fields set
+        :raises InvalidTemplateError: if a field is not a valid template
+        """
+        compiled = {}
+        for field in self.FIELDS:
+            if template.get(field, None) is None:
+                continue
+            try:
+                compiled[field] = self._environments[field].from_string(
+                    template[field]
+                )
+            except jinja2.TemplateSyntaxError as e:
+                raise InvalidTemplateError(
+                    template["id"], "{}, line {}: {}".format(
+                        field, e.lineno, e.message
+                    )
+                )
+        return compiled
+
+    def render(self, template_id, variables=None):
+        """
+        :param variables: {name: value} given to the template
+        :returns: ({field: rendered value}, provider_templates)
+        :raises TemplateNotFoundError:
+        :raises InvalidTemplateError: if the rendering failed, as a variable
+                                      is missing or the template tried an
+                                      unsafe operation
+        """
+        revision = self.store.get_revision(template_id)
+        entry = None
+        if revision is not None:
+            entry = self.cache.get((template_id, revision))
+        if entry is None:
+            template = self.store.get(template_id)
+            if template is None:
+                raise TemplateNotFoundError(template_id)
+            entry = (self.compile(template), template["provider_templates"])
+            self.cache.set(
+                (template_id, template["revision"]), entry, self.cache_ttl
+            )
+
+        compiled, provider_templates = entry
+        try:
+            rendered = {
+                field: t.render(variables or {})
+                for field, t in compiled.items()
+            }
+        except Exception as e:
+            # templates and variables both come from the clients
+            raise InvalidTemplateError(template_id, str(e))
+        return rendered, provider_templates
@@ -27,16 +27,23 @@ setup(
     ],
 
     keywords="mail",
+    # asynchronous generators, for the asyncio providers clients
+    python_requires=">=3.6",
     packages=find_packages(),
     include_package_data=True,
     zip_safe=False,
     install_requires=[
-        "appdirs", "Flask", "Flask-Script", "flask-restplus", "PyYAML",
-        "beautifulsoup4", "requests"
+        "appdirs", "Flask", "Flask-Script", "flask-restplus", "Jinja2",
+        "PyYAML", "requests"
     ],
+    extras_require={
+        "async": ["aiohttp", ],
+        "fast-json": ["orjson", ],
+    },
 
     setup_requires=["pytest-runner", ],
     tests_require=[
-        "pytest", "pytest-cov", "pytest-mock", "pytest-flask", "requests-mock"
+        "aiohttp", "pytest", "pytest-cov", "pytest-mock", "pytest-flask",
+        "requests-mock"
     ],
 )
@@ -1,16 +1,72 @@
+import time
 import pytest
 
 import mail_sender_daemon
 
 
 @pytest.fixture(scope='session')
-def app(request):
+def app(request, tmp_path_factory):
     """
     Session-wide test `Flask` application.
     """
-    app = mail_sender_daemon.app
-    app.config["AMAZON_API_DOMAIN"] = "http://localhost/amazon/"
-    app.config["MAILGUN_API_BASE_URL"] = "http://localhost/mailgun/"
-    app.config["TESTING"] = True
+    return mail_sender_daemon.create_app(
+        AMAZON_API_DOMAIN="http://localhost/amazon/",
+        MAILGUN_API_BASE_URL="http://localhost/mailgun/",
+        TESTING=True,
+        **_get_data_paths(tmp_path_factory.mktemp("data"))
+    )
 
-    return app
+
+@pytest.fixture()
+def data_paths(tmp_path):
+    """
+    Settings keeping the databases of an application built in a test out of
+    the user data directory
+    """
+    return _get_data_paths(tmp_path)
+
+
+def _get_data_paths(directory):
+    return {
+        "ASYNC_QUEUE_PATH": str(directory / "queue.sqlite"),
+        "IDEMPOTENCY": {"path": str(directory / "idempotency.sqlite")},
+        "TEMPLATES": {"path": str(directory / "templates.sqlite")},
+        "SUPPRESSIONS": {"path": str(directory / "suppressions.sqlite")},
+    }
+
+
+@pytest.fixture()
+def mail_sender(app):
+    """
+    Mail sender of the test application
+    """
+    from mail_sender_daemon.api.sender import get_mail_sender
+
+    return get_mail_sender(app)
+
+
+@pytest.fixture()
+def wait_for_job():
+    """
+    Wait for a queued job to be processed
+    """
+    from mail_sender_daemon.jobs import JobQueue
+
+    def wait(job_queue, job_id, timeout=5):
+        deadline = time.time() + timeout
+        while job_queue.get(job_id)["status"] in (JobQueue.QUEUED,
+                                                  JobQueue.SENDING):
+            assert time.time() < deadline
+            time.sleep(0.01)
+
+    return wait
+
+
+@pytest.fixture(autouse=True)
+def reset_circuit_breakers(mail_sender):
+    """
+    Do not let failures mocked in a test open a circuit in another one
+    """
+    yield
+    for breaker in mail_sender.circuit_breakers.values():
+        breaker.reset()
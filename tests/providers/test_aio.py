@@ -0,0 +1,200 @@
+import asyncio
+import base64
+import email
+import email.policy
+import io
+import json
+import urllib.parse
+import pytest
+
+from mail_sender_daemon.cache import TTLCache
+from mail_sender_daemon.exceptions import UnvalidatedAddrError
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+
+from mail_sender_daemon.providers.aio import (  # noqa: E402
+    AsyncAmazonSES, AsyncHTTPPool, AsyncMailgun
+)
+
+
+def run_with_server(handler, coro_fn):
+    """
+    Run coro_fn(url) against a local HTTP server answering with handler
+
+    :returns: (coro_fn result, [received requests params])
+    """
+    received = []
+
+    async def handle(request):
+        received.append(dict(urllib.parse.parse_qsl(
+            (await request.read()).decode() or request.query_string
+        )))
+        received[-1]["_headers"] = dict(request.headers)
+        return handler(request)
+
+    async def main():
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", handle)
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            return await coro_fn(str(server.make_url("/")))
+        finally:
+            await server.close()
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(main()), received
+    finally:
+        loop.close()
+
+
+class TestAsyncMailgun():
+    api_key = "api_key"
+
+    def test_send_mail(self):
+        async def send(url):
+            pool = AsyncHTTPPool()
+            api = AsyncMailgun(self.api_key, url, http_pool=pool)
+            try:
+                responses = [
+                    await api.send("sender@email.com", "dest@email.com")
+                    for _ in range(2)
+                ]
+                return responses, pool.stats()
+            finally:
+                await pool.close()
+
+        (responses, stats), received = run_with_server(
+            lambda r: web.Response(text="{}"), send
+        )
+
+        assert [r.status_code for r in responses] == [200, 200]
+        assert received[0]["to"] == "dest@email.com"
+        assert received[0]["_headers"]["Authorization"].startswith("Basic ")
+        assert stats["requests"] == 2
+
+    def test_send_batch(self):
+        async def send(url):
+            api = AsyncMailgun(self.api_key, url)
+            api.max_batch_recipients = 2
+            try:
+                return await api.send(
+                    "sender@email.com",
+                    ["a@email.com", "b@email.com", "c@email.com"],
+                    recipient_variables={"a@email.com": {"name": "A"}}
+                )
+            finally:
+                await api.http_pool.close()
+
+        response, received = run_with_server(
+            lambda r: web.Response(text="{}"), send
+        )
+
+        assert response.status_code == 200
+        assert [r["to"] for r in received] == [
+            "a@email.com,b@email.com", "c@email.com"
+        ]
+        assert json.loads(received[1]["recipient-variables"]) == {
+            "c@email.com": {}
+        }
+
+
+class TestAsyncAmazonSES():
+    api_access_key = "access_key"
+    api_secret_key = "secret_key"
+
+    def build_api(self, url, **kwargs):
+        return AsyncAmazonSES(
+            url, False, self.api_access_key, self.api_secret_key,
+            signature_version=4, region="us-east-1", **kwargs
+        )
+
+    def validation_handler(self, request):
+        return web.Response(text=(
+            "<GetIdentityVerificationAttributesResult>"
+            "<VerificationAttributes>"
+            "<entry><key>test@email.com</key><value>"
+            "<VerificationStatus>Success</VerificationStatus>"
+            "</value></entry>"
+            "</VerificationAttributes>"
+            "</GetIdentityVerificationAttributesResult>"
+        ))
+
+    def test_check_addr_validation_status(self):
+        async def check(url):
+            api = self.build_api(url, validation_cache=TTLCache(10))
+            try:
+                statuses = await api.check_addr_validation_status(
+                    "test@email.com", "other@email.com"
+                )
+                # cached
+                await api.check_addr_validation_status("test@email.com")
+                return statuses
+            finally:
+                await api.http_pool.close()
+
+        statuses, received = run_with_server(self.validation_handler, check)
+
+        assert statuses == {
+            "test@email.com": "Success", "other@email.com": "Unvalidated"
+        }
+        assert len(received) == 1
+        assert received[0]["Action"] == "GetIdentityVerificationAttributes"
+        assert received[0]["_headers"]["Authorization"].startswith(
+            "AWS4-HMAC-SHA256 Credential=access_key/"
+        )
+
+    def test_send_mail(self):
+        async def send(url):
+            api = self.build_api(url)
+            try:
+                return await api.send("sender@email.com", ["test@email.com"])
+            finally:
+                await api.http_pool.close()
+
+        response, received = run_with_server(self.validation_handler, send)
+
+        assert response.status_code == 200
+        assert [r["Action"] for r in received] == [
+            "GetIdentityVerificationAttributes", "SendEmail"
+        ]
+
+    def test_send_raw_mail(self):
+        attachment = io.BytesIO(b"%PDF" * 100000)
+
+        async def send(url):
+            api = self.build_api(url)
+            try:
+                return await api.send(
+                    "sender@email.com", ["test@email.com"],
+                    attachment=[("report.pdf", attachment)]
+                )
+            finally:
+                await api.http_pool.close()
+
+        response, received = run_with_server(self.validation_handler, send)
+
+        assert response.status_code == 200
+        assert received[-1]["Action"] == "SendRawEmail"
+        assert "Transfer-Encoding" not in received[-1]["_headers"]
+        message = email.message_from_bytes(
+            base64.b64decode(received[-1]["RawMessage.Data"]),
+            policy=email.policy.default
+        )
+        assert list(message.iter_attachments())[0].get_content() == (
+            attachment.getvalue()
+        )
+
+    def test_send_mail_unvalidated_dest(self):
+        async def send(url):
+            api = self.build_api(url)
+            try:
+                return await api.send("sender@email.com", ["other@email.com"])
+            finally:
+                await api.http_pool.close()
+
+        with pytest.raises(UnvalidatedAddrError):
+            run_with_server(self.validation_handler, send)
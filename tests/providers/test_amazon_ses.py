@@ -1,7 +1,15 @@
+import base64
+import calendar
 import datetime
+import email
+import email.policy
+import io
+import time
+import urllib.parse
 import pytest
 import requests_mock
 
+from mail_sender_daemon.cache import TTLCache
 from mail_sender_daemon.providers import AmazonSES
 from mail_sender_daemon.exceptions import UnvalidatedAddrError
 
@@ -44,6 +52,53 @@ class TestAmazonSES():
         )
         assert received_status == expected_addresses_statuses
 
+    def test_check_addr_validation_status_cached(self):
+        api = AmazonSES(
+            self.url, False, self.api_access_key, self.api_secret_key,
+            validation_cache=TTLCache()
+        )
+        statuses = {
+            "success@email.com": "Success",
+            "pending@email.com": "Pending",
+        }
+        self.mock_check_addr_validation_status(api, statuses)
+
+        # no request should be done, as every status is cached
+        with requests_mock.Mocker():
+            assert api.check_addr_validation_status(*statuses) == statuses
+        assert api.cache_stats()["hits"] == 2
+
+    def test_check_addr_validation_status_failure_ttl(self):
+        api = AmazonSES(
+            self.url, False, self.api_access_key, self.api_secret_key,
+            validation_cache=TTLCache(), validation_failure_ttl=0
+        )
+        self.mock_check_addr_validation_status(
+            api, {"success@email.com": "Success"}
+        )
+        self.mock_check_addr_validation_status(
+            api, {"pending@email.com": "Pending"}
+        )
+
+        assert api.cache_stats()["size"] == 1
+
+    def test_validate_addr_invalidates_cache(self):
+        api = AmazonSES(
+            self.url, False, self.api_access_key, self.api_secret_key,
+            validation_cache=TTLCache()
+        )
+        address = "test@email.com"
+        self.mock_check_addr_validation_status(api, {address: "Failed"})
+        with requests_mock.Mocker() as m:
+            m.register_uri(
+                "GET", self.build_validation_url(
+                    "VerifyEmailIdentity", address
+                ),
+            )
+            api.validate_addr(address)
+
+        assert api.cache_stats()["size"] == 0
+
     def mock_check_addr_validation_status(self, prepared_api,
                                           addresses_statuses):
         """
@@ -117,6 +172,20 @@ class TestAmazonSES():
 
         assert response.status_code == 200
 
+    def test_get_max_send_rate(self, prepared_api):
+        with requests_mock.Mocker() as m:
+            m.register_uri(
+                "GET", self.url + "?Action=GetSendQuota", status_code=200,
+                text=(
+                    "<GetSendQuotaResponse><GetSendQuotaResult>"
+                    "<Max24HourSend>50000.0</Max24HourSend>"
+                    "<MaxSendRate>14.0</MaxSendRate>"
+                    "<SentLast24Hours>0.0</SentLast24Hours>"
+                    "</GetSendQuotaResult></GetSendQuotaResponse>"
+                )
+            )
+            assert prepared_api.get_max_send_rate() == 14.0
+
     def test_send_mail(self, monkeypatch, prepared_api):
         self.mock_sender_check_addr(monkeypatch, prepared_api)
 
@@ -125,6 +194,94 @@ class TestAmazonSES():
         )
         assert response.status_code == 200
 
+    def test_send_mail_sigv4(self, monkeypatch):
+        api = AmazonSES(
+            self.url, False, self.api_access_key, self.api_secret_key,
+            signature_version=4
+        )
+        self.mock_sender_check_addr(monkeypatch, api)
+
+        with requests_mock.Mocker() as m:
+            m.register_uri("POST", self.url, status_code=200)
+            response = api.send("sender@email.com", "dest@email.com")
+            request = m.last_request
+
+        assert response.status_code == 200
+        assert request.headers["Authorization"].startswith(
+            "AWS4-HMAC-SHA256 Credential=access_key/"
+        )
+        assert "Action=SendEmail" in request.text
+
+    def test_send_templated_mail(self, monkeypatch):
+        api = AmazonSES(
+            self.url, False, self.api_access_key, self.api_secret_key,
+            signature_version=4
+        )
+        self.mock_sender_check_addr(monkeypatch, api)
+
+        with requests_mock.Mocker() as m:
+            m.register_uri("POST", self.url, status_code=200)
+            api.send(
+                "sender@email.com", ["dest@email.com"], subject="Rendered",
+                text="Rendered", template="Newsletter",
+                template_variables={"name": "Test"}
+            )
+            params = urllib.parse.parse_qs(m.last_request.text)
+
+        assert params["Action"] == ["SendTemplatedEmail"]
+        assert params["Template"] == ["Newsletter"]
+        assert params["TemplateData"] == ['{"name": "Test"}']
+        assert params["Destination.ToAddresses.member.1"] == [
+            "dest@email.com"
+        ]
+        assert not any(k.startswith("Message.") for k in params)
+
+    @pytest.mark.parametrize("signature_version", [3, 4])
+    def test_send_raw_mail(self, monkeypatch, signature_version):
+        api = AmazonSES(
+            self.url, False, self.api_access_key, self.api_secret_key,
+            signature_version=signature_version
+        )
+        self.mock_sender_check_addr(monkeypatch, api)
+        attachment = io.BytesIO(b"%PDF" * 100000)
+
+        with requests_mock.Mocker() as m:
+            m.register_uri("POST", self.url, status_code=200)
+            response = api.send(
+                "sender@email.com", ["dest@email.com"],
+                bcc=["hidden@email.com"], subject="Report",
+                headers={"X-Campaign": "test"},
+                attachment=[("report.pdf", attachment)]
+            )
+            request = m.last_request
+            body = request.body.read()
+
+        assert response.status_code == 200
+        assert int(request.headers["Content-Length"]) == len(body)
+        params = dict(urllib.parse.parse_qsl(body.decode()))
+        assert params["Action"] == "SendRawEmail"
+        assert params["Destinations.member.1"] == "dest@email.com"
+        assert params["Destinations.member.2"] == "hidden@email.com"
+
+        message = email.message_from_bytes(
+            base64.b64decode(params["RawMessage.Data"]),
+            policy=email.policy.default
+        )
+        assert message["X-Campaign"] == "test"
+        assert "Bcc" not in message
+        assert list(message.iter_attachments())[0].get_content() == (
+            attachment.getvalue()
+        )
+
+        if signature_version == 4:
+            timestamp = calendar.timegm(time.strptime(
+                request.headers["X-Amz-Date"], "%Y%m%dT%H%M%SZ"
+            ))
+            headers = api.signer.sign(body, timestamp)
+            assert request.headers["Authorization"] == (
+                headers["Authorization"]
+            )
+
     def test_send_mail_unvalidated_dest(self, monkeypatch, prepared_api):
         self.mock_sender_check_addr(monkeypatch, prepared_api, valid=False)
 
@@ -1,6 +1,10 @@
+import io
+import json
+import urllib.parse
 import pytest
 import requests_mock
 
+from mail_sender_daemon.exceptions import PartialBatchError
 from mail_sender_daemon.providers import Mailgun
 
 
@@ -18,6 +22,118 @@ class TestMailgun():
         )
         assert response.status_code == 200
 
+    def test_send_headers(self, prepared_api):
+        with requests_mock.Mocker() as m:
+            m.register_uri(
+                "POST", self.url.rstrip("/") + "/messages", status_code=200,
+            )
+            prepared_api.send(
+                "sender@email.com", "dest@email.com",
+                headers={"X-Campaign": "test"}
+            )
+            params = urllib.parse.parse_qs(m.last_request.text)
+
+        assert params["h:X-Campaign"] == ["test"]
+
+    def test_send_template(self, prepared_api):
+        with requests_mock.Mocker() as m:
+            m.register_uri(
+                "POST", self.url.rstrip("/") + "/messages", status_code=200,
+            )
+            prepared_api.send(
+                "sender@email.com", "dest@email.com", text="Rendered",
+                template="newsletter", template_variables={"name": "Test"}
+            )
+            params = urllib.parse.parse_qs(m.last_request.text)
+
+        assert params["template"] == ["newsletter"]
+        assert params["h:X-Mailgun-Variables"] == ['{"name": "Test"}']
+        assert "text" not in params
+
+    def test_send_batch(self, prepared_api):
+        prepared_api.max_batch_recipients = 2
+        to = ["a@email.com", "b@email.com", "c@email.com"]
+        recipient_variables = {
+            "a@email.com": {"name": "A"}, "b@email.com": {"name": "B"},
+        }
+        with requests_mock.Mocker() as m:
+            m.register_uri(
+                "POST", self.url.rstrip("/") + "/messages", status_code=200,
+            )
+            response = prepared_api.send(
+                "sender@email.com", to, text="Hello %recipient.name%",
+                recipient_variables=recipient_variables,
+                cc="cc@email.com", bcc=["bcc@email.com"]
+            )
+            requests_params = [
+                urllib.parse.parse_qs(r.text) for r in m.request_history
+            ]
+
+        assert response.status_code == 200
+        assert [p["to"] for p in requests_params] == [
+            ["a@email.com,b@email.com"], ["c@email.com"]
+        ]
+        assert json.loads(requests_params[1]["recipient-variables"][0]) == {
+            "c@email.com": {}
+        }
+        # received once
+        assert requests_params[0]["cc"] == ["cc@email.com"]
+        assert requests_params[0]["bcc"] == ["bcc@email.com"]
+        assert "cc" not in requests_params[1]
+        assert "bcc" not in requests_params[1]
+
+    def test_send_attachments(self, prepared_api):
+        attachment = io.BytesIO(b"content")
+        with requests_mock.Mocker() as m:
+            m.register_uri(
+                "POST", self.url.rstrip("/") + "/messages", status_code=200,
+            )
+            response = prepared_api.send(
+                "sender@email.com", "dest@email.com",
+                attachment=[("a.txt", attachment, "text/plain"), ]
+            )
+            request = m.request_history[0]
+            body = request.body.read()
+
+        assert response.status_code == 200
+        assert request.headers["Content-Type"].startswith(
+            "multipart/form-data; boundary="
+        )
+        assert (
+            b'name="attachment"; filename="a.txt"\r\n'
+            b"Content-Type: text/plain\r\n\r\ncontent\r\n"
+        ) in body
+
+    def test_send_batch_stops_on_error(self, prepared_api):
+        prepared_api.max_batch_recipients = 1
+        with requests_mock.Mocker() as m:
+            m.register_uri(
+                "POST", self.url.rstrip("/") + "/messages", status_code=500,
+            )
+            response = prepared_api.send_batch(
+                "sender@email.com", ["a@email.com", "b@email.com"], {}
+            )
+            assert m.call_count == 1
+
+        assert response.status_code == 500
+
+    def test_send_batch_partially_sent(self, prepared_api):
+        prepared_api.max_batch_recipients = 1
+        with requests_mock.Mocker() as m:
+            m.register_uri(
+                "POST", self.url.rstrip("/") + "/messages",
+                [{"status_code": 200}, {"status_code": 500}]
+            )
+            with pytest.raises(PartialBatchError) as excinfo:
+                prepared_api.send_batch(
+                    "sender@email.com",
+                    ["a@email.com", "b@email.com", "c@email.com"], {}
+                )
+            assert m.call_count == 2
+
+        assert excinfo.value.sent == ["a@email.com"]
+        assert excinfo.value.response.status_code == 500
+
     def send_mail_with_mocked_request(self, prepared_api, *args, **kwargs):
         """
         *args and **kwargs will be the parameters sent to prepared_api.send()
@@ -0,0 +1,78 @@
+import base64
+import email
+import email.policy
+import io
+import pytest
+
+from mail_sender_daemon.providers.mime import RawMessage, iter_base64
+
+
+@pytest.mark.parametrize("sizes", [(1, ), (57, 3), (5, 100, 2, 57 * 3, 1)])
+def test_iter_base64(sizes):
+    data = bytes(range(256)) * 2
+    chunks, start = [], 0
+    for size in sizes * 10:
+        chunks.append(data[start:start + size])
+        start += size
+    data = b"".join(chunks)
+
+    assert b"".join(iter_base64(chunks, mime=False)) == (
+        base64.b64encode(data)
+    )
+    assert b"".join(iter_base64(chunks)) == (
+        base64.encodebytes(data).replace(b"\n", b"\r\n")
+    )
+
+
+class TestRawMessage():
+    def parse(self, message):
+        return email.message_from_bytes(
+            b"".join(message.iter_chunks()), policy=email.policy.default
+        )
+
+    def test_text(self):
+        message = self.parse(RawMessage(
+            "sender@email.com", ["dest@email.com"], bcc=["hidden@email.com"],
+            subject="Test é", text="content é"
+        ))
+
+        assert message["From"] == "sender@email.com"
+        assert message["To"] == "dest@email.com"
+        assert message["Subject"] == "Test é"
+        assert "Bcc" not in message
+        assert message.get_content_type() == "text/plain"
+        assert message.get_content() == "content é"
+
+    def test_files(self):
+        attachment = io.BytesIO(b"%PDF" * 100000)
+        message = RawMessage(
+            "sender@email.com", ["dest@email.com"], cc="cc@email.com",
+            text="text", html="<img src=\"cid:logo.png\">" * 10000,
+            headers={"X-Campaign": "test"},
+            attachment=[("report é.pdf", attachment)],
+            inline=[("logo.png", io.BytesIO(b"png"), "image/png")],
+        )
+        parsed = self.parse(message)
+
+        assert parsed["Cc"] == "cc@email.com"
+        assert parsed["X-Campaign"] == "test"
+        assert [p.get_content_type() for p in parsed.walk()] == [
+            "multipart/mixed", "multipart/related", "multipart/alternative",
+            "text/plain", "text/html", "image/png", "application/pdf",
+        ]
+        assert parsed.get_body(("html", )).get_content().startswith(
+            "<img src=\"cid:logo.png\">"
+        )
+        inline, pdf = list(parsed.walk())[-2:]
+        assert inline["Content-ID"] == "<logo.png>"
+        assert pdf.get_filename() == "report é.pdf"
+        assert pdf.get_content() == attachment.getvalue()
+        # files are read again from their start
+        assert self.parse(message).as_bytes() == parsed.as_bytes()
+
+    def test_header_injection(self):
+        with pytest.raises(ValueError):
+            RawMessage(
+                "sender@email.com", ["dest@email.com"],
+                headers={"X-Test": "value\r\nBcc: other@email.com"}
+            )
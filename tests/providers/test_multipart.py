@@ -0,0 +1,79 @@
+import email.parser
+import io
+import requests
+
+from mail_sender_daemon.providers.multipart import MultipartEncoder, iter_files
+
+
+def parse_multipart(content_type, body):
+    """
+    :returns: [(name, filename, content type, content), ]
+    """
+    message = email.parser.BytesParser().parsebytes(
+        "Content-Type: {}\r\n\r\n".format(content_type).encode() + body
+    )
+    return [
+        (
+            part.get_param("name", header="content-disposition"),
+            part.get_filename(), part.get("Content-Type"),
+            part.get_payload(decode=True)
+        )
+        for part in message.get_payload()
+    ]
+
+
+class TestMultipartEncoder():
+    def build_encoder(self):
+        files = {
+            "attachment": [
+                ("a.txt", io.BytesIO(b"a" * 100000), "text/plain"),
+                ("b\".bin", io.BytesIO(b"\x00\r\n--b"), None),
+            ],
+        }
+        return MultipartEncoder(
+            [("to", "to@email.com"), ("subject", "Subject")],
+            iter_files(files)
+        )
+
+    def test_encode(self):
+        encoder = self.build_encoder()
+        body = b"".join(encoder.iter_chunks())
+
+        assert len(body) == len(encoder)
+        assert parse_multipart(encoder.content_type, body) == [
+            ("to", None, None, b"to@email.com"),
+            ("subject", None, None, b"Subject"),
+            ("attachment", "a.txt", "text/plain", b"a" * 100000),
+            ("attachment", "b%22.bin", None, b"\x00\r\n--b"),
+        ]
+
+    def test_read(self):
+        encoder = self.build_encoder()
+        body = b"".join(encoder.iter_chunks())
+
+        chunks = []
+        chunk = encoder.read(1000)
+        while chunk:
+            assert len(chunk) <= 1000
+            chunks.append(chunk)
+            chunk = encoder.read(1000)
+
+        assert b"".join(chunks) == body
+
+    def test_read_again(self):
+        encoder = self.build_encoder()
+
+        assert b"".join(encoder.iter_chunks()) == (
+            b"".join(encoder.iter_chunks())
+        )
+
+    def test_streamed_by_requests(self):
+        encoder = self.build_encoder()
+
+        request = requests.Request(
+            "POST", "http://localhost/", data=encoder,
+            headers={"Content-Type": encoder.content_type}
+        ).prepare()
+
+        assert request.body is encoder
+        assert request.headers["Content-Length"] == str(len(encoder))
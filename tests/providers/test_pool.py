@@ -0,0 +1,61 @@
+import http.server
+import socketserver
+import threading
+import pytest
+
+from mail_sender_daemon.providers import HTTPPool
+
+
+class _KeepAliveHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"OK")
+
+    def log_message(self, *args):
+        pass
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                           http.server.HTTPServer):
+    daemon_threads = True
+
+
+class TestHTTPPool():
+    @pytest.fixture()
+    def server_url(self):
+        server = _ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield "http://127.0.0.1:{}/".format(server.server_port)
+        server.shutdown()
+        server.server_close()
+
+    def test_reuse_connection(self, server_url):
+        pool = HTTPPool()
+        for _ in range(3):
+            assert pool.get(server_url).status_code == 200
+
+        stats = pool.stats()
+        assert stats["requests"] == 3
+        assert stats["connections_opened"] == 1
+        assert stats["connections_reused"] == 2
+        assert stats["latency_p50"] is not None
+
+    def test_close_idle_connections(self, server_url):
+        pool = HTTPPool(max_idle=0)
+        for _ in range(2):
+            pool.get(server_url)
+
+        stats = pool.stats()
+        assert stats["idle_resets"] == 2
+        assert stats["connections_opened"] == 2
+
+    def test_no_keep_alive(self, server_url):
+        pool = HTTPPool(keep_alive=False)
+        response = pool.get(server_url)
+
+        assert response.request.headers["Connection"] == "close"
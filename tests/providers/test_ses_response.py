@@ -0,0 +1,77 @@
+from mail_sender_daemon.providers.ses_response import (
+    parse_error, parse_message_id, parse_send_quota,
+    parse_verification_statuses
+)
+
+
+VERIFICATION_RESPONSE = (
+    b'<GetIdentityVerificationAttributesResponse '
+    b'xmlns="http://ses.amazonaws.com/doc/2010-12-01/">'
+    b'<GetIdentityVerificationAttributesResult><VerificationAttributes>'
+    b'<entry><key>success@email.com</key><value>'
+    b'<VerificationStatus>Success</VerificationStatus></value></entry>'
+    b'<entry><key>pending@email.com</key><value>'
+    b'<VerificationStatus>Pending</VerificationStatus></value></entry>'
+    b'</VerificationAttributes></GetIdentityVerificationAttributesResult>'
+    b'<ResponseMetadata><RequestId>1234</RequestId></ResponseMetadata>'
+    b'</GetIdentityVerificationAttributesResponse>'
+)
+
+
+class TestSESResponse():
+    def test_parse_verification_statuses(self):
+        assert parse_verification_statuses(VERIFICATION_RESPONSE) == {
+            "success@email.com": "Success",
+            "pending@email.com": "Pending",
+        }
+
+    def test_parse_verification_statuses_by_chunks(self):
+        chunks = (
+            VERIFICATION_RESPONSE[i:i + 7]
+            for i in range(0, len(VERIFICATION_RESPONSE), 7)
+        )
+
+        assert len(parse_verification_statuses(chunks)) == 2
+
+    def test_parse_message_id(self):
+        response = (
+            '<SendEmailResponse '
+            'xmlns="http://ses.amazonaws.com/doc/2010-12-01/">'
+            '<SendEmailResult><MessageId>0000-1111</MessageId>'
+            '</SendEmailResult></SendEmailResponse>'
+        )
+
+        assert parse_message_id(response) == "0000-1111"
+
+    def test_parse_send_quota(self):
+        response = (
+            b'<GetSendQuotaResponse '
+            b'xmlns="http://ses.amazonaws.com/doc/2010-12-01/">'
+            b'<GetSendQuotaResult>'
+            b'<SentLast24Hours>127.0</SentLast24Hours>'
+            b'<Max24HourSend>200.0</Max24HourSend>'
+            b'<MaxSendRate>1.0</MaxSendRate>'
+            b'</GetSendQuotaResult></GetSendQuotaResponse>'
+        )
+
+        assert parse_send_quota(response) == {
+            "sent_last_24_hours": 127.0,
+            "max_24_hour_send": 200.0,
+            "max_send_rate": 1.0,
+        }
+
+    def test_parse_error(self):
+        response = (
+            '<ErrorResponse xmlns="http://ses.amazonaws.com/doc/2010-12-01/">'
+            '<Error><Type>Sender</Type><Code>Throttling</Code>'
+            '<Message>Maximum sending rate exceeded.</Message></Error>'
+            '<RequestId>1234</RequestId></ErrorResponse>'
+        )
+
+        assert parse_error(response) == (
+            "Throttling", "Maximum sending rate exceeded."
+        )
+
+    def test_parse_error_invalid(self):
+        assert parse_error(b"") is None
+        assert parse_error(b"<html>Bad Gateway</html>") is None
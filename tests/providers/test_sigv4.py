@@ -0,0 +1,71 @@
+import calendar
+import hashlib
+
+from mail_sender_daemon.providers.sigv4 import SigV4Signer
+
+
+class TestSigV4Signer():
+    # examples from the AWS Signature Version 4 documentation and test suite
+    access_key = "AKIDEXAMPLE"
+    secret_key = "wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY"
+
+    def test_derive_signing_key(self):
+        signer = SigV4Signer(
+            self.access_key, self.secret_key, "https://iam.amazonaws.com/",
+            region="us-east-1", service="iam"
+        )
+
+        assert signer.derive_signing_key("20120215").hex() == (
+            "f4780e2d9f65fa895f9c67b32ce1baf0b0d8a43505a000a1a9e090d414db404d"
+        )
+
+    def test_sign(self):
+        class _Signer(SigV4Signer):
+            CONTENT_TYPE = "application/x-www-form-urlencoded"
+
+        signer = _Signer(
+            self.access_key, self.secret_key,
+            "https://example.amazonaws.com/", region="us-east-1",
+            service="service"
+        )
+        timestamp = calendar.timegm((2015, 8, 30, 12, 36, 0))
+        headers = signer.sign(b"Param1=value1", timestamp)
+
+        assert headers["X-Amz-Date"] == "20150830T123600Z"
+        assert headers["Authorization"] == (
+            "AWS4-HMAC-SHA256 "
+            "Credential=AKIDEXAMPLE/20150830/us-east-1/service/aws4_request, "
+            "SignedHeaders=content-type;host;x-amz-date, "
+            "Signature="
+            "ff11897932ad3f4e8b18135d722051e5ac45fc38421b1da7b9d196a0fe09473a"
+        )
+
+    def test_sign_payload_hash(self):
+        signer = SigV4Signer(
+            self.access_key, self.secret_key,
+            "https://email.us-west-2.amazonaws.com"
+        )
+        body = b"Action=SendRawEmail&RawMessage.Data=data"
+
+        assert signer.sign_payload_hash(
+            hashlib.sha256(body).hexdigest(), 1440938160
+        ) == signer.sign(body, 1440938160)
+
+    def test_signing_key_cached(self, mocker):
+        signer = SigV4Signer(
+            self.access_key, self.secret_key,
+            "https://email.us-west-2.amazonaws.com"
+        )
+        derive = mocker.spy(signer, "derive_signing_key")
+        timestamp = calendar.timegm((2017, 10, 15, 0, 0, 0))
+        signer.sign(b"", timestamp)
+        signer.sign(b"", timestamp + 60)
+        signer.sign(b"", timestamp + 86400)
+
+        assert derive.call_count == 2
+
+    def test_guess_region(self):
+        assert SigV4Signer.guess_region(
+            "email.eu-west-1.amazonaws.com"
+        ) == "eu-west-1"
+        assert SigV4Signer.guess_region("localhost") == "us-east-1"
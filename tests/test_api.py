@@ -1,8 +1,21 @@
 from flask import url_for
+import asyncio
+import concurrent.futures
+import csv
+import io
 import json
+import threading
+import time
 import pytest
 
+from mail_sender_daemon.api import routes
+from mail_sender_daemon.jobs import JobQueue
+from mail_sender_daemon.rate_limiter import TokenBucket
+from mail_sender_daemon.retry import RetryBudget, RetryPolicy
 from mail_sender_daemon.providers import AmazonSES, Mailgun
+from mail_sender_daemon.providers import aio
+from mail_sender_daemon.routing import build_routing_policy
+from mail_sender_daemon.suppression import SuppressionList
 
 
 class TestAPI():
@@ -40,13 +53,495 @@ class TestAPI():
         assert resp.status_code == 503
         assert len(resp.json["providers"]) == 2
 
+    def test_send_circuit_open(self, monkeypatch, mocker, client,
+                               mail_sender):
+        ok_resp = self.build_200_response(mocker)
+        self.mock_sending_for_provider(monkeypatch, AmazonSES, ok_resp)
+        self.mock_sending_for_provider(monkeypatch, Mailgun, ok_resp)
+        breaker = mail_sender.circuit_breakers["amazon_ses"]
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+
+        resp = self.post_send(client)
+
+        assert resp.status_code == 200
+        assert resp.json["providers"][0]["msg"] == "skipped: circuit open"
+        assert resp.json["provider_used"] == "mailgun"
+
+        resp = client.get(url_for("circuit_breaker_stats"))
+        assert resp.json["circuit_breakers"][0]["state"] == "open"
+
+    def test_send_invalid_request(self, monkeypatch, mocker, client,
+                                  mail_sender):
+        ok_resp = self.build_200_response(mocker)
+
+        def send(*args, **kwargs):
+            raise ValueError("There may be at most 1 Subject headers")
+
+        monkeypatch.setattr(AmazonSES, "send", send)
+        self.mock_sending_for_provider(monkeypatch, Mailgun, ok_resp)
+        breaker = mail_sender.circuit_breakers["amazon_ses"]
+
+        for _ in range(breaker.failure_threshold):
+            resp = self.post_send(client)
+            assert resp.status_code == 200
+            assert resp.json["providers"][0]["status_code"] == 400
+
+        # not a failure of the provider
+        assert breaker.allow_request()
+
+    def test_send_rate_limited(self, monkeypatch, mocker, client,
+                               mail_sender):
+        ok_resp = self.build_200_response(mocker)
+        self.mock_sending_for_provider(monkeypatch, AmazonSES, ok_resp)
+        self.mock_sending_for_provider(monkeypatch, Mailgun, ok_resp)
+        limiter = TokenBucket(rate=0.01, burst=1)
+        monkeypatch.setitem(
+            mail_sender.rate_limiters, "amazon_ses", limiter
+        )
+
+        assert self.post_send(client).json["provider_used"] == "amazon_ses"
+        resp = self.post_send(client)
+
+        assert resp.status_code == 200
+        assert resp.json["providers"][0] == {
+            "provider": "amazon_ses", "status_code": 429,
+            "msg": "skipped: rate limited", "attempt": 1,
+        }
+        assert resp.json["provider_used"] == "mailgun"
+
+        resp = client.get(url_for("rate_limiter_stats"))
+        assert resp.json["rate_limiters"][0]["rejections"] == 1
+
+    def test_send_rate_limit_wait(self, monkeypatch, mocker, client,
+                                  mail_sender):
+        ok_resp = self.build_200_response(mocker)
+        self.mock_sending_for_provider(monkeypatch, AmazonSES, ok_resp)
+        monkeypatch.setitem(
+            mail_sender.rate_limiters, "amazon_ses",
+            TokenBucket(rate=10, burst=1)
+        )
+
+        start = time.monotonic()
+        for _ in range(2):
+            assert self.post_send(client).json["provider_used"] == (
+                "amazon_ses"
+            )
+        assert time.monotonic() - start >= 0.09
+
+    def test_send_retry(self, monkeypatch, mocker, client,
+                        mail_sender):
+        magic_mocker_resp = self.build_503_then_200_resp(mocker)
+        self.mock_sending_for_provider(
+            monkeypatch, AmazonSES, magic_mocker_resp
+        )
+        monkeypatch.setitem(
+            mail_sender.retry_policies, "amazon_ses",
+            RetryPolicy(max_attempts=2, base_delay=0.01)
+        )
+
+        resp = self.post_send(client)
+
+        assert resp.status_code == 200
+        assert resp.json["provider_used"] == "amazon_ses"
+        assert [
+            (p["status_code"], p["attempt"]) for p in resp.json["providers"]
+        ] == [(503, 1), (200, 2)]
+
+    def test_send_retry_budget(self, monkeypatch, mocker, client,
+                               mail_sender):
+        err_resp = self.build_503_response(mocker)
+        self.mock_sending_for_provider(monkeypatch, AmazonSES, err_resp)
+        self.mock_sending_for_provider(monkeypatch, Mailgun, err_resp)
+        for name in mail_sender.mail_providers:
+            monkeypatch.setitem(
+                mail_sender.retry_policies, name,
+                RetryPolicy(max_attempts=5, base_delay=0)
+            )
+        monkeypatch.setattr(
+            mail_sender, "retry_budget",
+            RetryBudget(ratio=0, min_per_second=0.1)
+        )
+
+        resp = self.post_send(client)
+
+        assert resp.status_code == 503
+        # a single retry allowed by the budget
+        assert [
+            (p["provider"], p["attempt"]) for p in resp.json["providers"]
+        ] == [("amazon_ses", 1), ("amazon_ses", 2), ("mailgun", 1)]
+
+    def test_send_routing_policy(self, monkeypatch, mocker, client,
+                                 mail_sender):
+        ok_resp = self.build_200_response(mocker)
+        self.mock_sending_for_provider(monkeypatch, AmazonSES, ok_resp)
+        self.mock_sending_for_provider(monkeypatch, Mailgun, ok_resp)
+        monkeypatch.setattr(
+            mail_sender, "routing_policy",
+            build_routing_policy("weighted", weights={"amazon_ses": 0})
+        )
+
+        resp = self.post_send(client)
+
+        assert resp.json["provider_used"] == "mailgun"
+        assert mail_sender.routing_policy.get_stats("mailgun").samples == 1
+
+    def test_send_recipient_variables(self, monkeypatch, mocker, client):
+        ok_resp = self.build_200_response(mocker)
+        self.mock_sending_for_provider(monkeypatch, AmazonSES, ok_resp)
+        self.mock_sending_for_provider(monkeypatch, Mailgun, ok_resp)
+
+        resp = client.post(
+            "/send", data=json.dumps({
+                "to": ["to@email.com", ],
+                "recipient_variables": {"to@email.com": {"name": "To"}},
+            }), headers={"Content-type": "application/json"}
+        )
+
+        assert resp.status_code == 200
+        assert resp.json["providers"][0]["status_code"] == 501
+        assert resp.json["provider_used"] == "mailgun"
+
+    def test_send_invalid(self, client):
+        for data in ("{", json.dumps({"to": "to@email.com"})):
+            resp = client.post(
+                "/send", data=data, content_type="application/json"
+            )
+            assert resp.status_code == 400
+
+        assert resp.json["message"] == "Input payload validation failed"
+        assert list(resp.json["errors"]) == ["to"]
+
+    def test_send_multipart(self, monkeypatch, mocker, app, client):
+        monkeypatch.setitem(app.config, "ATTACHMENTS", {
+            "spool_memory_size": 1000
+        })
+        ok_resp = self.build_200_response(mocker)
+        sent = []
+
+        def callback(self, src, to, **kwargs):
+            sent.append([
+                (filename, type(f), f.read(), content_type)
+                for filename, f, content_type in kwargs["attachment"]
+            ])
+            return ok_resp
+
+        monkeypatch.setattr(AmazonSES, "send", callback)
+
+        resp = client.post(
+            url_for("send_mail_multipart"), data={
+                "message": json.dumps({"to": ["to@email.com", ]}),
+                "attachment": [
+                    (io.BytesIO(b"a" * 2000), "a.txt", "text/plain"),
+                    (io.BytesIO(b"b"), "b.bin"),
+                ],
+            }, content_type="multipart/form-data"
+        )
+
+        assert resp.status_code == 200
+        assert resp.json["provider_used"] == "amazon_ses"
+        filename, file_type, content, content_type = sent[0][0]
+        assert (filename, content, content_type) == (
+            "a.txt", b"a" * 2000, "text/plain"
+        )
+        # spooled to a file, as the request is bigger than spool_memory_size
+        assert file_type is not io.BytesIO
+        assert sent[0][1][2] == b"b"
+
+    def test_send_multipart_unsupported(self, monkeypatch, mocker, client):
+        monkeypatch.setattr(AmazonSES, "supports_attachments", False)
+        monkeypatch.setattr(
+            Mailgun, "send", lambda *args, **kwargs: (
+                self.build_200_response(mocker)
+            )
+        )
+
+        resp = client.post(
+            url_for("send_mail_multipart"), data={
+                "message": json.dumps({"to": ["to@email.com", ]}),
+                "attachment": [(io.BytesIO(b"a"), "a.txt")],
+            }, content_type="multipart/form-data"
+        )
+
+        assert resp.json["providers"][0] == {
+            "provider": "amazon_ses", "status_code": 501,
+            "msg": "attachments not supported", "attempt": 1,
+        }
+        assert resp.json["provider_used"] == "mailgun"
+
+    def test_send_invalid_headers(self, client):
+        for headers in ({"X-Test\n": "value"}, {"X-Test": "value\n"},
+                        {"Subject": "Hi"}, {"reply-to": "a@email.com"}):
+            resp = client.post("/send", json={
+                "to": ["to@email.com"], "headers": headers,
+            })
+            assert resp.status_code == 400
+
+    def test_send_multipart_invalid_message(self, client):
+        invalid_headers = {"X-Test": "value\r\nBcc: other@email.com"}
+        for message in ("{", json.dumps({"subject": "no receiver"}),
+                        json.dumps({"to": ["to@email.com", ],
+                                    "headers": invalid_headers})):
+            resp = client.post(
+                url_for("send_mail_multipart"), data={"message": message},
+                content_type="multipart/form-data"
+            )
+            assert resp.status_code == 400
+
+    def test_send_batch_partially_sent(self, monkeypatch, mocker, client,
+                                       mail_sender):
+        responses = [
+            self.build_200_response(mocker), self.build_503_response(mocker),
+            self.build_200_response(mocker),
+        ]
+        sent = []
+        sent_cc = []
+
+        def post_message(self, params, files):
+            sent.append(params["to"])
+            sent_cc.append(params.get("cc", None))
+            return responses.pop(0)
+
+        monkeypatch.setattr(Mailgun, "_post_message", post_message)
+        monkeypatch.setattr(
+            mail_sender.mail_providers["mailgun"], "max_batch_recipients", 1
+        )
+        monkeypatch.setitem(
+            mail_sender.retry_policies, "mailgun",
+            RetryPolicy(max_attempts=2, base_delay=0.01)
+        )
+
+        resp = client.post("/send", json={
+            "to": ["a@email.com", "b@email.com"], "cc": ["cc@email.com"],
+            "recipient_variables": {},
+        })
+
+        assert resp.status_code == 200
+        # the recipients already sent are not sent again by the retry
+        assert sent == ["a@email.com", "b@email.com", "b@email.com"]
+        assert sent_cc == ["cc@email.com", None, None]
+
+    def test_send_batch(self, monkeypatch, mocker, client):
+        ok_resp = self.build_200_response(mocker)
+        err_resp = self.build_503_response(mocker)
+
+        def callback(self, src, to, **kwargs):
+            return err_resp if to == ["fail@email.com", ] else ok_resp
+
+        monkeypatch.setattr(AmazonSES, "send", callback)
+        monkeypatch.setattr(Mailgun, "send", callback)
+
+        resp = self.post_send_batch(client, [
+            {"to": ["to@email.com", ]},
+            {"to": ["fail@email.com", ]},
+            {"from": "from@email.com", "to": ["other@email.com", ]},
+        ])
+
+        assert resp.status_code == 200
+        results = resp.json["results"]
+        assert [r["status_code"] for r in results] == [200, 503, 200]
+        assert len(results[1]["providers"]) == 2
+
+    def test_send_batch_invalid_message(self, client):
+        resp = self.post_send_batch(client, [
+            {"to": ["to@email.com", ]}, {"subject": "no receiver"},
+        ])
+
+        assert resp.status_code == 400
+
+    def test_send_batch_too_many(self, monkeypatch, app, client):
+        monkeypatch.setitem(app.config, "SEND_BATCH_MAX_MESSAGES", 1)
+
+        resp = self.post_send_batch(client, [
+            {"to": ["to@email.com", ]}, {"to": ["other@email.com", ]},
+        ])
+
+        assert resp.status_code == 413
+
+    def post_send_batch(self, client, messages):
+        return client.post(
+            url_for("send_mail_batch"),
+            data=json.dumps({"messages": messages}),
+            headers={"Content-type": "application/json"}
+        )
+
+    def test_send_async(self, monkeypatch, mocker, client, app, tmpdir,
+                        wait_for_job):
+        ok_resp = self.build_200_response(mocker)
+        self.mock_sending_for_provider(monkeypatch, AmazonSES, ok_resp)
+        self.mock_async_mode(monkeypatch, app, tmpdir)
+
+        resp = self.post_send(client)
+        assert resp.status_code == 202
+        job_id = resp.json["id"]
+
+        pool = routes.get_worker_pool()
+        try:
+            wait_for_job(pool.job_queue, job_id)
+        finally:
+            pool.stop()
+
+        resp = client.get(url_for("job", job_id=job_id))
+        assert resp.status_code == 200
+        assert resp.json["status"] == JobQueue.SENT
+        assert resp.json["provider_used"] == "amazon_ses"
+        assert len(resp.json["providers"]) == 1
+
+    def test_unknown_job(self, monkeypatch, client, app, tmpdir):
+        self.mock_async_mode(monkeypatch, app, tmpdir)
+
+        assert client.get(url_for("job", job_id="unknown")).status_code == 404
+
+    def mock_async_mode(self, monkeypatch, app, tmpdir):
+        monkeypatch.setitem(app.config, "ASYNC_SEND", True)
+        monkeypatch.setitem(
+            app.config, "ASYNC_QUEUE_PATH", str(tmpdir.join("queue.sqlite"))
+        )
+        monkeypatch.setitem(app.extensions, "worker_pool", None)
+
+    def test_send_async_providers(self, monkeypatch, mocker, app, client):
+        pytest.importorskip("aiohttp")
+        monkeypatch.setitem(app.config, "ASYNC_PROVIDERS", True)
+        ok_resp = self.build_200_response(mocker)
+        err_resp = self.build_503_response(mocker)
+
+        async def callback(self, src, to, **kwargs):
+            return err_resp if to == ["fail@email.com", ] else ok_resp
+
+        monkeypatch.setattr(aio.AsyncAmazonSES, "send", callback)
+        monkeypatch.setattr(aio.AsyncMailgun, "send", callback)
+
+        resp = self.post_send(client)
+        assert resp.status_code == 200
+        assert resp.json["provider_used"] == "amazon_ses"
+
+        resp = self.post_send_batch(client, [
+            {"to": ["to@email.com", ]}, {"to": ["fail@email.com", ]},
+        ])
+        assert [r["status_code"] for r in resp.json["results"]] == [200, 503]
+
+    def test_send_async_providers_checks(self, monkeypatch, mocker, app,
+                                         client, mail_sender):
+        pytest.importorskip("aiohttp")
+        monkeypatch.setitem(app.config, "ASYNC_PROVIDERS", True)
+        ok_resp = self.build_200_response(mocker)
+        threads = []
+
+        async def callback(self, src, to, **kwargs):
+            return ok_resp
+
+        def check_skip_provider(*args):
+            threads.append(threading.current_thread().name)
+            return None, 0
+
+        monkeypatch.setattr(aio.AsyncAmazonSES, "send", callback)
+        monkeypatch.setattr(
+            mail_sender, "_check_skip_provider", check_skip_provider
+        )
+
+        assert self.post_send(client).status_code == 200
+        # may request the state backend, so not in the event loop
+        assert threads and routes.event_loop.name not in threads
+
+    def test_send_idempotency_key(self, monkeypatch, mocker, app, client,
+                                  tmpdir):
+        self.mock_idempotency_store(monkeypatch, app, tmpdir)
+        sent = []
+
+        def callback(*args, **kwargs):
+            sent.append(kwargs)
+            return self.build_200_response(mocker)
+
+        monkeypatch.setattr(AmazonSES, "send", callback)
+
+        first = self.post_send(client, headers={"Idempotency-Key": "key"})
+        second = self.post_send(client, headers={"Idempotency-Key": "key"})
+        other = self.post_send(client, headers={"Idempotency-Key": "other"})
+
+        assert first.status_code == second.status_code == 200
+        assert second.json == first.json
+        assert second.headers["Idempotent-Replayed"] == "true"
+        assert "Idempotent-Replayed" not in first.headers
+        assert other.status_code == 200
+        assert len(sent) == 2
+
+    def test_send_idempotency_key_reused(self, monkeypatch, mocker, app,
+                                         client, tmpdir):
+        self.mock_idempotency_store(monkeypatch, app, tmpdir)
+        ok_resp = self.build_200_response(mocker)
+        self.mock_sending_for_provider(monkeypatch, AmazonSES, ok_resp)
+        self.post_send(client, headers={"Idempotency-Key": "key"})
+
+        resp = client.post(
+            "/send", data=json.dumps({"to": ["other@email.com", ]}),
+            headers={
+                "Content-type": "application/json", "Idempotency-Key": "key"
+            }
+        )
+
+        assert resp.status_code == 422
+
+    def test_send_idempotency_key_failure(self, monkeypatch, mocker, app,
+                                          client, tmpdir):
+        self.mock_idempotency_store(monkeypatch, app, tmpdir)
+        err_resp = self.build_503_response(mocker)
+        self.mock_sending_for_provider(monkeypatch, AmazonSES, err_resp)
+        self.mock_sending_for_provider(monkeypatch, Mailgun, err_resp)
+        assert self.post_send(
+            client, headers={"Idempotency-Key": "key"}
+        ).status_code == 503
+
+        # failures are not stored, so a retry sends the mail again
+        ok_resp = self.build_200_response(mocker)
+        self.mock_sending_for_provider(monkeypatch, AmazonSES, ok_resp)
+        resp = self.post_send(client, headers={"Idempotency-Key": "key"})
+
+        assert resp.status_code == 200
+        assert "Idempotent-Replayed" not in resp.headers
+
+    def test_send_idempotency_key_concurrent(self, monkeypatch, mocker, app,
+                                             tmpdir):
+        self.mock_idempotency_store(monkeypatch, app, tmpdir)
+        started = threading.Event()
+        sent = []
+
+        def callback(*args, **kwargs):
+            sent.append(kwargs)
+            started.set()
+            time.sleep(0.2)
+            return self.build_200_response(mocker)
+
+        monkeypatch.setattr(AmazonSES, "send", callback)
+
+        def post():
+            with app.test_client() as client:
+                return self.post_send(
+                    client, headers={"Idempotency-Key": "key"}
+                )
+
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            first = executor.submit(post)
+            assert started.wait(5)
+            second = executor.submit(post)
+            responses = [first.result(), second.result()]
+
+        assert [r.status_code for r in responses] == [200, 200]
+        assert responses[1].headers["Idempotent-Replayed"] == "true"
+        assert len(sent) == 1
+
+    def mock_idempotency_store(self, monkeypatch, app, tmpdir):
+        monkeypatch.setitem(app.config, "IDEMPOTENCY", {
+            "path": str(tmpdir.join("idempotency.sqlite")),
+        })
+        monkeypatch.setitem(app.extensions, "idempotency_store", None)
+
     def mock_sending_for_provider(self, monkeypatch, provider_class, response):
         def callback(*args, **kwargs):
             return response
 
         monkeypatch.setattr(provider_class, "send", callback)
 
-    def post_send(self, client):
+    def post_send(self, client, headers=None):
         return client.post(
             "/send",
             data=json.dumps({
@@ -54,12 +549,229 @@ class TestAPI():
                 "to": ["to@email.com", ],
             }),
             follow_redirects=True,
-            headers={
+            headers=dict({
                 "Content-type": "application/json",
                 "Accept": "application/json"
-            }
+            }, **(headers or {}))
         )
 
+    def test_templates(self, monkeypatch, app, client, tmpdir):
+        self.mock_template_renderer(monkeypatch, app, tmpdir)
+        url = url_for("template", template_id="welcome")
+
+        resp = client.put(url, json={"text": "Hello {{ name }}"})
+        assert resp.status_code == 201
+        revision = resp.json["revision"]
+        resp = client.put(url, json={"subject": "Hi", "text": "Hello"})
+        assert resp.status_code == 200
+        assert resp.json["revision"] > revision
+
+        assert client.get(url).json["subject"] == "Hi"
+        assert [t["id"] for t in client.get(
+            url_for("template_list")
+        ).json["templates"]] == ["welcome"]
+        assert client.delete(url).status_code == 204
+        assert client.get(url).status_code == 404
+
+    def test_invalid_template(self, monkeypatch, app, client, tmpdir):
+        self.mock_template_renderer(monkeypatch, app, tmpdir)
+        url = url_for("template", template_id="welcome")
+
+        assert client.put(url, json={"text": "{% if %}"}).status_code == 400
+        assert client.put(url, json={
+            "text": "text", "provider_templates": {"unknown": "welcome"}
+        }).status_code == 400
+
+    def test_send_template(self, monkeypatch, mocker, app, client, tmpdir):
+        self.mock_template_renderer(monkeypatch, app, tmpdir)
+        client.put(url_for("template", template_id="welcome"), json={
+            "subject": "Welcome", "text": "Hello {{ name }}",
+            "html": "<p>Hello {{ name }}</p>",
+            "provider_templates": {"amazon_ses": "Welcome"},
+        })
+        err_resp = self.build_503_response(mocker)
+        sent = {}
+
+        def callback(provider):
+            def send(self, *args, **kwargs):
+                sent[provider] = kwargs
+                return err_resp
+            return send
+
+        monkeypatch.setattr(AmazonSES, "send", callback("amazon_ses"))
+        monkeypatch.setattr(Mailgun, "send", callback("mailgun"))
+
+        client.post("/send", json={
+            "to": ["to@email.com"], "subject": "Custom",
+            "template_id": "welcome", "variables": {"name": "Test"},
+        })
+
+        # AmazonSES renders its own copy of the template
+        assert sent["amazon_ses"]["template"] == "Welcome"
+        assert sent["amazon_ses"]["template_variables"] == {"name": "Test"}
+        assert sent["mailgun"]["subject"] == "Custom"
+        assert sent["mailgun"]["text"] == "Hello Test"
+        assert sent["mailgun"]["html"] == "<p>Hello Test</p>"
+        for kwargs in sent.values():
+            assert "template_id" not in kwargs
+            assert "provider_templates" not in kwargs
+        assert "template" not in sent["mailgun"]
+
+    def test_send_provider_template_only(self, monkeypatch, mocker, app,
+                                         client, tmpdir):
+        self.mock_template_renderer(monkeypatch, app, tmpdir)
+        url = url_for("template", template_id="welcome")
+        assert client.put(url, json={}).status_code == 400
+        client.put(url, json={"provider_templates": {"mailgun": "welcome"}})
+        ok_resp = self.build_200_response(mocker)
+        sent = {}
+
+        def send(self, *args, **kwargs):
+            sent.update(kwargs)
+            return ok_resp
+
+        monkeypatch.setattr(AmazonSES, "send", send)
+        monkeypatch.setattr(Mailgun, "send", send)
+
+        resp = client.post("/send", json={
+            "to": ["to@email.com"], "template_id": "welcome",
+        })
+
+        assert resp.status_code == 200
+        assert resp.json["provider_used"] == "mailgun"
+        assert resp.json["providers"][0] == {
+            "provider": "amazon_ses", "status_code": 501,
+            "msg": "no copy of the template", "attempt": 1,
+        }
+        assert sent["template"] == "welcome"
+
+    def test_send_template_errors(self, monkeypatch, app, client, tmpdir):
+        self.mock_template_renderer(monkeypatch, app, tmpdir)
+        client.put(
+            url_for("template", template_id="welcome"),
+            json={"text": "Hello {{ name }}"}
+        )
+
+        resp = client.post("/send", json={
+            "to": ["to@email.com"], "template_id": "unknown",
+        })
+        assert resp.status_code == 404
+        resp = client.post("/send", json={
+            "to": ["to@email.com"], "template_id": "welcome",
+        })
+        assert resp.status_code == 400
+        assert "name" in resp.json["message"]
+
+    def mock_template_renderer(self, monkeypatch, app, tmpdir):
+        monkeypatch.setitem(app.config, "TEMPLATES", {
+            "path": str(tmpdir.join("templates.sqlite")),
+        })
+        monkeypatch.setitem(app.extensions, "template_renderer", None)
+
+    def test_send_suppressed(self, monkeypatch, mocker, client, tmpdir,
+                             mail_sender):
+        suppression_list = self.mock_suppression_list(
+            monkeypatch, mail_sender, tmpdir
+        )
+        suppression_list.add(["Bounced@email.com", "cc@email.com"])
+        ok_resp = self.build_200_response(mocker)
+        sent = []
+
+        def send(self, *args, **kwargs):
+            sent.append(kwargs)
+            return ok_resp
+
+        monkeypatch.setattr(AmazonSES, "send", send)
+        monkeypatch.setattr(Mailgun, "send", send)
+
+        resp = client.post("/send", json={
+            "to": ["to@email.com", "bounced@email.com"],
+            "cc": ["cc@email.com"],
+        })
+        assert resp.status_code == 200
+        assert resp.json["suppressed"] == ["bounced@email.com", "cc@email.com"]
+        assert sent[0]["to"] == ["to@email.com"]
+        assert sent[0]["cc"] == []
+
+        resp = client.post("/send", json={"to": ["BOUNCED@email.com"]})
+        assert resp.status_code == 422
+        assert resp.json["suppressed"] == ["BOUNCED@email.com"]
+        assert len(sent) == 1
+
+    def test_send_suppressed_async_providers(self, monkeypatch, app,
+                                             client, tmpdir, mail_sender):
+        pytest.importorskip("aiohttp")
+        monkeypatch.setitem(app.config, "ASYNC_PROVIDERS", True)
+        suppression_list = self.mock_suppression_list(
+            monkeypatch, mail_sender, tmpdir
+        )
+        suppression_list.add(["to@email.com"])
+        threads = []
+        check = suppression_list.check
+
+        def check_suppressed(*addresses):
+            threads.append(threading.current_thread().name)
+            return check(*addresses)
+
+        monkeypatch.setattr(suppression_list, "check", check_suppressed)
+
+        assert self.post_send(client).status_code == 422
+        assert threads and routes.event_loop.name not in threads
+
+    def test_suppressions(self, monkeypatch, client, tmpdir, mail_sender):
+        self.mock_suppression_list(monkeypatch, mail_sender, tmpdir)
+        url = url_for("suppression", address="Test@email.com")
+
+        assert client.get(url).status_code == 404
+        assert client.put(url, json={"reason": "bounce"}).status_code == 204
+        resp = client.get(url)
+        assert resp.status_code == 200
+        assert resp.json["address"] == "test@email.com"
+        assert resp.json["reason"] == "bounce"
+        assert client.delete(url).status_code == 204
+        assert client.delete(url).status_code == 404
+
+    def test_suppressions_import_export(self, monkeypatch, client, tmpdir,
+                                        mail_sender):
+        self.mock_suppression_list(monkeypatch, mail_sender, tmpdir)
+
+        resp = client.post(
+            url_for("suppression_import"),
+            data=(
+                "address,reason\n"
+                "first@email.com,bounce\n"
+                "\n"
+                "not an address\n"
+                "Second@email.com\n"
+                "\"third@email.com\",\"complaint, spam\"\n"
+            ),
+            content_type="text/csv"
+        )
+        assert resp.status_code == 200
+        assert resp.json == {"imported": 3, "invalid": 1}
+
+        resp = client.get(url_for("suppression_export"))
+        assert resp.status_code == 200
+        assert resp.mimetype == "text/csv"
+        rows = list(csv.reader(io.StringIO(resp.get_data(as_text=True))))
+        assert rows[0] == ["address", "reason", "created"]
+        assert [r[:2] for r in rows[1:]] == [
+            ["first@email.com", "bounce"], ["second@email.com", ""],
+            ["third@email.com", "complaint, spam"],
+        ]
+
+    def test_suppressions_disabled(self, monkeypatch, client, mail_sender):
+        monkeypatch.setattr(mail_sender, "suppression_list", None)
+
+        assert client.get(url_for("suppression_export")).status_code == 404
+
+    def mock_suppression_list(self, monkeypatch, mail_sender, tmpdir):
+        suppression_list = SuppressionList(
+            str(tmpdir.join("suppressions.sqlite")), capacity=100
+        )
+        monkeypatch.setattr(mail_sender, "suppression_list", suppression_list)
+        return suppression_list
+
     def test_check_validation(self, monkeypatch, mocker, client):
         address = "test@email.com"
         self.mock_check_validation_for_provider(
@@ -71,6 +783,150 @@ class TestAPI():
         assert resp.status_code == 200
         assert resp.json["providers"][0]["validation"] == "Success"
 
+    def test_check_validation_timeout(self, monkeypatch, app, client):
+        monkeypatch.setitem(app.config, "PROVIDERS_TIMEOUT", 0.05)
+
+        def callback(self, address):
+            time.sleep(0.2)
+            return {address: "Success"}
+
+        monkeypatch.setattr(
+            AmazonSES, "check_addr_validation_status", callback
+        )
+
+        resp = client.get(url_for("validation", address="test@email.com"))
+
+        assert resp.status_code == 200
+        assert resp.json["providers"] == [
+            {"provider": "amazon_ses", "validation": "Timeout"},
+        ]
+
+    def test_validate_concurrently(self, monkeypatch, mocker, client):
+        ok_resp = self.build_200_response(mocker)
+
+        def callback(self, address):
+            time.sleep(0.2)
+            return ok_resp
+
+        monkeypatch.setattr(AmazonSES, "validate_addr", callback)
+        monkeypatch.setattr(Mailgun, "validate_addr", callback)
+
+        start = time.monotonic()
+        resp = self.post_validate(client)
+
+        assert time.monotonic() - start < 0.4
+        assert resp.status_code == 200
+        assert (
+            [p["provider"] for p in resp.json["providers"]] ==
+            ["amazon_ses", "mailgun"]
+        )
+
+    def test_validate_timeout(self, monkeypatch, mocker, app, client):
+        monkeypatch.setitem(app.config, "PROVIDERS_TIMEOUT", 0.05)
+        ok_resp = self.build_200_response(mocker)
+
+        def callback(self, address):
+            time.sleep(0.2)
+            return ok_resp
+
+        monkeypatch.setattr(AmazonSES, "validate_addr", callback)
+
+        resp = self.post_validate(client)
+
+        assert resp.status_code == 503
+        assert resp.json["providers"][0]["status_code"] == 504
+
+    def test_validate_async_providers(self, monkeypatch, mocker, app,
+                                      client):
+        pytest.importorskip("aiohttp")
+        monkeypatch.setitem(app.config, "ASYNC_PROVIDERS", True)
+        monkeypatch.setitem(app.config, "PROVIDERS_TIMEOUT", 0.05)
+        ok_resp = self.build_200_response(mocker)
+
+        async def callback(self, address):
+            await asyncio.sleep(0.2)
+            return ok_resp
+
+        monkeypatch.setattr(aio.AsyncAmazonSES, "validate_addr", callback)
+
+        resp = self.post_validate(client)
+
+        assert resp.status_code == 503
+        assert resp.json["providers"] == [{
+            "provider": "amazon_ses", "status_code": 504,
+            "msg": "Gateway Timeout",
+        }]
+
+    def test_bulk_check_validation(self, monkeypatch, client):
+        requested_chunks = []
+
+        def callback(self, *addresses):
+            requested_chunks.append(addresses)
+            return {a: "Success" for a in addresses}
+
+        monkeypatch.setattr(
+            AmazonSES, "check_addr_validation_status", callback
+        )
+        addresses = ["{}@email.com".format(i) for i in range(250)]
+
+        resp = client.post(
+            url_for("bulk_validation"),
+            data=json.dumps({"addresses": addresses + addresses[:10]}),
+            headers={"Content-type": "application/json"}
+        )
+
+        assert resp.status_code == 200
+        assert resp.mimetype == "application/x-ndjson"
+        lines = [json.loads(l) for l in resp.data.decode().splitlines()]
+        assert sorted(l["address"] for l in lines) == sorted(addresses)
+        assert all(l["validation"] == "Success" for l in lines)
+        assert sorted(len(c) for c in requested_chunks) == [50, 100, 100]
+
+    def test_bulk_check_validation_window(self, monkeypatch, app, client):
+        # more threads than the window of the request
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+        monkeypatch.setattr(routes, "get_executor", lambda: executor)
+        monkeypatch.setitem(app.config, "PROVIDERS_WORKERS", 1)
+        lock = threading.Lock()
+        in_flight = []
+        max_in_flight = []
+
+        def callback(self, *addresses):
+            with lock:
+                in_flight.append(addresses)
+                max_in_flight.append(len(in_flight))
+            time.sleep(0.01)
+            with lock:
+                in_flight.remove(addresses)
+            return {a: "Success" for a in addresses}
+
+        monkeypatch.setattr(
+            AmazonSES, "check_addr_validation_status", callback
+        )
+        addresses = ["{}@email.com".format(i) for i in range(250)]
+
+        resp = client.post(
+            url_for("bulk_validation"),
+            data=json.dumps({"addresses": addresses}),
+            headers={"Content-type": "application/json"}
+        )
+
+        assert resp.status_code == 200
+        assert len(resp.data.decode().splitlines()) == 250
+        assert max_in_flight == [1, 1, 1]
+        executor.shutdown()
+
+    def test_bulk_check_validation_too_many(self, monkeypatch, app, client):
+        monkeypatch.setitem(app.config, "BULK_VALIDATION_MAX_ADDRESSES", 1)
+
+        resp = client.post(
+            url_for("bulk_validation"),
+            data=json.dumps({"addresses": ["a@email.com", "b@email.com"]}),
+            headers={"Content-type": "application/json"}
+        )
+
+        assert resp.status_code == 413
+
     def test_validate(self, monkeypatch, mocker, client):
         self.mock_validation_for_provider(
             monkeypatch, AmazonSES, self.build_200_response(mocker)
@@ -107,6 +963,55 @@ class TestAPI():
             provider_class, "validate_addr", callback
         )
 
+    def test_pool_stats(self, client):
+        resp = client.get(url_for("pool_stats"))
+
+        assert resp.status_code == 200
+        assert (
+            [p["provider"] for p in resp.json["pools"]] ==
+            ["amazon_ses", "mailgun"]
+        )
+
+    def test_metrics(self, monkeypatch, mocker, client):
+        magic_mocker_resp = self.build_503_then_200_resp(mocker)
+        self.mock_sending_for_provider(
+            monkeypatch, AmazonSES, magic_mocker_resp
+        )
+        self.mock_sending_for_provider(
+            monkeypatch, Mailgun, magic_mocker_resp
+        )
+        self.post_send(client)
+
+        resp = client.get(url_for("metrics"))
+
+        assert resp.status_code == 200
+        assert resp.content_type.startswith("text/plain")
+        lines = resp.data.decode().splitlines()
+        assert any(
+            l.startswith('mail_sender_failover_depth_total{depth="2"} ')
+            for l in lines
+        )
+        assert any(
+            l.startswith(
+                'mail_sender_provider_responses_total'
+                '{provider="amazon_ses",status_code="503"} '
+            ) for l in lines
+        )
+
+    def test_routing_stats(self, client):
+        resp = client.get(url_for("routing_stats"))
+
+        assert resp.status_code == 200
+        assert resp.json["policy"] == "static"
+
+    def test_cache_stats(self, client):
+        resp = client.get(url_for("cache_stats"))
+
+        assert resp.status_code == 200
+        assert (
+            [c["provider"] for c in resp.json["caches"]] == ["amazon_ses"]
+        )
+
     def build_200_response(self, mocker):
         resp = mocker.stub()
         resp.status_code = 200
@@ -0,0 +1,191 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+import pytest
+import yaml
+
+import mail_sender_daemon
+from mail_sender_daemon.api.sender import get_mail_sender
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CONFIG_FILE = os.path.join(ROOT_DIR, "config.yml.default")
+
+
+class TestCreateApp():
+    def test_config_overrides(self, data_paths):
+        app = mail_sender_daemon.create_app(
+            CONFIG_FILE, MAILGUN_API_KEY="key", **data_paths
+        )
+
+        assert app.config["MAILGUN_API_KEY"] == "key"
+        assert "SEND_FROM" in app.config
+
+    def test_lazy_providers(self, data_paths):
+        app = mail_sender_daemon.create_app(CONFIG_FILE, **data_paths)
+        assert "mail_sender" not in app.extensions
+
+        resp = app.test_client().get("/admin/routing")
+
+        assert resp.status_code == 200
+        assert app.extensions["mail_sender"] is get_mail_sender(app)
+
+    def test_apps_do_not_share_providers(self, data_paths):
+        apps = [
+            mail_sender_daemon.create_app(CONFIG_FILE, **data_paths)
+            for _ in range(2)
+        ]
+
+        senders = [get_mail_sender(app) for app in apps]
+
+        assert senders[0] is not senders[1]
+        assert (
+            senders[0].mail_providers["mailgun"] is not
+            senders[1].mail_providers["mailgun"]
+        )
+
+    def test_default_app(self, app):
+        assert mail_sender_daemon.app is mail_sender_daemon.app
+        assert mail_sender_daemon.app is not app
+
+    def test_lazy_imports(self, data_paths):
+        script = (
+            "import sys, mail_sender_daemon; "
+            "mail_sender_daemon.create_app({!r}, **{!r}); "
+            "print(' '.join(m for m in ('requests', 'aiohttp') "
+            "if m in sys.modules))".format(CONFIG_FILE, data_paths)
+        )
+        output = subprocess.check_output(
+            [sys.executable, "-c", script], cwd=ROOT_DIR
+        )
+
+        assert output.strip() == b""
+
+
+class TestConfigReload():
+    @pytest.fixture()
+    def config_file(self, tmpdir, data_paths):
+        with open(CONFIG_FILE) as f:
+            config = yaml.safe_load(f)
+        config["CONFIG_RELOAD"] = {"signal": False, "drain_timeout": 1}
+        config.update(data_paths)
+
+        path = tmpdir.join("config.yml")
+        path.write(yaml.safe_dump(config))
+        return path
+
+    def update_config(self, config_file, **settings):
+        config = yaml.safe_load(config_file.read())
+        config.update(settings)
+        config_file.write(yaml.safe_dump(config))
+
+    def test_reload(self, config_file):
+        app = mail_sender_daemon.create_app(str(config_file))
+        previous = get_mail_sender(app)
+
+        self.update_config(config_file, MAILGUN_API_KEY="new key")
+        assert app.extensions["config_reloader"].reload()
+
+        mail_sender = get_mail_sender(app)
+        assert mail_sender is not previous
+        assert app.config["MAILGUN_API_KEY"] == "new key"
+        assert mail_sender.mail_providers["mailgun"].api_key == "new key"
+        # still usable by the requests in flight
+        assert previous.mail_providers["mailgun"].api_key != "new key"
+
+    def test_reload_keeps_overrides(self, config_file):
+        app = mail_sender_daemon.create_app(
+            str(config_file), MAILGUN_API_KEY="override"
+        )
+
+        self.update_config(config_file, MAILGUN_API_KEY="new key")
+        assert app.extensions["config_reloader"].reload()
+
+        assert app.config["MAILGUN_API_KEY"] == "override"
+
+    def test_reload_removed_settings(self, config_file):
+        app = mail_sender_daemon.create_app(str(config_file), TESTING=True)
+        assert get_mail_sender(app).suppression_list is not None
+
+        config = yaml.safe_load(config_file.read())
+        del config["SUPPRESSIONS"]
+        config_file.write(yaml.safe_dump(config))
+        assert app.extensions["config_reloader"].reload()
+
+        assert "SUPPRESSIONS" not in app.config
+        assert get_mail_sender(app).suppression_list is None
+        # defaults of Flask, and overrides, are kept
+        assert app.config["TESTING"]
+        assert "SECRET_KEY" in app.config
+
+    def test_reload_invalid(self, config_file):
+        app = mail_sender_daemon.create_app(str(config_file))
+        previous = get_mail_sender(app)
+
+        self.update_config(config_file, SEND_FROM={"amazon_ses": "a@b.c"})
+        reloader = app.extensions["config_reloader"]
+        assert not reloader.reload()
+        config_file.write("{invalid")
+        assert not reloader.reload()
+
+        assert get_mail_sender(app) is previous
+        assert reloader.failures == 2
+
+    def test_reload_on_modification(self, config_file):
+        self.update_config(config_file, CONFIG_RELOAD={"watch_interval": 0.01})
+        app = mail_sender_daemon.create_app(str(config_file))
+        previous = get_mail_sender(app)
+        app.test_client().get("/admin/routing")
+
+        self.update_config(config_file, MAILGUN_API_KEY="new key")
+        deadline = time.time() + 5
+        while get_mail_sender(app) is previous:
+            assert time.time() < deadline
+            time.sleep(0.01)
+
+        assert app.config["MAILGUN_API_KEY"] == "new key"
+
+    def test_reload_on_signal(self, config_file):
+        app = mail_sender_daemon.create_app(str(config_file))
+        previous = get_mail_sender(app)
+        previous_handler = signal.getsignal(signal.SIGUSR1)
+        reloader = app.extensions["config_reloader"]
+
+        try:
+            assert reloader.install_signal_handler(signal.SIGUSR1)
+            os.kill(os.getpid(), signal.SIGUSR1)
+            deadline = time.time() + 5
+            while reloader.reloads == 0:
+                assert time.time() < deadline
+                time.sleep(0.01)
+        finally:
+            signal.signal(signal.SIGUSR1, previous_handler)
+
+        assert get_mail_sender(app) is not previous
+
+
+class TestSharedState():
+    def test_apps_share_state(self, tmpdir, data_paths):
+        shared_state = {
+            "backend": "sqlite", "path": str(tmpdir.join("state.sqlite")),
+            "sync_interval": 0,
+        }
+        senders = [
+            get_mail_sender(mail_sender_daemon.create_app(
+                CONFIG_FILE, SHARED_STATE=shared_state,
+                CIRCUIT_BREAKER={"failure_threshold": 1}, **data_paths
+            )) for _ in range(2)
+        ]
+
+        senders[0].mail_providers["amazon_ses"].validation_cache.set(
+            "test@email.com", "Success", 60
+        )
+        senders[0].circuit_breakers["mailgun"].record_failure()
+
+        assert senders[1].mail_providers[
+            "amazon_ses"
+        ].check_addr_validation_status("test@email.com") == {
+            "test@email.com": "Success"
+        }
+        assert not senders[1].circuit_breakers["mailgun"].allow_request()
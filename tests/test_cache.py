@@ -0,0 +1,42 @@
+import time
+
+from mail_sender_daemon.cache import TTLCache
+
+
+class TestTTLCache():
+    def test_get_set(self):
+        cache = TTLCache()
+        cache.set("key", "value", ttl=60)
+
+        assert cache.get("key") == "value"
+        assert cache.get("unknown") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_expiration(self):
+        cache = TTLCache()
+        cache.set("key", "value", ttl=0.01)
+        time.sleep(0.02)
+
+        assert cache.get("key") is None
+        assert cache.stats()["size"] == 0
+
+    def test_lru_eviction(self):
+        cache = TTLCache(max_size=2)
+        cache.set("a", 1, ttl=60)
+        cache.set("b", 2, ttl=60)
+        cache.get("a")
+        cache.set("c", 3, ttl=60)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+
+    def test_invalidate(self):
+        cache = TTLCache()
+        cache.set("a", 1, ttl=60)
+        cache.set("b", 2, ttl=60)
+        cache.invalidate("a")
+
+        assert cache.get("a") is None
+        assert cache.get("b") == 2
@@ -0,0 +1,46 @@
+import time
+
+from mail_sender_daemon.circuit_breaker import CircuitBreaker
+
+
+class TestCircuitBreaker():
+    def test_open_after_threshold(self):
+        breaker = CircuitBreaker(failure_threshold=2)
+        breaker.record_failure()
+        assert breaker.allow_request()
+
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow_request()
+
+    def test_success_resets_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_half_open(self):
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert breaker.allow_request()
+        # only one trial request at a time
+        assert not breaker.allow_request()
+
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_half_open_failure(self):
+        breaker = CircuitBreaker(failure_threshold=5, recovery_timeout=0.01)
+        for _ in range(5):
+            breaker.record_failure()
+        time.sleep(0.02)
+        breaker.allow_request()
+        breaker.record_failure()
+
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.stats()["retry_in"] > 0
@@ -0,0 +1,18 @@
+from mail_sender_daemon.database import connect, create_database
+
+
+def test_create_database(tmpdir):
+    path = str(tmpdir.join("sub", "db.sqlite"))
+    create_database(
+        path, "CREATE TABLE IF NOT EXISTS t (k TEXT PRIMARY KEY)",
+        "INSERT INTO t VALUES ('key')"
+    )
+
+    conn = connect(path)
+    try:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("SELECT k FROM t").fetchone()["k"] == "key"
+        # autocommit, transactions are begun explicitly
+        assert conn.isolation_level is None
+    finally:
+        conn.close()
@@ -0,0 +1,32 @@
+import json
+import pytest
+
+from mail_sender_daemon.api import fast_json
+
+
+@pytest.fixture(params=["library", "json"])
+def codec(request, monkeypatch):
+    if request.param == "json":
+        monkeypatch.setattr(fast_json, "_loads", None)
+        monkeypatch.setattr(fast_json, "_dumps", None)
+    return fast_json
+
+
+def test_loads(codec):
+    document = {"to": ["to@email.com"], "subject": "Test é"}
+
+    assert codec.loads(json.dumps(document).encode()) == document
+    assert codec.loads(json.dumps(document)) == document
+    # over 64 bits, unsupported by orjson
+    assert codec.loads("[{}]".format(2 ** 70)) == [2 ** 70]
+    with pytest.raises(ValueError):
+        codec.loads(b"{")
+
+
+def test_dumps(codec):
+    document = {"provider_used": "mailgun", "msg": "é", "count": 2 ** 70}
+
+    assert json.loads(codec.dumps(document)) == document
+    assert codec.dumps(document, indent=2) == json.dumps(document, indent=2)
+    with pytest.raises(TypeError):
+        codec.dumps({"unknown": object()})
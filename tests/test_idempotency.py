@@ -0,0 +1,81 @@
+import threading
+import time
+import pytest
+
+from mail_sender_daemon.idempotency import IdempotencyStore
+
+
+class TestIdempotencyStore():
+    @pytest.fixture()
+    def store(self, tmpdir):
+        return IdempotencyStore(str(tmpdir.join("idempotency.sqlite")))
+
+    def test_reserve_and_complete(self, store):
+        assert store.reserve("key", "hash") is None
+        assert store.reserve("key", "hash") == {
+            "fingerprint": "hash", "status": None, "response": None,
+        }
+
+        store.complete("key", {"provider_used": "mailgun"}, 200)
+
+        assert store.reserve("key", "hash") == {
+            "fingerprint": "hash", "status": 200,
+            "response": {"provider_used": "mailgun"},
+        }
+
+    def test_release(self, store):
+        store.reserve("key", "hash")
+        store.release("key")
+
+        assert store.get("key") is None
+        assert store.reserve("key", "hash") is None
+
+    def test_fingerprint(self, store):
+        assert store.fingerprint({"to": ["a"], "subject": "b"}) == (
+            store.fingerprint({"subject": "b", "to": ["a"]})
+        )
+        assert store.fingerprint({"to": ["a"]}) != (
+            store.fingerprint({"to": ["b"]})
+        )
+
+    def test_expired(self, tmpdir):
+        store = IdempotencyStore(
+            str(tmpdir.join("idempotency.sqlite")), ttl=0, lock_timeout=0
+        )
+        store.reserve("pending", "hash")
+        store.reserve("done", "hash")
+        store.complete("done", {}, 200)
+        time.sleep(0.01)
+
+        assert store.get("done") is None
+        assert store.reserve("pending", "hash") is None
+
+    def test_prune(self, tmpdir):
+        store = IdempotencyStore(
+            str(tmpdir.join("idempotency.sqlite")), max_keys=2
+        )
+        for key in ("a", "b", "c"):
+            store.reserve(key, "hash")
+        store.prune()
+
+        assert store.get("a") is None
+        assert store.get("c") is not None
+
+    def test_shared_between_instances(self, store):
+        other = IdempotencyStore(store.path)
+        store.reserve("key", "hash")
+        store.complete("key", {}, 202)
+
+        assert other.get("key")["status"] == 202
+
+    def test_wait(self, store):
+        store.reserve("key", "hash")
+        timer = threading.Timer(0.05, store.complete, ("key", {}, 200))
+        timer.start()
+        try:
+            assert store.wait("key", 5)["status"] == 200
+        finally:
+            timer.join()
+
+        store.reserve("other", "hash")
+        assert store.wait("other", 0.01)["status"] is None
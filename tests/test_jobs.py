@@ -0,0 +1,114 @@
+import sqlite3
+import time
+import pytest
+
+from mail_sender_daemon.jobs import JobQueue, WorkerPool
+
+
+class TestJobQueue():
+    @pytest.fixture()
+    def job_queue(self, tmpdir):
+        return JobQueue(str(tmpdir.join("queue.sqlite")))
+
+    def test_put_and_claim(self, job_queue):
+        job_id = job_queue.put({"to": ["to@email.com", ]})
+
+        assert job_queue.get(job_id)["status"] == JobQueue.QUEUED
+        assert job_queue.claim() == (job_id, {"to": ["to@email.com", ]})
+        assert job_queue.get(job_id)["status"] == JobQueue.SENDING
+        assert job_queue.claim() is None
+
+    def test_claim_fifo(self, job_queue):
+        first_id = job_queue.put({"to": ["first@email.com", ]})
+        job_queue.put({"to": ["second@email.com", ]})
+
+        assert job_queue.claim()[0] == first_id
+
+    def test_claim_expired_lease(self, tmpdir):
+        job_queue = JobQueue(str(tmpdir.join("queue.sqlite")), lease_timeout=0)
+        job_id = job_queue.put({"to": ["to@email.com", ]})
+        job_queue.claim()
+        time.sleep(0.01)
+
+        assert job_queue.claim()[0] == job_id
+
+    def test_complete(self, job_queue):
+        job_id = job_queue.put({"to": ["to@email.com", ]})
+        job_queue.claim()
+        details = {
+            "providers": [
+                {"provider": "mailgun", "status_code": 200, "msg": "OK"},
+            ],
+            "provider_used": "mailgun",
+        }
+        job_queue.complete(job_id, details, sent=True)
+
+        job = job_queue.get(job_id)
+        assert job["status"] == JobQueue.SENT
+        assert job["provider_used"] == "mailgun"
+        assert job["providers"] == details["providers"]
+
+    def test_prune(self, tmpdir):
+        job_queue = JobQueue(str(tmpdir.join("queue.sqlite")), ttl=0)
+        done_id = job_queue.put({"to": ["to@email.com", ]})
+        job_queue.claim()
+        job_queue.complete(done_id, {"providers": []}, sent=False)
+        queued_id = job_queue.put({"to": ["to@email.com", ]})
+        time.sleep(0.01)
+        job_queue.prune()
+
+        assert job_queue.get(done_id) is None
+        assert job_queue.get(queued_id)["status"] == JobQueue.QUEUED
+
+    def test_get_unknown(self, job_queue):
+        assert job_queue.get("unknown") is None
+
+
+class TestWorkerPool():
+    def test_drain_queue(self, tmpdir, wait_for_job):
+        job_queue = JobQueue(str(tmpdir.join("queue.sqlite")))
+
+        def send_fn(mail_params):
+            if mail_params["to"] == ["fail@email.com", ]:
+                return {"providers": []}, 503
+            return {"providers": [], "provider_used": "mailgun"}, 200
+
+        pool = WorkerPool(job_queue, send_fn, workers=2, poll_interval=0.05)
+        sent_id = pool.put({"to": ["to@email.com", ]})
+        failed_id = pool.put({"to": ["fail@email.com", ]})
+        try:
+            wait_for_job(job_queue, sent_id)
+            wait_for_job(job_queue, failed_id)
+        finally:
+            pool.stop()
+
+        assert job_queue.get(sent_id)["status"] == JobQueue.SENT
+        assert job_queue.get(failed_id)["status"] == JobQueue.FAILED
+
+    def test_complete_error(self, tmpdir, wait_for_job):
+        job_queue = JobQueue(str(tmpdir.join("queue.sqlite")))
+        complete = job_queue.complete
+        errors = []
+
+        def complete_once(*args):
+            if not errors:
+                errors.append(True)
+                raise sqlite3.OperationalError("database is locked")
+            complete(*args)
+
+        job_queue.complete = complete_once
+        pool = WorkerPool(
+            job_queue, lambda mail_params: ({"providers": []}, 200),
+            workers=1, poll_interval=0.01
+        )
+        first_id = pool.put({"to": ["first@email.com", ]})
+        second_id = pool.put({"to": ["second@email.com", ]})
+        try:
+            wait_for_job(job_queue, first_id)
+            wait_for_job(job_queue, second_id)
+        finally:
+            pool.stop()
+
+        assert errors
+        assert job_queue.get(first_id)["status"] == JobQueue.SENT
+        assert job_queue.get(second_id)["status"] == JobQueue.SENT
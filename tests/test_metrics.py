@@ -0,0 +1,84 @@
+import json
+import os
+import subprocess
+import sys
+
+from mail_sender_daemon.metrics import MetricsRegistry
+
+
+class TestMetricsRegistry():
+    def build_registry(self, directory=None):
+        registry = MetricsRegistry(directory)
+        registry.counter("requests_total", "Requests", ("provider", ))
+        registry.gauge("in_flight", "In flight requests")
+        registry.histogram(
+            "duration_seconds", "Duration", ("provider", ), buckets=(0.1, 1)
+        )
+        return registry
+
+    def test_expose(self):
+        registry = self.build_registry()
+        registry.metrics["requests_total"].inc(provider="mailgun")
+        registry.metrics["requests_total"].inc(2, provider="mailgun")
+        registry.metrics["duration_seconds"].observe(0.5, provider="mailgun")
+        registry.metrics["duration_seconds"].observe(2, provider="mailgun")
+
+        lines = registry.expose().splitlines()
+
+        assert "# TYPE requests_total counter" in lines
+        assert 'requests_total{provider="mailgun"} 3' in lines
+        buckets = [l for l in lines if l.startswith("duration_seconds_b")]
+        assert buckets == [
+            'duration_seconds_bucket{provider="mailgun",le="0.1"} 0',
+            'duration_seconds_bucket{provider="mailgun",le="1"} 1',
+            'duration_seconds_bucket{provider="mailgun",le="+Inf"} 2',
+        ]
+        assert 'duration_seconds_sum{provider="mailgun"} 2.5' in lines
+        assert 'duration_seconds_count{provider="mailgun"} 2' in lines
+
+    def test_track_in_progress(self):
+        registry = self.build_registry()
+        gauge = registry.metrics["in_flight"]
+
+        with gauge.track_in_progress():
+            assert gauge.snapshot() == [[[], 1]]
+        assert gauge.snapshot() == [[[], 0]]
+
+    def test_aggregate_processes(self, tmpdir):
+        registry = self.build_registry(str(tmpdir))
+        registry.metrics["requests_total"].inc(provider="mailgun")
+        registry.metrics["in_flight"].inc()
+
+        # let another process write its metrics, then exit
+        other = self.build_registry(str(tmpdir))
+        other.metrics["requests_total"].inc(2, provider="mailgun")
+        other.metrics["in_flight"].inc()
+        snapshot = other.snapshot()
+        snapshot["pid"] = self.get_stopped_pid()
+        tmpdir.join("metrics-{}.json".format(snapshot["pid"])).write(
+            json.dumps(snapshot)
+        )
+
+        collected = registry.collect()
+
+        assert collected["requests_total"] == {("mailgun", ): 3}
+        # gauges of stopped processes are ignored
+        assert collected["in_flight"] == {(): 1}
+
+    def test_flush(self, tmpdir):
+        registry = self.build_registry(str(tmpdir))
+        registry.metrics["requests_total"].inc(provider="mailgun")
+
+        registry.flush()
+
+        path = tmpdir.join("metrics-{}.json".format(os.getpid()))
+        assert json.loads(path.read())["metrics"]["requests_total"] == [
+            [["mailgun"], 1]
+        ]
+        # own file is not counted twice
+        assert registry.collect()["requests_total"] == {("mailgun", ): 1}
+
+    def get_stopped_pid(self):
+        process = subprocess.Popen([sys.executable, "-c", "pass"])
+        process.wait()
+        return process.pid
@@ -0,0 +1,85 @@
+import time
+import pytest
+
+from mail_sender_daemon.rate_limiter import QuotaTokenBucket, TokenBucket
+
+
+class TestTokenBucket():
+    def test_burst(self):
+        bucket = TokenBucket(rate=1, burst=2)
+
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == 0
+        assert bucket.reserve() is None
+        assert bucket.stats()["rejections"] == 1
+
+    def test_reserve_wait(self):
+        bucket = TokenBucket(rate=10, burst=1)
+        bucket.reserve()
+
+        first_wait = bucket.reserve(max_wait=1)
+        second_wait = bucket.reserve(max_wait=1)
+
+        assert first_wait == pytest.approx(0.1, abs=0.01)
+        # the first caller reserved its token
+        assert second_wait == pytest.approx(0.2, abs=0.01)
+        assert bucket.stats()["waits"] == 2
+
+    def test_acquire(self):
+        bucket = TokenBucket(rate=20, burst=1)
+        bucket.acquire()
+
+        start = time.monotonic()
+        assert bucket.acquire(max_wait=1)
+        assert time.monotonic() - start >= 0.04
+        assert not bucket.acquire(max_wait=0)
+
+    def test_tokens_limited_to_burst(self):
+        bucket = TokenBucket(rate=1, burst=2)
+
+        assert bucket.reserve(tokens=10) == 0
+        assert bucket.reserve() is None
+
+    def test_refund(self):
+        bucket = TokenBucket(rate=1, burst=1)
+        bucket.reserve()
+        bucket.refund()
+
+        assert bucket.reserve() == 0
+
+
+class TestQuotaTokenBucket():
+    def test_refresh(self):
+        bucket = QuotaTokenBucket(lambda: 14, rate=1)
+        assert bucket.rate == 1
+
+        bucket.refresh()
+
+        assert bucket.rate == 14
+        assert bucket.burst == 14
+
+    def test_refresh_keeps_burst(self):
+        bucket = QuotaTokenBucket(lambda: 14, rate=1, burst=3)
+
+        bucket.refresh()
+
+        assert bucket.rate == 14
+        assert bucket.burst == 3
+
+    def test_refresh_on_reserve(self):
+        bucket = QuotaTokenBucket(lambda: 14, rate=1)
+
+        bucket.reserve()
+        deadline = time.monotonic() + 5
+        while bucket.rate != 14:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+    def test_refresh_error(self):
+        def fetch_rate():
+            raise ValueError()
+
+        bucket = QuotaTokenBucket(fetch_rate, rate=1)
+        bucket.refresh()
+
+        assert bucket.rate == 1
@@ -0,0 +1,45 @@
+import pytest
+
+from mail_sender_daemon.retry import RetryBudget, RetryPolicy
+
+
+class TestRetryPolicy():
+    def test_is_retryable(self):
+        policy = RetryPolicy(
+            retry_on=(503, ), retry_on_error_codes=("Throttling", )
+        )
+
+        assert policy.is_retryable(503)
+        assert not policy.is_retryable(500)
+        assert policy.is_retryable(400, "Throttling")
+        assert not policy.is_retryable(400, "MessageRejected")
+
+    @pytest.mark.parametrize("attempt,max_delay", [(1, 1), (2, 2), (5, 5)])
+    def test_get_delay(self, attempt, max_delay):
+        policy = RetryPolicy(base_delay=1, max_delay=5)
+
+        delays = [policy.get_delay(attempt) for _ in range(100)]
+
+        assert all(0 <= d <= max_delay for d in delays)
+        # full jitter
+        assert len(set(delays)) > 1
+
+
+class TestRetryBudget():
+    def test_min_per_second(self):
+        budget = RetryBudget(ratio=0, min_per_second=1, window=2)
+
+        assert budget.withdraw()
+        assert budget.withdraw()
+        assert not budget.withdraw()
+        assert budget.stats()["exhausted"] == 1
+
+    def test_ratio(self):
+        budget = RetryBudget(ratio=0.5, min_per_second=0)
+        for _ in range(4):
+            budget.record_request()
+
+        assert budget.withdraw()
+        assert budget.withdraw()
+        assert not budget.withdraw()
+        assert budget.stats() == {"requests": 4, "retries": 2, "exhausted": 1}
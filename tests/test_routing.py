@@ -0,0 +1,70 @@
+import collections
+import random
+import pytest
+
+from mail_sender_daemon.routing import (
+    ProviderStats, LatencyAwareRoutingPolicy, StaticRoutingPolicy,
+    WeightedRoutingPolicy, build_routing_policy
+)
+
+
+PROVIDERS = ("amazon_ses", "mailgun")
+
+
+class TestProviderStats():
+    def test_ewma(self):
+        stats = ProviderStats(alpha=0.5)
+        stats.record(1, True)
+        stats.record(3, False)
+
+        assert stats.latency == 2
+        assert stats.success_rate == 0.5
+        assert stats.samples == 2
+
+
+class TestRoutingPolicies():
+    def test_static(self):
+        assert StaticRoutingPolicy().order(PROVIDERS) == list(PROVIDERS)
+
+    def test_weighted(self):
+        random.seed(0)
+        policy = WeightedRoutingPolicy(weights={"amazon_ses": 3})
+        first_providers = collections.Counter(
+            policy.order(PROVIDERS)[0] for _ in range(1000)
+        )
+
+        assert 650 < first_providers["amazon_ses"] < 850
+        assert sorted(policy.order(PROVIDERS)) == sorted(PROVIDERS)
+
+    def test_weighted_adaptive(self):
+        random.seed(0)
+        policy = WeightedRoutingPolicy(adaptive=True)
+        policy.record("amazon_ses", 0.1, False)
+        first_providers = collections.Counter(
+            policy.order(PROVIDERS)[0] for _ in range(1000)
+        )
+
+        assert first_providers["mailgun"] > 950
+
+    def test_latency_aware(self):
+        policy = LatencyAwareRoutingPolicy(ewma_alpha=0.5)
+        policy.record("amazon_ses", 0.5, True)
+        policy.record("mailgun", 0.1, True)
+        assert policy.order(PROVIDERS) == ["mailgun", "amazon_ses"]
+
+        for _ in range(3):
+            policy.record("mailgun", 0.1, False)
+        assert policy.order(PROVIDERS) == ["amazon_ses", "mailgun"]
+
+    def test_latency_aware_unknown_first(self):
+        policy = LatencyAwareRoutingPolicy()
+        policy.record("amazon_ses", 0.1, True)
+
+        assert policy.order(PROVIDERS) == ["mailgun", "amazon_ses"]
+
+    def test_build_routing_policy(self):
+        policy = build_routing_policy("weighted", weights={"mailgun": 2})
+
+        assert isinstance(policy, WeightedRoutingPolicy)
+        with pytest.raises(ValueError):
+            build_routing_policy("unknown")
@@ -0,0 +1,107 @@
+import jsonschema
+import pytest
+from flask_restplus import fields
+from werkzeug.exceptions import BadRequest
+
+from mail_sender_daemon.api.models import batch_mail_model, mail_model
+from mail_sender_daemon.api.schema import (
+    CompiledModel, SchemaCompiler, UnsupportedSchema
+)
+
+
+SCHEMA = {
+    "type": "object",
+    "required": ["name"],
+    "properties": {
+        "name": {"type": "string", "minLength": 1, "maxLength": 5},
+        "tags": {
+            "type": "array", "items": {"type": "string"}, "maxItems": 2,
+        },
+        "kind": {"type": "string", "enum": ["a", "b"]},
+        "count": {"type": ["integer", "null"]},
+        "child": {"$ref": "#/definitions/Child"},
+    },
+    "patternProperties": {"^x-": {"type": "string", "pattern": "^[a-z]*$"}},
+    "additionalProperties": False,
+    "definitions": {},
+}
+CHILD_SCHEMA = {
+    "type": "object", "properties": {"ratio": {"type": "number"}},
+    "allOf": [{"required": ["ratio"]}],
+}
+
+
+@pytest.mark.parametrize("instance", [
+    {"name": "test"},
+    {"name": ""},
+    {"name": "too long"},
+    {"name": 1},
+    {},
+    [],
+    {"name": "a", "tags": ["a", "b"]},
+    {"name": "a", "tags": ["a", 1]},
+    {"name": "a", "tags": ["a", "b", "c"]},
+    {"name": "a", "kind": "b"},
+    {"name": "a", "kind": "c"},
+    {"name": "a", "count": None},
+    {"name": "a", "count": 1},
+    {"name": "a", "count": True},
+    {"name": "a", "count": 1.5},
+    {"name": "a", "x-test": "abc"},
+    {"name": "a", "x-test": "ABC"},
+    {"name": "a", "unknown": "abc"},
+    {"name": "a", "child": {"ratio": 1}},
+    {"name": "a", "child": {"ratio": 0.5}},
+    {"name": "a", "child": {"ratio": False}},
+    {"name": "a", "child": {}},
+])
+def test_compile_as_jsonschema(instance):
+    is_valid = SchemaCompiler(lambda ref: CHILD_SCHEMA).compile(SCHEMA)
+    validator = jsonschema.Draft4Validator(dict(
+        SCHEMA, definitions={"Child": CHILD_SCHEMA}
+    ))
+
+    assert is_valid(instance) == validator.is_valid(instance)
+
+
+def test_compile_recursive_ref():
+    schema = {
+        "type": "object",
+        "properties": {"child": {"$ref": "#/definitions/Node"}},
+    }
+    is_valid = SchemaCompiler(lambda ref: schema).compile(schema)
+
+    assert is_valid({"child": {"child": {}}})
+    assert not is_valid({"child": {"child": 1}})
+
+
+def test_compile_unsupported():
+    with pytest.raises(UnsupportedSchema):
+        SchemaCompiler(None).compile({"type": "string", "format": "email"})
+    with pytest.raises(UnsupportedSchema):
+        SchemaCompiler(None).compile({"items": [{"type": "string"}]})
+
+
+class TestCompiledModel():
+    def test_models(self):
+        assert mail_model.compile()({"to": ["to@email.com"]})
+        assert not mail_model.compile()({"to": "to@email.com"})
+        assert not mail_model.compile()({
+            "to": ["to@email.com"], "headers": {"Bcc:": "other@email.com"}
+        })
+        assert not mail_model.compile()({
+            "to": ["to@email.com"], "headers": {"X-A\n": "v"}
+        })
+        assert not mail_model.compile()({
+            "to": ["to@email.com"], "headers": {"X-A": "v\n"}
+        })
+        assert batch_mail_model.compile()({"messages": [{"to": []}]})
+        assert not batch_mail_model.compile()({"messages": [{}]})
+
+    def test_not_compiled(self):
+        model = CompiledModel("Test", {"date": fields.Date(required=True)})
+
+        assert model.compile() is None
+        model.validate({"date": "2020-01-01"})
+        with pytest.raises(BadRequest):
+            model.validate({})
@@ -0,0 +1,297 @@
+import socketserver
+import sqlite3
+import threading
+import time
+import pytest
+
+from mail_sender_daemon.cache import SharedTTLCache
+from mail_sender_daemon.circuit_breaker import (
+    CircuitBreaker, SharedCircuitBreaker
+)
+from mail_sender_daemon.rate_limiter import SharedTokenBucket
+from mail_sender_daemon.state import (
+    MemoryStateBackend, RedisStateBackend, SQLiteStateBackend,
+    StateBackendError, build_state_backend
+)
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    """
+    Commands of the Redis protocol used by RedisStateBackend
+    """
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = []
+            for _ in range(int(line[1:])):
+                size = int(self.rfile.readline()[1:])
+                command.append(self.rfile.read(size + 2)[:-2].decode())
+            self.wfile.write(self.server.execute(*command))
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password=None):
+        super().__init__(("127.0.0.1", 0), FakeRedisHandler)
+        self.password = password
+        self.commands = []
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def execute(self, name, *args):
+        self.commands.append(name)
+        with self._lock:
+            now = time.monotonic()
+            self._data = {
+                k: v for k, v in self._data.items() if v[1] > now
+            }
+            if name == "AUTH":
+                if args[0] != self.password:
+                    return b"-WRONGPASS invalid password\r\n"
+                return b"+OK\r\n"
+            elif name == "SELECT":
+                return b"+OK\r\n"
+            elif name == "GET":
+                if args[0] not in self._data:
+                    return b"$-1\r\n"
+                value = self._data[args[0]][0].encode()
+                return b"$%d\r\n%s\r\n" % (len(value), value)
+            elif name == "SET":
+                self._data[args[0]] = (args[1], now + int(args[3]) / 1000)
+                return b"+OK\r\n"
+            elif name == "DEL":
+                deleted = [self._data.pop(k, None) for k in args]
+                return b":%d\r\n" % len([d for d in deleted if d])
+            elif name == "INCRBY":
+                value, expires = self._data.get(args[0], ("0", now + 3600))
+                value = int(value) + int(args[1])
+                self._data[args[0]] = (str(value), expires)
+                return b":%d\r\n" % value
+            elif name == "PEXPIRE":
+                value, _ = self._data[args[0]]
+                self._data[args[0]] = (value, now + int(args[1]) / 1000)
+                return b":1\r\n"
+        return b"-ERR unknown command\r\n"
+
+
+@pytest.fixture()
+def redis_server():
+    server = FakeRedisServer(password="secret")
+    thread = threading.Thread(
+        target=server.serve_forever, args=(0.01, ), daemon=True
+    )
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmpdir):
+    if request.param == "memory":
+        backend = MemoryStateBackend()
+    elif request.param == "sqlite":
+        backend = SQLiteStateBackend(str(tmpdir.join("state.sqlite")))
+    else:
+        server = request.getfixturevalue("redis_server")
+        backend = RedisStateBackend(
+            "redis://:secret@127.0.0.1:{}/1".format(server.server_address[1])
+        )
+    yield backend
+    backend.close()
+
+
+class TestStateBackends():
+    def test_get_set(self, backend):
+        backend.set("key", "value", 60)
+
+        assert backend.get("key") == "value"
+        assert backend.get("unknown") is None
+
+    def test_expiration(self, backend):
+        backend.set("key", "value", 0.01)
+        time.sleep(0.02)
+
+        assert backend.get("key") is None
+
+    def test_delete(self, backend):
+        backend.set("a", "value", 60)
+        backend.set("b", "value", 60)
+        backend.delete("a", "b", "unknown")
+
+        assert backend.get("a") is None
+        assert backend.get("b") is None
+
+    def test_incr(self, backend):
+        assert backend.incr("counter", 2, 60) == 2
+        assert backend.incr("counter", -1, 60) == 1
+        assert backend.get("counter") == "1"
+
+    def test_concurrent_incr(self, backend):
+        def incr():
+            for _ in range(50):
+                backend.incr("counter", 1, 60)
+
+        threads = [threading.Thread(target=incr) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert backend.get("counter") == "200"
+
+    def test_build(self, tmpdir):
+        assert isinstance(build_state_backend(), MemoryStateBackend)
+        assert isinstance(build_state_backend(
+            "sqlite", path=str(tmpdir.join("state.sqlite"))
+        ), SQLiteStateBackend)
+        with pytest.raises(ValueError):
+            build_state_backend("unknown")
+
+
+class TestSQLiteStateBackend():
+    def test_shared_between_instances(self, tmpdir):
+        path = str(tmpdir.join("state.sqlite"))
+        SQLiteStateBackend(path).set("key", "value", 60)
+
+        assert SQLiteStateBackend(path).get("key") == "value"
+
+    def test_close_every_thread(self, tmpdir):
+        backend = SQLiteStateBackend(str(tmpdir.join("state.sqlite")))
+        connections = []
+        errors = []
+        closed = threading.Event()
+
+        def use():
+            backend.set("key", "value", 60)
+            conn = backend._local.conn
+            connections.append(conn)
+            closed.wait(5)
+            try:
+                conn.execute("SELECT 1")
+            except sqlite3.ProgrammingError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=use) for _ in range(2)]
+        for t in threads:
+            t.start()
+        while len(connections) < 2:
+            time.sleep(0.01)
+        backend.close()
+        closed.set()
+        for t in threads:
+            t.join()
+
+        assert len(errors) == 2
+        # connected again on next use
+        assert backend.get("key") == "value"
+
+
+class TestRedisStateBackend():
+    def test_prefix_and_pool(self, redis_server):
+        backend = RedisStateBackend(
+            "redis://:secret@127.0.0.1:{}".format(
+                redis_server.server_address[1]
+            ), prefix="test:"
+        )
+        backend.set("key", "value", 60)
+
+        assert backend.get("key") == "value"
+        assert "test:key" in redis_server._data
+        # a single authenticated connection is reused
+        assert redis_server.commands.count("AUTH") == 1
+
+    def test_errors(self, redis_server):
+        port = redis_server.server_address[1]
+        with pytest.raises(StateBackendError):
+            RedisStateBackend(
+                "redis://:wrong@127.0.0.1:{}".format(port)
+            ).get("key")
+
+        redis_server.shutdown()
+        redis_server.server_close()
+        with pytest.raises(StateBackendError):
+            RedisStateBackend(
+                "redis://127.0.0.1:{}".format(port), timeout=0.1
+            ).get("key")
+
+
+class TestSharedState():
+    """
+    Processes sharing a backend, simulated by objects sharing it
+    """
+    def wait_window_start(self, duration):
+        # so the reservations of a test are done in the same window
+        time.sleep(duration - time.time() % duration)
+
+    def test_cache(self, backend):
+        caches = [SharedTTLCache(backend, "validation:") for _ in range(2)]
+        caches[0].set("test@email.com", "Success", 60)
+
+        assert caches[1].get("test@email.com") == "Success"
+        caches[1].invalidate("test@email.com")
+        assert caches[0].get("test@email.com") is None
+        assert caches[0].stats()["misses"] == 1
+
+    def test_cache_unreachable(self):
+        backend = RedisStateBackend("redis://127.0.0.1:1", timeout=0.1)
+        cache = SharedTTLCache(backend, "validation:")
+        cache.set("test@email.com", "Success", 60)
+
+        assert cache.get("test@email.com") is None
+
+    def test_circuit_breaker(self, backend):
+        breakers = [
+            SharedCircuitBreaker(
+                backend, "circuit:test", sync_interval=0, failure_threshold=1
+            ) for _ in range(2)
+        ]
+        breakers[0].record_failure()
+
+        assert not breakers[1].allow_request()
+        assert breakers[1].stats()["retry_in"] == pytest.approx(30, abs=1)
+
+        breakers[0].record_success()
+        assert breakers[1].allow_request()
+        assert breakers[1].state == CircuitBreaker.CLOSED
+
+    def test_rate_limit(self, backend):
+        buckets = [
+            SharedTokenBucket(10, 2, backend=backend, key="rate:test")
+            for _ in range(2)
+        ]
+        self.wait_window_start(0.2)
+
+        assert buckets[0].reserve() == 0
+        assert buckets[1].reserve() == 0
+        assert buckets[0].reserve() is None
+        assert buckets[1].stats()["tokens"] == 0
+
+        buckets[1].refund()
+        assert buckets[0].reserve() == 0
+
+    def test_rate_limit_refund_next_window(self, backend):
+        bucket = SharedTokenBucket(10, 1, backend=backend, key="rate:test")
+        self.wait_window_start(0.1)
+        assert bucket.reserve() == 0
+        assert bucket.reserve(max_wait=1) > 0
+
+        # given back to the next window, not to the current one
+        bucket.refund()
+        assert bucket.reserve() is None
+        assert bucket.reserve(max_wait=1) > 0
+
+    def test_rate_limit_wait(self, backend):
+        bucket = SharedTokenBucket(10, 1, backend=backend, key="rate:test")
+        self.wait_window_start(0.1)
+        bucket.reserve(max_wait=1)
+
+        # next window, of 0.1 second
+        assert 0 < bucket.reserve(max_wait=1) <= 0.1
+        assert bucket.stats()["waits"] == 1
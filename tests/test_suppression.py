@@ -0,0 +1,92 @@
+import pytest
+
+from mail_sender_daemon.suppression import BloomFilter, SuppressionList
+
+
+class TestBloomFilter():
+    def test_no_false_negative(self):
+        bloom_filter = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom_filter.add("added{}@email.com".format(i))
+
+        assert bloom_filter.count == 1000
+        assert all(
+            "added{}@email.com".format(i) in bloom_filter
+            for i in range(1000)
+        )
+
+    def test_false_positive_rate(self):
+        bloom_filter = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom_filter.add("added{}@email.com".format(i))
+
+        false_positives = sum(
+            "other{}@email.com".format(i) in bloom_filter
+            for i in range(10000)
+        )
+        assert false_positives < 10000 * 0.01 * 2
+
+
+@pytest.fixture()
+def suppression_list(tmpdir):
+    return SuppressionList(
+        str(tmpdir.join("suppressions.sqlite")), capacity=10,
+        sync_interval=60
+    )
+
+
+class TestSuppressionList():
+    def test_add_and_check(self, suppression_list):
+        assert suppression_list.add(
+            ["bounced@email.com", ("spam@email.com", "complaint")],
+            reason="bounce"
+        ) == 2
+
+        assert suppression_list.check(
+            "to@email.com", " Bounced@Email.com", "spam@email.com"
+        ) == {" Bounced@Email.com", "spam@email.com"}
+        assert suppression_list.check() == set()
+        assert suppression_list.get("spam@email.com")["reason"] == (
+            "complaint"
+        )
+        assert suppression_list.get("to@email.com") is None
+
+    def test_update_reason(self, suppression_list):
+        suppression_list.add(["bounced@email.com"], reason="bounce")
+        suppression_list.add(["bounced@email.com"], reason="complaint")
+
+        assert [s["reason"] for s in suppression_list] == ["complaint"]
+
+    def test_remove(self, suppression_list):
+        suppression_list.add(["bounced@email.com"])
+        suppression_list.check("bounced@email.com")
+
+        assert suppression_list.remove("BOUNCED@email.com", "a@email.com") == 1
+        assert suppression_list.remove() == 0
+        # still in the filter, but not in the database
+        assert suppression_list.check("bounced@email.com") == set()
+
+    def test_sync_between_instances(self, suppression_list):
+        other = SuppressionList(suppression_list.path, sync_interval=0)
+        assert other.check("bounced@email.com") == set()
+
+        suppression_list.add(["bounced@email.com"])
+
+        assert other.check("bounced@email.com") == {"bounced@email.com"}
+
+    def test_grow(self, suppression_list):
+        addresses = ["dest{}@email.com".format(i) for i in range(25)]
+        suppression_list.add(addresses)
+
+        assert suppression_list.check(*addresses) == set(addresses)
+        assert suppression_list._bloom_filter.capacity >= 25
+
+    def test_iter(self, suppression_list):
+        addresses = [
+            "dest{}@email.com".format(i)
+            for i in range(SuppressionList.CHUNK_SIZE + 1)
+        ]
+        suppression_list.add(addresses)
+
+        assert [s["address"] for s in suppression_list] == addresses
+        assert suppression_list.check(*addresses) == set(addresses)
@@ -0,0 +1,97 @@
+import pytest
+
+from mail_sender_daemon.exceptions import (
+    InvalidTemplateError, TemplateNotFoundError
+)
+from mail_sender_daemon.templates import TemplateRenderer, TemplateStore
+
+
+@pytest.fixture()
+def store(tmpdir):
+    return TemplateStore(str(tmpdir.join("templates.sqlite")))
+
+
+class TestTemplateStore():
+    def test_put_and_get(self, store):
+        revision, created = store.put(
+            "welcome", subject="Hello {{ name }}", text="Text",
+            provider_templates={"mailgun": "welcome"}
+        )
+
+        assert created
+        template = store.get("welcome")
+        assert template["revision"] == revision
+        assert template["subject"] == "Hello {{ name }}"
+        assert template["html"] is None
+        assert template["provider_templates"] == {"mailgun": "welcome"}
+        assert store.get_revision("welcome") == revision
+        assert store.get("unknown") is None
+
+    def test_revisions(self, store):
+        first, _ = store.put("welcome", text="first")
+        second, created = store.put("welcome", text="second")
+
+        assert not created
+        assert second > first
+        assert store.delete("welcome")
+        assert not store.delete("welcome")
+        # never reused, so compiled templates cannot be mixed up
+        assert store.put("welcome", text="third")[0] > second
+
+    def test_list(self, store):
+        store.put("b", text="b")
+        store.put("a", text="a")
+
+        assert [t["id"] for t in store.list()] == ["a", "b"]
+
+
+class TestTemplateRenderer():
+    @pytest.fixture()
+    def renderer(self, store):
+        return TemplateRenderer(store)
+
+    def test_render(self, renderer):
+        renderer.store.put(
+            "welcome", subject="Hello {{ name }}",
+            text="Hello {{ name }}\n", html="<p>{{ name }}</p>",
+            provider_templates={"mailgun": "welcome"}
+        )
+
+        rendered, provider_templates = renderer.render(
+            "welcome", {"name": "<Test>"}
+        )
+
+        assert rendered == {
+            "subject": "Hello <Test>", "text": "Hello <Test>\n",
+            "html": "<p>&lt;Test&gt;</p>",
+        }
+        assert provider_templates == {"mailgun": "welcome"}
+
+    def test_compiled_once(self, mocker, renderer):
+        renderer.store.put("welcome", text="{{ name }}")
+        get = mocker.spy(renderer.store, "get")
+
+        for name in ("a", "b"):
+            assert renderer.render("welcome", {"name": name})[0] == {
+                "text": name
+            }
+        assert get.call_count == 1
+
+        renderer.store.put("welcome", text="Hello {{ name }}")
+        assert renderer.render("welcome", {"name": "a"})[0] == {
+            "text": "Hello a"
+        }
+
+    def test_errors(self, renderer):
+        with pytest.raises(TemplateNotFoundError):
+            renderer.render("unknown")
+        with pytest.raises(InvalidTemplateError):
+            renderer.compile({"id": "invalid", "text": "{% if %}"})
+
+        renderer.store.put("missing", text="{{ name }}")
+        with pytest.raises(InvalidTemplateError):
+            renderer.render("missing", {})
+
+        renderer.store.put("unsafe", text="{{ ''.__class__.__mro__ }}")
+        with pytest.raises(InvalidTemplateError):
+            renderer.render("unsafe", {})